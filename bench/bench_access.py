@@ -0,0 +1,60 @@
+import os
+import time
+import logging
+import argparse
+import tempfile
+
+import numpy as np
+
+from synthetic import write_year_cube
+
+from access import CubeStore
+
+def timed_passes(view, passes, chunk_days):
+    timings = []
+
+    for _ in range(passes):
+        start = time.perf_counter()
+        total = np.zeros(view.shape[1:])
+
+        for day in range(0, len(view), chunk_days):
+            total += np.nansum(view[day:day + chunk_days], axis=0)
+
+        timings.append(time.perf_counter() - start)
+
+    return timings, total
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare repeated passes over a yearly cube with and without the .npy mirror")
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--scale', type=float, default=1.0, help="fraction of the MSM-S grid along each axis")
+    parser.add_argument('--passes', type=int, default=3)
+    parser.add_argument('--chunk-days', type=int, default=31)
+    parser.add_argument('--profile', default='map', help="storage profile of the synthetic cube")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        input_file = write_year_cube(os.path.join(workdir, '2015.nc'), args.days, args.scale, profile=args.profile)
+
+        netcdf_store = CubeStore(cache_dir=None)
+        netcdf_times, netcdf_total = timed_passes(netcdf_store.view(input_file, 'r1d'), args.passes, args.chunk_days)
+        netcdf_store.close()
+
+        mirror_store = CubeStore(cache_dir=os.path.join(workdir, 'cube_cache'))
+
+        start = time.perf_counter()
+        mirror_store.mirror(input_file, 'r1d')
+        mirror_build = time.perf_counter() - start
+
+        mirror_times, mirror_total = timed_passes(mirror_store.view(input_file, 'r1d'), args.passes, args.chunk_days)
+        mirror_store.close()
+
+    print(f"{args.days} days, profile {args.profile}, {args.passes} passes")
+    print(f"netcdf reads per pass: {', '.join(f'{t:.2f}s' for t in netcdf_times)}")
+    print(f"mirror build: {mirror_build:.2f}s, memmap reads per pass: {', '.join(f'{t:.2f}s' for t in mirror_times)}")
+    print(f"identical totals: {np.array_equal(netcdf_total, mirror_total)}")
+
+if __name__ == "__main__":
+    main()
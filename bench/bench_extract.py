@@ -0,0 +1,84 @@
+import os
+import json
+import time
+import logging
+import argparse
+import tempfile
+
+import numpy as np
+import netCDF4 as nc
+
+from synthetic import msm_grid, write_year_cube
+
+from extract import SeriesExtractor
+
+def full_cube_nearest(input_files, lats, lons):
+    series = []
+
+    for input_file in input_files:
+        with nc.Dataset(input_file) as ds:
+            lat = ds.variables['lat'][:]
+            lon = ds.variables['lon'][:]
+            rows = np.abs(lat[None, :] - lats[:, None]).argmin(axis=1)
+            cols = np.abs(lon[None, :] - lons[:, None]).argmin(axis=1)
+
+            series.append(np.ma.filled(ds.variables['r1d'][:].astype(np.float32), np.nan)[:, rows, cols])
+
+    return np.concatenate(series, axis=0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure point series extraction throughput on a synthetic multi-year archive")
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--scale', type=float, default=1.0, help="fraction of the MSM-S grid along each axis")
+    parser.add_argument('--points', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--profile', default='map', help="storage profile of the synthetic archive")
+    parser.add_argument('--json', default=None, help="write results to this path")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    lat, lon = msm_grid(args.scale)
+    rng = np.random.default_rng(0)
+    results = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        input_files = [write_year_cube(os.path.join(workdir, f'{2015 + offset}.nc'), args.days, args.scale,
+                                       seed=offset, profile=args.profile)
+                       for offset in range(args.years)]
+        extractor = SeriesExtractor(input_files)
+
+        for count in args.points:
+            lats = rng.uniform(lat.min(), lat.max(), count)
+            lons = rng.uniform(lon.min(), lon.max(), count)
+
+            for method in ('nearest', 'bilinear'):
+                start = time.perf_counter()
+                dates, values = extractor.points(lats, lons, method)
+                elapsed = time.perf_counter() - start
+
+                results.append({'points': count, 'method': method, 'seconds': elapsed,
+                                'points_per_s': count / elapsed, 'days': len(dates)})
+
+                if method == 'nearest' and count == args.points[0]:
+                    reference = full_cube_nearest(input_files, lats, lons)
+                    assert np.array_equal(values, reference, equal_nan=True), "nearest series differ from full-cube reads"
+
+        start = time.perf_counter()
+        full_cube_nearest(input_files, lats, lons)
+        full_cube = time.perf_counter() - start
+
+    print(f"archive: {args.years} years x {args.days} days, grid {len(lat)}x{len(lon)}, profile {args.profile}")
+    print(f"{'points':>8} {'method':>9} {'seconds':>9} {'points/s':>10}")
+
+    for result in results:
+        print(f"{result['points']:>8} {result['method']:>9} {result['seconds']:>9.2f} {result['points_per_s']:>10.0f}")
+
+    print(f"full-cube read of {args.points[-1]} points: {full_cube:.2f}s")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'results': results, 'full_cube_seconds': full_cube}, file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import importlib.util
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from synthetic import LIB_DIR, msm_grid, write_daily_archive
+
+from access import default_store
+from GPvMSM import GPvMSM_Downloder, DataProcessor, getYearSum, DataDownscaler
+from config import DOWNSCALING_METHOD
+
+STAGES = ('download', 'process', 'sum', 'downscale', 'render')
+SHAPEFILE_PATH = os.path.join(LIB_DIR, '..', 'shp', 'World_Countries_Generalized.shp')
+
+def load_visualizer():
+    # The visualizer is a script with dots in its file name, so it is loaded by path. It is
+    # registered under a plain module name so its render workers can be pickled.
+
+    spec = importlib.util.spec_from_file_location('GPvMSM_vsl', os.path.join(LIB_DIR, 'GPvMSM_vsl_v.0.0.1.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+vsl = load_visualizer()
+
+class ArchiveHandler(SimpleHTTPRequestHandler):
+    latency = 0.0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+@contextmanager
+def serve_archive(root, latency=0.0):
+    handler = type('Handler', (ArchiveHandler,), {'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(handler, directory=root))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/"
+
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def git_revision():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=LIB_DIR, capture_output=True, text=True)
+
+    except OSError:
+        return None
+
+    return result.stdout.strip() if result.returncode == 0 else None
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def run_pipeline(run_dir, base_url, year, days, workers):
+    download_folder = os.path.join(run_dir, 'GPvMSM', str(year))
+    input_file = os.path.join(run_dir, 'GPvMSM_year', f'{year}.nc')
+    output_file = os.path.join(run_dir, 'GPvMSM_DownScaled', f'{year}_{DOWNSCALING_METHOD}.nc')
+    timings = {}
+
+    start = time.perf_counter()
+    downloader = GPvMSM_Downloder(datetime(year, 1, 1), datetime(year, 1, 1) + timedelta(days=days - 1), download_folder,
+                                  base_url=base_url, workers=workers)
+    downloader.download_files()
+    timings['download'] = time.perf_counter() - start
+
+    if downloader.files_downloaded != days:
+        raise RuntimeError(f"downloaded {downloader.files_downloaded} of {days} files from {base_url}")
+
+    start = time.perf_counter()
+    DataProcessor(year, download_folder, input_file, workers=workers).process_year()
+    timings['process'] = time.perf_counter() - start
+
+    aggregator = getYearSum(input_file, year=year)
+
+    start = time.perf_counter()
+    annual_data = aggregator.aggregate_annual_data()
+    timings['sum'] = time.perf_counter() - start
+
+    aggregator.save_to_new_file(annual_data)
+    aggregator.close()
+
+    start = time.perf_counter()
+    DataDownscaler(aggregator.output_file, output_file).downscale_data()
+    timings['downscale'] = time.perf_counter() - start
+
+    if not os.path.isfile(output_file):
+        raise RuntimeError(f"downscaling did not write {output_file}")
+
+    processor = vsl.NCDataProcessor(
+        DIRECTORY_PATH=os.path.dirname(output_file), SHAPEFILE_PATH=SHAPEFILE_PATH, OUTPUT_PATH=os.path.join(run_dir, 'plot'),
+        LON_RANGE=(120, 150), LAT_RANGE=(22.40, 47.60), RESOLUTION=(1190, 1000, 800), TRANSPARENCY=0.7,
+        MAX_VALUE=5000, color_map='coolwarm', FRAME_DURATION=125, WORKERS=workers)
+
+    start = time.perf_counter()
+    processor.render_files(year, year)
+    timings['render'] = time.perf_counter() - start
+
+    default_store().close()
+
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every pipeline stage on a synthetic MSM-S archive served over local HTTP")
+    parser.add_argument('--year', type=int, default=2015)
+    parser.add_argument('--days', type=int, default=31, help="daily r1h files generated from January 1")
+    parser.add_argument('--scales', type=float, nargs='+', default=[0.25, 0.5], help="fractions of the MSM-S grid along each axis")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4], help="download, process and render workers")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per configuration, the fastest time per stage is kept")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds the local server waits before each response")
+    parser.add_argument('--json', default=None, help="write results to this path")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    results = []
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Relative paths in config (the regrid cache under DATA_DIR) land in the run directory.
+
+        os.chdir(workdir)
+
+        try:
+            with serve_archive(workdir, args.latency) as server_url:
+                for scale in args.scales:
+                    lat, lon = msm_grid(scale)
+                    archive = os.path.join(workdir, f'archive_{scale:g}')
+                    write_daily_archive(archive, args.year, args.days, scale)
+
+                    for workers in args.workers:
+                        best = {}
+
+                        for run in range(args.repeat):
+                            run_dir = os.path.join(workdir, f'run_{scale:g}_{workers}_{run}')
+                            os.makedirs(run_dir)
+                            os.chdir(run_dir)
+
+                            timings = run_pipeline(run_dir, f"{server_url}archive_{scale:g}/", args.year, args.days, workers)
+                            best = {stage: min(seconds, best.get(stage, seconds)) for stage, seconds in timings.items()}
+
+                        results.append({'scale': scale, 'grid': [len(lat), len(lon)], 'days': args.days, 'workers': workers,
+                                        'archive_bytes': directory_size(archive), 'seconds': best,
+                                        'total_seconds': sum(best.values())})
+
+        finally:
+            os.chdir(cwd)
+
+    print(f"{args.days} days of {args.year}, {args.repeat} runs per configuration, fastest run per stage")
+    print(f"{'grid':>9} {'workers':>7} " + ' '.join(f'{stage:>9}' for stage in STAGES) + f" {'total':>9}")
+
+    for result in results:
+        grid = 'x'.join(str(size) for size in result['grid'])
+        print(f"{grid:>9} {result['workers']:>7} " + ' '.join(f"{result['seconds'][stage]:>9.2f}" for stage in STAGES)
+              + f" {result['total_seconds']:>9.2f}")
+
+    if args.json:
+        report = {
+            'revision': git_revision(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'parameters': vars(args),
+            'results': results,
+        }
+
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import netCDF4 as nc
+
+from synthetic import msm_grid, write_year_cube
+
+from storage import STORAGE_PROFILES
+
+def time_reads(path, samples, seed):
+    rng = np.random.default_rng(seed)
+
+    with nc.Dataset(path) as ds:
+        rain = ds.variables['r1d']
+        days, lat_len, lon_len = rain.shape
+
+        start = time.perf_counter()
+        for day in rng.integers(0, days, samples):
+            rain[day, :, :]
+        map_latency = (time.perf_counter() - start) / samples
+
+        start = time.perf_counter()
+        for lat_idx, lon_idx in zip(rng.integers(0, lat_len, samples), rng.integers(0, lon_len, samples)):
+            rain[:, lat_idx, lon_idx]
+        series_latency = (time.perf_counter() - start) / samples
+
+    return map_latency, series_latency
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare NetCDF storage profiles for the yearly r1d cube")
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--scale', type=float, default=1.0, help="fraction of the MSM-S grid along each axis")
+    parser.add_argument('--samples', type=int, default=20, help="random maps and point series read per profile")
+    parser.add_argument('--profiles', default=','.join(STORAGE_PROFILES))
+    parser.add_argument('--json', default=None, help="write results to this path")
+    args = parser.parse_args()
+
+    lat, lon = msm_grid(args.scale)
+    results = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for profile in args.profiles.split(','):
+            path = os.path.join(workdir, f'{profile}.nc')
+
+            start = time.perf_counter()
+            write_year_cube(path, args.days, args.scale, seed=0, profile=profile)
+            write_time = time.perf_counter() - start
+
+            map_latency, series_latency = time_reads(path, args.samples, seed=1)
+
+            results.append({
+                'profile': profile,
+                'size_mb': os.path.getsize(path) / (1024 * 1024),
+                'write_s': write_time,
+                'map_read_ms': map_latency * 1000,
+                'series_read_ms': series_latency * 1000,
+            })
+
+    print(f"grid {len(lat)}x{len(lon)}, {args.days} days")
+    print(f"{'profile':>8} {'size MiB':>10} {'write s':>9} {'map ms':>9} {'series ms':>10}")
+
+    for result in results:
+        print(f"{result['profile']:>8} {result['size_mb']:>10.1f} {result['write_s']:>9.2f} "
+              f"{result['map_read_ms']:>9.2f} {result['series_read_ms']:>10.2f}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == "__main__":
+    main()
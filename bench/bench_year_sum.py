@@ -0,0 +1,59 @@
+import os
+import time
+import logging
+import argparse
+import tempfile
+
+import numpy as np
+
+from synthetic import write_year_cube
+
+from GPvMSM import getYearSum
+
+def legacy_triple_loop(aggregator, days):
+    total_sum = np.zeros((len(aggregator.lat), len(aggregator.lon)))
+    r1d = aggregator.r1d[:days]
+
+    for time_idx in range(days):
+        for lat_idx in range(len(aggregator.lat)):
+            for lon_idx in range(len(aggregator.lon)):
+                total_sum[lat_idx, lon_idx] += r1d[time_idx, lat_idx, lon_idx]
+
+    return total_sum
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare getYearSum.aggregate_annual_data with the legacy triple loop")
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--scale', type=float, default=1.0, help="fraction of the MSM-S grid along each axis")
+    parser.add_argument('--legacy-days', type=int, default=3, help="days run through the legacy loop (extrapolated to --days)")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        input_file = write_year_cube(os.path.join(workdir, '2015.nc'), args.days, args.scale)
+        aggregator = getYearSum(input_file)
+
+        start = time.perf_counter()
+        aggregator.aggregate_annual_data()
+        vectorized = time.perf_counter() - start
+
+        legacy_days = min(args.legacy_days, args.days)
+        start = time.perf_counter()
+        legacy_sum = legacy_triple_loop(aggregator, legacy_days)
+        legacy = (time.perf_counter() - start) * args.days / legacy_days
+
+        partial = getYearSum(input_file)
+        partial.time = partial.time[:legacy_days]
+        identical = np.array_equal(partial.aggregate_annual_data()['yearly_sum'], legacy_sum)
+
+        aggregator.close()
+        partial.close()
+
+    print(f"grid {len(aggregator.lat)}x{len(aggregator.lon)}, {args.days} days")
+    print(f"vectorized (sum, max, mean, wet days): {vectorized:.3f}s")
+    print(f"legacy triple loop (sum only, extrapolated from {legacy_days} days): {legacy:.1f}s")
+    print(f"speedup: {legacy / vectorized:.0f}x, identical sums: {identical}")
+
+if __name__ == "__main__":
+    main()
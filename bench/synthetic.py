@@ -0,0 +1,102 @@
+import os
+import sys
+
+import numpy as np
+from datetime import datetime, timedelta
+import netCDF4 as nc
+
+LIB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib')
+
+if LIB_DIR not in sys.path:
+    sys.path.insert(0, LIB_DIR)
+
+from storage import create_data_variable, storage_values, time_dimension_size
+
+# MSM-S surface grid: 505 x 481 points, 0.05° x 0.0625°
+MSM_LAT = 47.6 - 0.05 * np.arange(505)
+MSM_LON = 120.0 + 0.0625 * np.arange(481)
+
+# r1h in the archive files is a packed short
+R1H_SCALE_FACTOR = 0.006116208155
+R1H_ADD_OFFSET = 200.0
+
+def msm_grid(scale=1.0):
+    lat_len = max(2, int(round(len(MSM_LAT) * scale)))
+    lon_len = max(2, int(round(len(MSM_LON) * scale)))
+
+    return MSM_LAT[:lat_len].astype(np.float32), MSM_LON[:lon_len].astype(np.float32)
+
+def synthetic_rain(rng, shape):
+    wet = rng.random(shape) < 0.2
+    
+    return np.where(wet, rng.gamma(0.8, 4.0, shape), 0.0).astype(np.float32)
+
+def write_year_cube(path, days=365, scale=1.0, seed=0, profile='legacy'):
+    lat, lon = msm_grid(scale)
+    rng = np.random.default_rng(seed)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with nc.Dataset(path, 'w', format='NETCDF4') as ds:
+        ds.createDimension('time', time_dimension_size(profile, days))
+        ds.createDimension('lat', len(lat))
+        ds.createDimension('lon', len(lon))
+
+        time = ds.createVariable('time', np.int32, ('time',))
+        time[:] = np.arange(1, days + 1)
+        time.units = 'day of year'
+        ds.createVariable('lat', np.float32, ('lat',))[:] = lat
+        ds.createVariable('lon', np.float32, ('lon',))[:] = lon
+
+        rain = create_data_variable(ds, 'r1d', np.float32, ('time', 'lat', 'lon',), profile, pack_scale=0.1)
+        rain.units = 'mm/day'
+
+        for day in range(days):
+            rain[day, :, :] = storage_values(rain, synthetic_rain(rng, (len(lat), len(lon))) * 24)
+
+    return path
+
+def write_daily_r1h(path, date, scale=1.0, seed=0):
+    lat, lon = msm_grid(scale)
+    rng = np.random.default_rng([seed, date.toordinal()])
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Same layout as the MSM-S r1h archive files: NetCDF3 classic, 24 hours, packed short rain.
+
+    with nc.Dataset(path, 'w', format='NETCDF3_CLASSIC') as ds:
+        ds.createDimension('lon', len(lon))
+        ds.createDimension('lat', len(lat))
+        ds.createDimension('time', 24)
+
+        longitudes = ds.createVariable('lon', np.float32, ('lon',))
+        latitudes = ds.createVariable('lat', np.float32, ('lat',))
+        time = ds.createVariable('time', np.float32, ('time',))
+        rain = ds.createVariable('r1h', np.int16, ('time', 'lat', 'lon',))
+
+        longitudes.units = 'degrees_east'
+        latitudes.units = 'degrees_north'
+        time.units = f"hours since {date.strftime('%Y-%m-%d')} 00:00:00+00:00"
+
+        rain.scale_factor = R1H_SCALE_FACTOR
+        rain.add_offset = R1H_ADD_OFFSET
+        rain.long_name = 'rainfall in 1 hour'
+        rain.units = 'mm/h'
+
+        longitudes[:] = lon
+        latitudes[:] = lat
+        time[:] = np.arange(24)
+        rain[:, :, :] = np.minimum(synthetic_rain(rng, (24, len(lat), len(lon))), 2 * R1H_ADD_OFFSET - 1)
+
+        ds.Conventions = 'CF-1.0'
+
+    return path
+
+def write_daily_archive(root, year, days=365, scale=1.0, seed=0):
+    paths = []
+
+    for day in range(days):
+        date = datetime(year, 1, 1) + timedelta(days=day)
+        paths.append(write_daily_r1h(os.path.join(root, str(year), f"{date.strftime('%m%d')}.nc"), date, scale, seed))
+
+    return paths
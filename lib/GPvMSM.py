@@ -1,40 +1,174 @@
 import os
-import requests
+import json
+import time
+import hashlib
+import threading
 import numpy as np
 import netCDF4 as nc
-import winsound as ws
 import logging
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from scipy.interpolate import griddata
-
-from config import (BASE_URL, START_DATE, END_DATE, DOWNLOAD_FOLDER, 
-                    INPUT_FILE, OUTPUT_FILE, PROCESS_YEAR, DOWNSCALING_METHOD, COLLECTION_VALUE,
-                    LAT_GRID_SIZE, LON_GRID_SIZE, INPUT_FILE_SUM)
+from urllib.parse import urlparse
+
+from config import (BASE_URL, PROCESS_YEAR, DOWNSCALING_METHOD, COLLECTION_VALUE,
+                    LAT_GRID_SIZE, LON_GRID_SIZE, get_year_paths, get_settings,
+                    DOWNLOAD_WORKERS, DOWNLOAD_PER_HOST_LIMIT, DOWNLOAD_QUEUE_SIZE,
+                    DOWNLOAD_CHUNK_SIZE, DOWNLOAD_RETRIES, DOWNLOAD_BACKOFF, DOWNLOAD_CHECKSUM,
+                    PROCESS_STREAMING, PROCESS_WORKERS, SUM_CHUNK_DAYS, WET_DAY_THRESHOLD,
+                    REGRID_CACHE_DIR, REGRID_CACHE_MAX_BYTES,
+                    DOWNSCALING_TILE_SIZE, DOWNSCALING_TILE_STEPS, DOWNSCALING_WORKERS,
+                    BUILD_FINGERPRINT, STORAGE_PROFILE)
+from access import CubeStore, default_store
+from extremes import ExtremesBuilder
+from manifest import BuildManifest
+from metrics import metrics
+from ncheader import HeaderError, classic_data_size
+from regrid import GridMapping, MappingCache, downscale_methods
+from rollup import RollupBuilder
+from storage import create_data_variable, reserve_band_cache, storage_values, time_dimension_size
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+MANIFEST_FILENAME = '.manifest.json'
+DAILY_PACK_SCALE = 0.1
+ANNUAL_PACK_SCALE = 1.0
+DOWNSCALED_PACK_SCALES = {'r1d': DAILY_PACK_SCALE}
+DOWNSCALED_DESCRIPTIONS = {'r1d': "Downscaled GPVMSM daily precipitation data"}
+NETCDF_SIGNATURES = (b'CDF\x01', b'CDF\x02', b'CDF\x05', b'\x89HDF\r\n\x1a\n')
+HOURS_PER_DAY = 24
+MAX_BACKOFF_SECONDS = 60.0
+
+class DownloadIntegrityError(Exception):
+    pass
+
+SUM_STATISTICS = (
+    ('daily_max', 'f4', 'mm/day', 'Maximum daily precipitation'),
+    ('daily_mean', 'f4', 'mm/day', 'Mean daily precipitation'),
+    ('wet_days', 'i4', 'days', 'Number of days at or above the wet day threshold'),
+    ('valid_days', 'i4', 'days', 'Number of days with valid data'),
+)
+
+def retryable_errors():
+    import requests
+
+    return (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+            requests.exceptions.ChunkedEncodingError, requests.exceptions.HTTPError,
+            DownloadIntegrityError)
+
 class GPvMSM_Downloder:
-    def __init__(self, start_date, end_date, folder):
+    def __init__(self, start_date, end_date, folder, base_url=BASE_URL, workers=DOWNLOAD_WORKERS,
+                 per_host_limit=DOWNLOAD_PER_HOST_LIMIT, queue_size=DOWNLOAD_QUEUE_SIZE,
+                 chunk_size=DOWNLOAD_CHUNK_SIZE, backoff=DOWNLOAD_BACKOFF, checksum=DOWNLOAD_CHECKSUM,
+                 retries=DOWNLOAD_RETRIES):
         self.start_date = start_date
         self.end_date = end_date
         self.folder = folder
-        self.base_url = BASE_URL
+        self.base_url = base_url
+
+        self.workers = max(1, int(workers))
+        self.per_host_limit = max(1, int(per_host_limit))
+        self.queue_size = max(self.workers, int(queue_size))
+
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._host_semaphores = {}
+        self._host_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.bytes_downloaded = 0
+        self.files_downloaded = 0
+
+        self.chunk_size = max(1, int(chunk_size))
+        self.backoff = float(backoff)
+        self.retries = max(0, int(retries))
+        self.checksum = checksum if checksum and checksum.lower() != 'none' else None
+        self._manifest_lock = threading.Lock()
+        self.manifest = self._load_manifest()
 
     def download_files(self):
         existing_files = self._get_existing_files()
         dates_to_download = self._get_dates_in_range()
-        missing_files = []
+        missing_dates = [date for date in dates_to_download if not self._is_file_downloaded(date, existing_files)]
 
-        for date in dates_to_download:
-            if not self._is_file_downloaded(date, existing_files):
-                missing_files.append(date.strftime("%Y%m%d"))
-                self._download_file_with_retry(date)
-
-        if missing_files:
-            logging.info(f"Missing files downloaded: {', '.join(missing_files)}")
-        else:
+        if not missing_dates:
             logging.info("No missing files")
+            return
+
+        self.bytes_downloaded = 0
+        self.files_downloaded = 0
+
+        start_time = time.perf_counter()
+        queue_slots = threading.BoundedSemaphore(self.queue_size)
+        futures = []
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for date in missing_dates:
+                queue_slots.acquire()
+                future = executor.submit(self._download_file_with_retry, date)
+                future.add_done_callback(lambda _: queue_slots.release())
+                futures.append(future)
+
+            results = [future.result() for future in futures]
+
+        self._report_throughput(time.perf_counter() - start_time)
+
+        downloaded = [date.strftime('%Y%m%d') for date, ok in zip(missing_dates, results) if ok]
+        failed = [date.strftime('%Y%m%d') for date, ok in zip(missing_dates, results) if not ok]
+
+        if downloaded:
+            logging.info(f"Missing files downloaded: {', '.join(downloaded)}")
+
+        if failed:
+            logging.warning(f"Missing files not downloaded: {', '.join(failed)}")
+
+    @property
+    def session(self):
+        with self._session_lock:
+            if self._session is None:
+                self._session = self._create_session()
+
+        return self._session
+
+    def _create_session(self):
+        # requests is only imported once something actually has to be downloaded.
+
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        # Everything comes from one host, so one pool is cached. The host semaphores enforce the
+        # per-host limit, the pool only has to keep a connection for every worker.
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(self.workers, self.per_host_limit))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        return session
+
+    def _host_semaphore(self, url):
+        host = urlparse(url).netloc
+
+        with self._host_lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+
+            return self._host_semaphores[host]
+
+    def _record_download(self, num_bytes, finished=False):
+        with self._stats_lock:
+            self.bytes_downloaded += num_bytes
+
+            if finished:
+                self.files_downloaded += 1
+
+    def _report_throughput(self, elapsed):
+        megabytes = self.bytes_downloaded / (1024 * 1024)
+        rate = megabytes / elapsed if elapsed > 0 else 0.0
+
+        logging.info(f"Downloaded {self.files_downloaded} files ({megabytes:.1f} MiB) in {elapsed:.1f}s "
+                     f"with {self.workers} workers - {rate:.2f} MiB/s")
 
     def _get_existing_files(self):
         if not os.path.exists(self.folder):
@@ -47,49 +181,205 @@ class GPvMSM_Downloder:
         formatted_date = date.strftime("%m%d")
         filename = f"{date.year}{formatted_date}.nc"
         
-        return filename in existing_files
+        if filename not in existing_files:
+            return False
+
+        local_path = os.path.join(self.folder, filename)
+        entry = self.manifest.get(filename)
+
+        if entry is not None:
+            return entry.get('size') == os.path.getsize(local_path)
+
+        if self._is_valid_netcdf(local_path):
+            self._update_manifest(filename, os.path.getsize(local_path), None)
+            return True
+
+        logging.warning(f"{filename} failed validation and will be downloaded again")
+        return False
             
     def _get_dates_in_range(self):
         delta = self.end_date - self.start_date
 
         return [self.start_date + timedelta(days=i) for i in range(delta.days + 1)]
 
-    def _download_file_with_retry(self, date, attempts=3):
+    def _manifest_path(self):
+        return os.path.join(self.folder, MANIFEST_FILENAME)
+
+    def _load_manifest(self):
+        manifest_path = self._manifest_path()
+
+        if not os.path.isfile(manifest_path):
+            return {}
+
         try:
-            self._download_file_for_date(date)
-        except requests.exceptions.Timeout as e:
-            if attempts > 0:
-                logging.warning(f"Download timed out for {date}. Retrying... Attempts left: {attempts}")
-                self._download_file_with_retry(date, attempts - 1)
-            else:
-                logging.error(f"Failed to download file for {date} after multiple attempts.")
+            with open(manifest_path, 'r') as file:
+                return json.load(file)
+
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable manifest {manifest_path}: {e}")
+            return {}
+
+    def _update_manifest(self, filename, size, checksum):
+        with self._manifest_lock:
+            entry = {'size': size}
+
+            if checksum is not None:
+                entry[self.checksum] = checksum
+
+            self.manifest[filename] = entry
+
+            os.makedirs(self.folder, exist_ok=True)
+            temp_path = f"{self._manifest_path()}.tmp"
+
+            with open(temp_path, 'w') as file:
+                json.dump(self.manifest, file, indent=1, sort_keys=True)
+
+            os.replace(temp_path, self._manifest_path())
+
+    def _download_file_with_retry(self, date, attempts=None):
+        attempts = self.retries if attempts is None else attempts
+
+        for attempt in range(attempts + 1):
+            try:
+                return self._download_file_for_date(date)
+
+            except retryable_errors() as e:
+                if attempt == attempts:
+                    logging.error(f"Failed to download file for {date} after multiple attempts: {e}")
+                    metrics.count('download_failures')
+                    return False
+
+                metrics.count('download_retries')
+
+                delay = min(self.backoff * (2 ** attempt), MAX_BACKOFF_SECONDS)
+                logging.warning(f"Download failed for {date} ({e}). Retrying in {delay:.1f}s... Attempts left: {attempts - attempt}")
+                time.sleep(delay)
 
     def _download_file_for_date(self, date, timeout=60):
         formatted_date = date.strftime("%m%d")
         url = f"{self.base_url}{date.year}/{formatted_date}.nc"
         local_filename = f"{date.year}{formatted_date}.nc"
         local_path = os.path.join(self.folder, local_filename)
+        part_path = f"{local_path}.part"
+        start_wall, start_cpu = time.perf_counter(), time.thread_time()
 
         if not os.path.exists(os.path.dirname(local_path)):
-            os.makedirs(os.path.dirname(local_path))
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
 
-        with requests.get(url, stream=True, timeout=timeout) as r:
+        offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+        headers = {'Accept-Encoding': 'identity'}
+
+        if offset > 0:
+            headers['Range'] = f"bytes={offset}-"
+
+        with self._host_semaphore(url), self.session.get(url, stream=True, timeout=timeout, headers=headers) as r:
             if r.status_code == 404:
                 logging.error(f"Unable to download {local_filename}: 404 Client Error: Not Found for url: {url}")
-                return
+                return False
 
-            logging.info(f"Downloading {local_filename}")
-            with open(local_path, 'wb') as file:
-                for chunk in r.iter_content(chunk_size=1024):
+            if r.status_code == 416:
+                os.remove(part_path)
+                raise DownloadIntegrityError(f"Stale partial file for {local_filename} discarded")
+
+            if r.status_code >= 500:
+                r.raise_for_status()
+
+            if r.status_code >= 400:
+                logging.error(f"Unable to download {local_filename}: {r.status_code} Client Error for url: {url}")
+                return False
+
+            if r.status_code != 206:
+                offset = 0
+
+            expected_size = self._expected_size(r, offset)
+            hasher = hashlib.new(self.checksum) if self.checksum else None
+
+            if hasher is not None and offset > 0:
+                self._hash_file(part_path, hasher)
+
+            logging.info(f"Downloading {local_filename}" + (f" (resuming at {offset} bytes)" if offset else ""))
+            with open(part_path, 'ab' if offset else 'wb') as file:
+                for chunk in r.iter_content(chunk_size=self.chunk_size):
                     if chunk:
                         file.write(chunk)
+                        self._record_download(len(chunk))
+
+                        if hasher is not None:
+                            hasher.update(chunk)
+
+        size = os.path.getsize(part_path)
+
+        if expected_size is not None and size != expected_size:
+            raise DownloadIntegrityError(f"{local_filename} is incomplete: {size} of {expected_size} bytes")
+
+        if not self._is_valid_netcdf(part_path):
+            os.remove(part_path)
+            raise DownloadIntegrityError(f"{local_filename} is not a valid r1h NetCDF file")
+
+        os.replace(part_path, local_path)
+        self._update_manifest(local_filename, size, hasher.hexdigest() if hasher is not None else None)
+        self._record_download(0, finished=True)
+
+        metrics.record_file('download', local_filename, bytes=size - offset, seconds=time.perf_counter() - start_wall,
+                            cpu_seconds=time.thread_time() - start_cpu)
+
+        return True
+
+    def _expected_size(self, response, offset):
+        content_range = response.headers.get('Content-Range')
+
+        if response.status_code == 206 and content_range and '/' in content_range:
+            total = content_range.rsplit('/', 1)[1]
+
+            if total.isdigit():
+                return int(total)
+
+        content_length = response.headers.get('Content-Length')
+
+        if content_length is not None and content_length.isdigit():
+            return offset + int(content_length)
+
+        return None
+
+    def _hash_file(self, path, hasher):
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(self.chunk_size), b''):
+                hasher.update(block)
+
+    @staticmethod
+    def _is_valid_netcdf(path):
+        try:
+            with open(path, 'rb') as file:
+                signature = file.read(8)
+
+            if not signature.startswith(NETCDF_SIGNATURES):
+                return False
+
+            # A cut-off classic file still opens and has the right r1h shape, only its size
+            # against the size the header implies gives the truncation away.
+
+            expected_size = classic_data_size(path)
+
+            if expected_size is not None and os.path.getsize(path) < expected_size:
+                return False
+
+            with nc.Dataset(path, 'r') as data:
+                r1h = data.variables.get('r1h')
+
+                if r1h is None or r1h.ndim != 3:
+                    return False
+
+                return r1h.shape == (HOURS_PER_DAY, len(data.variables['lat']), len(data.variables['lon']))
+
+        except (OSError, KeyError, HeaderError):
+            return False
 
     def _download_file(self, url, local_filename):
         os.makedirs(self.folder, exist_ok=True)
 
         local_path = os.path.join(self.folder, local_filename)
 
-        with requests.get(url, stream=True) as r:
+        with self._host_semaphore(url), self.session.get(url, stream=True) as r:
             if r.status_code == 404:
                 logging.error(f"Unable to download {local_filename}: 404 Client Error: Not Found for url: {url}")
                 return
@@ -101,35 +391,155 @@ class GPvMSM_Downloder:
                     if chunk:
                         file.write(chunk)
 
+def _reduce_daily_file(file_path):
+    if not os.path.isfile(file_path):
+        return None, None
+
+    # Reading covers decompression and unpacking of r1h, reducing is the sum over the 24 hours.
+
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+
+    with nc.Dataset(file_path, 'r') as data:
+        hourly_rain = data.variables['r1h'][:]
+        read_seconds = time.perf_counter() - start_wall
+        daily_rain = np.ma.getdata(np.sum(hourly_rain, axis=0)).astype(np.float32, copy=False)
+
+    seconds = time.perf_counter() - start_wall
+    stats = {'bytes': os.path.getsize(file_path), 'seconds': seconds, 'read_seconds': read_seconds,
+             'reduce_seconds': seconds - read_seconds, 'cpu_seconds': time.process_time() - start_cpu}
+
+    return daily_rain, stats
+
+class AnnualAccumulator:
+    def __init__(self, shape, wet_day_threshold=WET_DAY_THRESHOLD):
+        self.wet_day_threshold = wet_day_threshold
+
+        self.total_sum = np.zeros(shape)
+        self.daily_max = np.full(shape, -np.inf, dtype=np.float32)
+        self.wet_days = np.zeros(shape, dtype=np.int32)
+        self.valid_days = np.zeros(shape, dtype=np.int32)
+
+    def update(self, daily_rain):
+        values = np.ma.getdata(daily_rain)
+        valid = ~np.ma.getmaskarray(daily_rain) & ~np.isnan(values)
+
+        np.add(self.total_sum, np.where(valid, values, 0), out=self.total_sum)
+        np.maximum(self.daily_max, np.where(valid, values, -np.inf), out=self.daily_max)
+
+        self.wet_days += valid & (values >= self.wet_day_threshold)
+        self.valid_days += valid
+
+    def update_chunk(self, chunk):
+        for daily_rain in chunk:
+            self.update(daily_rain)
+
+    def result(self):
+        no_data = self.valid_days == 0
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            daily_mean = self.total_sum / self.valid_days
+
+        return {
+            'yearly_sum': np.where(no_data, np.nan, self.total_sum),
+            'daily_max': np.where(no_data, np.nan, self.daily_max).astype(np.float32),
+            'daily_mean': np.where(no_data, np.nan, daily_mean),
+            'wet_days': self.wet_days.copy(),
+            'valid_days': self.valid_days.copy(),
+        }
+
 class DataProcessor:
-    def __init__(self, year, download_folder, input_file):
+    def __init__(self, year, download_folder, input_file, streaming=PROCESS_STREAMING, workers=PROCESS_WORKERS,
+                 storage_profile=STORAGE_PROFILE, wet_day_threshold=WET_DAY_THRESHOLD, fingerprint=BUILD_FINGERPRINT):
         self.year = year
         self.base_dir = download_folder
         self.output_dir = os.path.dirname(input_file)
-        
+        self.streaming = streaming
+        self.workers = int(workers) if int(workers) > 0 else (os.cpu_count() or 1)
+        self.storage_profile = storage_profile
+        self.wet_day_threshold = wet_day_threshold
+        self.fingerprint = fingerprint
+
         os.makedirs(self.output_dir, exist_ok=True)
 
     def process_year(self):
         output_file_path = os.path.join(self.output_dir, f'{self.year}.nc')
-        
-        if os.path.isfile(output_file_path):
-            logging.info(f"process skipped for {self.year} file already exists ")
-            return
-
         days_in_year = 366 if DataProcessor._is_leap_year(self.year) else 365
-        all_daily_rains = self._initialize_rain_data(days_in_year)
 
-        first_file_path = os.path.join(self.base_dir, f'{self.year}0101.nc')
+        file_paths = self._daily_file_paths(days_in_year)
+        inputs = {os.path.basename(file_path): file_path for file_path in file_paths}
+        params = {'days': days_in_year, 'variable': 'r1h', 'storage_profile': self.storage_profile}
+        manifest = BuildManifest(output_file_path, self.fingerprint)
+
+        if manifest.product_matches() and manifest.params_match(params):
+            changed_inputs = set(manifest.changed_inputs(inputs))
+
+            if not changed_inputs:
+                logging.info(f"process skipped for {self.year} inputs unchanged")
+                return None
+
+            changed_days = [day for day, file_path in enumerate(file_paths) if os.path.basename(file_path) in changed_inputs]
+            self._patch_days(output_file_path, days_in_year, changed_days)
+            manifest.record(inputs, params)
+
+            return None
+
+        if os.path.isfile(output_file_path):
+            logging.info(f"Rebuilding {output_file_path}: no matching build manifest")
+
+        first_file_path = file_paths[0]
         
         with nc.Dataset(first_file_path, 'r') as data:
             lat = data.variables['lat'][:]
             lon = data.variables['lon'][:]
 
-        for day in range(days_in_year):
-            current_date = datetime(self.year, 1, 1) + timedelta(days=day)
-            self._process_day(current_date, all_daily_rains, day)
+        if self.streaming:
+            annual_data = self._process_year_streaming(days_in_year, lat, lon, output_file_path)
+            manifest.record(inputs, params)
+
+            return annual_data
+
+        all_daily_rains = self._initialize_rain_data(days_in_year)
+
+        for day, daily_rain in self._iter_daily_rains(days_in_year):
+            if daily_rain is not None:
+                all_daily_rains[day, :, :] = daily_rain
 
         self._save_data(all_daily_rains, days_in_year, lat, lon)
+        manifest.record(inputs, params)
+
+        return None
+
+    def _patch_days(self, output_file_path, days_in_year, days):
+        logging.info(f"Patching {len(days)} changed days in {output_file_path}")
+
+        with nc.Dataset(output_file_path, 'a') as output_ds:
+            rain = output_ds.variables['r1d']
+
+            for day, daily_rain in self._iter_daily_rains(days_in_year, days):
+                if daily_rain is None:
+                    daily_rain = np.zeros(rain.shape[1:], dtype=np.float32)
+
+                rain[day, :, :] = storage_values(rain, daily_rain)
+
+    def _process_year_streaming(self, days_in_year, lat, lon, output_file_path):
+        temp_file_path = f"{output_file_path}.tmp"
+        accumulator = AnnualAccumulator((len(lat), len(lon)), self.wet_day_threshold)
+
+        with nc.Dataset(temp_file_path, 'w', format='NETCDF4') as output_ds:
+            rain = self._create_output_variables(output_ds, days_in_year, lat, lon)
+
+            for day, daily_rain in self._iter_daily_rains(days_in_year):
+                if daily_rain is None:
+                    daily_rain = np.zeros((len(lat), len(lon)), dtype=np.float32)
+
+                stored_rain = storage_values(rain, daily_rain)
+                rain[day, :, :] = stored_rain
+                accumulator.update(stored_rain)
+
+        os.replace(temp_file_path, output_file_path)
+        logging.info(f"Streamed {days_in_year} days to {output_file_path}")
+
+        return accumulator.result()
 
     @staticmethod
     def _is_leap_year(year):
@@ -143,62 +553,106 @@ class DataProcessor:
             
         return np.zeros((days_in_year, lat_len, lon_len))
 
-    def _process_day(self, current_date, all_daily_rains, day):
-        file_path = os.path.join(self.base_dir, f'{current_date.strftime("%Y%m%d")}.nc')
+    def _daily_file_paths(self, days_in_year):
+        return [os.path.join(self.base_dir, f'{(datetime(self.year, 1, 1) + timedelta(days=day)).strftime("%Y%m%d")}.nc')
+                for day in range(days_in_year)]
+
+    def _iter_daily_rains(self, days_in_year, days=None):
+        os.makedirs(self.base_dir, exist_ok=True)
+
+        all_file_paths = self._daily_file_paths(days_in_year)
+        days = range(days_in_year) if days is None else days
+        file_paths = [(day, all_file_paths[day]) for day in days]
+
+        if self.workers <= 1:
+            for day, file_path in file_paths:
+                logging.info(f"Processing file: {file_path}")
+                yield day, self._record_daily_file(file_path, *_reduce_daily_file(file_path))
+
+            return
+
+        pending = deque()
 
-        if not os.path.exists(os.path.dirname(file_path)):
-            os.makedirs(os.path.dirname(file_path))
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            for day, file_path in file_paths:
+                pending.append((day, file_path, executor.submit(_reduce_daily_file, file_path)))
+
+                if len(pending) >= self.workers * 2:
+                    yield self._collect_daily_rain(pending.popleft())
+
+            while pending:
+                yield self._collect_daily_rain(pending.popleft())
+
+    def _collect_daily_rain(self, task):
+        day, file_path, future = task
+        daily_rain = self._record_daily_file(file_path, *future.result())
 
         logging.info(f"Processing file: {file_path}")
-        
-        if os.path.isfile(file_path):
-            
-            with nc.Dataset(file_path, 'r') as data:
-                daily_rain = np.sum(data.variables['r1h'][:], axis=0)
-                all_daily_rains[day, :, :] = daily_rain
 
-    def _save_data(self, all_daily_rains, days_in_year, lat, lon):
-        output_file = os.path.join(self.output_dir, f'{self.year}.nc')
-        
-        with nc.Dataset(output_file, 'w', format='NETCDF4') as output_ds:
-            output_ds.createDimension('time', None)
-            output_ds.createDimension('lat', len(lat))
-            output_ds.createDimension('lon', len(lon))
+        return day, daily_rain
 
-            time = output_ds.createVariable('time', np.int32, ('time',))
-            latitudes = output_ds.createVariable('lat', np.float32, ('lat',))
-            longitudes = output_ds.createVariable('lon', np.float32, ('lon',))
-            rain = output_ds.createVariable('r1d', np.float32, ('time', 'lat', 'lon',))
+    @staticmethod
+    def _record_daily_file(file_path, daily_rain, stats):
+        if stats is None:
+            metrics.count('process_missing_files')
+        else:
+            metrics.record_file('process', file_path, **stats)
 
-            time[:] = np.arange(1, days_in_year + 1)
-            latitudes[:] = lat
-            longitudes[:] = lon
+        return daily_rain
 
-            rain[:, :, :] = all_daily_rains
+    def _create_output_variables(self, output_ds, days_in_year, lat, lon):
+        output_ds.createDimension('time', time_dimension_size(self.storage_profile, days_in_year))
+        output_ds.createDimension('lat', len(lat))
+        output_ds.createDimension('lon', len(lon))
 
-            rain.units = 'mm/day'
-            latitudes.units = 'degree_north'
-            longitudes.units = 'degree_east'
+        time = output_ds.createVariable('time', np.int32, ('time',))
+        latitudes = output_ds.createVariable('lat', np.float32, ('lat',))
+        longitudes = output_ds.createVariable('lon', np.float32, ('lon',))
+        rain = create_data_variable(output_ds, 'r1d', np.float32, ('time', 'lat', 'lon',), self.storage_profile,
+                                    pack_scale=DAILY_PACK_SCALE)
+
+        time[:] = np.arange(1, days_in_year + 1)
+        latitudes[:] = lat
+        longitudes[:] = lon
+
+        time.units = 'day of year'
+        rain.units = 'mm/day'
+        latitudes.units = 'degree_north'
+        longitudes.units = 'degree_east'
+
+        return rain
+
+    def _save_data(self, all_daily_rains, days_in_year, lat, lon):
+        output_file = os.path.join(self.output_dir, f'{self.year}.nc')
+        
+        with nc.Dataset(output_file, 'w', format='NETCDF4') as output_ds:
+            rain = self._create_output_variables(output_ds, days_in_year, lat, lon)
+            rain[:, :, :] = storage_values(rain, all_daily_rains)
 
 class getYearSum:
-    def __init__(self, input_file):
+    def __init__(self, input_file, chunk_days=SUM_CHUNK_DAYS, wet_day_threshold=WET_DAY_THRESHOLD, year=None,
+                 storage_profile=STORAGE_PROFILE, fingerprint=BUILD_FINGERPRINT):
         self.input_file = input_file
-        self.nc_file = nc.Dataset(input_file, mode='r')
-        self.lat = self.nc_file.variables['lat'][:]
-        self.lon = self.nc_file.variables['lon'][:]
-        self.time = self.nc_file.variables['time'][:]
-        self.r1d = self.nc_file.variables['r1d'][:]
+        self.store = default_store()
+        self.lat, self.lon, self.time = self.store.coordinates(input_file)
+        self.r1d = self.store.view(input_file, 'r1d')
         self.reference_date = None
 
+        self.chunk_days = max(1, int(chunk_days))
+        self.wet_day_threshold = wet_day_threshold
+        self.storage_profile = storage_profile
+
         input_file_name = os.path.basename(input_file)
         output_file_name = f"{input_file_name.split('.')[0]}_sum.nc"
         
         self.output_file = os.path.join(os.path.dirname(input_file), output_file_name)
+        self.year = int(year) if year is not None else getYearSum._year_from_filename(input_file_name)
 
-        self.skip_processing = os.path.isfile(self.output_file)
+        self.manifest = BuildManifest(self.output_file, fingerprint)
+        self.skip_processing = self.manifest.is_up_to_date(*self._manifest_state())
         
         if self.skip_processing:
-            logging.info(f"SUM : Output file already exists. Skipping processing.")
+            logging.info(f"SUM : Output file is up to date. Skipping processing.")
             
         else:
             logging.info(f"SUM : Processing {self.input_file} to create {self.output_file}")
@@ -209,30 +663,50 @@ class getYearSum:
         
         logging.info("SUM : Starting to aggregate annual data.")
         
-        total_sum = np.zeros((len(self.lat), len(self.lon)))
+        accumulator = AnnualAccumulator((len(self.lat), len(self.lon)), self.wet_day_threshold)
 
-        for time_idx in range(len(self.time)):
-            current_day = int(self.time[time_idx])
-            
-            logging.info(f"Processing day: {current_day}")
+        with metrics.file('sum', self.input_file, bytes=os.path.getsize(self.input_file),
+                          read_seconds=0.0, reduce_seconds=0.0) as record:
+            for start in range(0, len(self.time), self.chunk_days):
+                stop = min(start + self.chunk_days, len(self.time))
 
-            for lat_idx in range(len(self.lat)):
-                for lon_idx in range(len(self.lon)):
-                    total_sum[lat_idx, lon_idx] += self.r1d[time_idx, lat_idx, lon_idx]
+                logging.info(f"Processing days: {int(self.time[start])}-{int(self.time[stop - 1])}")
+
+                start_time = time.perf_counter()
+                chunk = self.r1d[start:stop]
+                record['read_seconds'] += time.perf_counter() - start_time
+
+                start_time = time.perf_counter()
+                accumulator.update_chunk(chunk)
+                record['reduce_seconds'] += time.perf_counter() - start_time
 
         logging.info("SUM : Annual data aggregation completed.")
-        return {'yearly_sum': total_sum}
+        return accumulator.result()
+
+    def close(self):
+        self.store.release(self.input_file)
+
+    def _manifest_state(self):
+        params = {'year': self.year, 'wet_day_threshold': self.wet_day_threshold, 'storage_profile': self.storage_profile}
+
+        return {'r1d': self.input_file}, params
+
+    @staticmethod
+    def _year_from_filename(file_name):
+        stem = file_name.split('.')[0]
+
+        return int(stem) if stem.isdigit() else int(PROCESS_YEAR)
 
     def convert_time_to_date(self):
-        return [datetime(int(PROCESS_YEAR), 1, 1) + timedelta(days=int(day - 1)) for day in self.time]
+        return [datetime(self.year, 1, 1) + timedelta(days=int(day - 1)) for day in self.time]
 
     def get_max_value(self, annual_data):
-            max_value = max([np.max(annual_data[year]) for year in annual_data])
+            max_value = np.nanmax(annual_data['yearly_sum'])
             return max_value
 
     def save_to_new_file(self, annual_data):
         if self.skip_processing or annual_data is None:
-            logging.info(f"SUM : Skipping saving sum process file already exists")
+            logging.info(f"SUM : Skipping saving sum process file is up to date")
             return
         
         logging.info("SUM : Saving aggregated data to file: %s", self.output_file)
@@ -245,7 +719,8 @@ class getYearSum:
             latitudes = new_nc.createVariable('lat', 'f4', ('lat',))
             longitudes = new_nc.createVariable('lon', 'f4', ('lon',))
             time = new_nc.createVariable('time', 'i4', ('time',))
-            r1y = new_nc.createVariable('r1y', 'f4', ('time', 'lat', 'lon',))
+            r1y = create_data_variable(new_nc, 'r1y', 'f4', ('time', 'lat', 'lon',), self.storage_profile,
+                                       pack_scale=ANNUAL_PACK_SCALE)
             max_val_var = new_nc.createVariable('max_value', 'f4')
 
             max_val_var.units = 'mm/yr'
@@ -253,58 +728,271 @@ class getYearSum:
 
             latitudes[:] = self.lat
             longitudes[:] = self.lon
-            time[:] = [int(PROCESS_YEAR)]
-            r1y[0, :, :] = annual_data['yearly_sum']
+            time[:] = [self.year]
+            r1y[0, :, :] = storage_values(r1y, annual_data['yearly_sum'])
 
             latitudes.units = 'degree_north'
             longitudes.units = 'degree_east'
             time.units = 'years'
             r1y.units = 'mm/yr'
 
+            for name, dtype, units, long_name in SUM_STATISTICS:
+                if name in annual_data:
+                    variable = create_data_variable(new_nc, name, dtype, ('time', 'lat', 'lon',), self.storage_profile,
+                                                    pack_scale=DAILY_PACK_SCALE)
+                    variable[0, :, :] = storage_values(variable, annual_data[name])
+                    variable.units = units
+                    variable.long_name = long_name
+
+            if 'wet_days' in annual_data:
+                new_nc.variables['wet_days'].threshold = self.wet_day_threshold
+
             new_nc.description = "Annual aggregated precipitation data"
             
-            logging.info("SUM : Data saved successfully to %s", self.output_file)
+        self.manifest.record(*self._manifest_state())
+        logging.info("SUM : Data saved successfully to %s", self.output_file)
+
+_tile_store = None
+
+def _init_tile_worker():
+    # Pool workers open their own handles rather than reuse ones inherited from the parent.
+
+    global _tile_store
+    _tile_store = CubeStore()
+
+def _downscale_tile(input_file, variable, steps, lat_range, lon_range, mapping, methods):
+    store = _tile_store or default_store()
+
+    start = time.perf_counter()
+    data = store.view(input_file, variable)[steps, lat_range, lon_range]
+    read_seconds = time.perf_counter() - start
+
+    results = downscale_methods(data, mapping, methods)
+
+    return results, {'read_seconds': read_seconds, 'reduce_seconds': time.perf_counter() - start - read_seconds}
 
 class DataDownscaler:
-    def __init__(self, input_file, output_file):
+    def __init__(self, input_file, output_file, downscaling_method=DOWNSCALING_METHOD,
+                 lat_grid_size=LAT_GRID_SIZE, lon_grid_size=LON_GRID_SIZE, storage_profile=STORAGE_PROFILE,
+                 variable='r1y', tile_size=DOWNSCALING_TILE_SIZE, workers=DOWNSCALING_WORKERS,
+                 tile_steps=DOWNSCALING_TILE_STEPS, fingerprint=BUILD_FINGERPRINT, regrid_cache_dir=REGRID_CACHE_DIR,
+                 regrid_cache_max_bytes=REGRID_CACHE_MAX_BYTES):
         self.input_file = input_file
         self.output_file = output_file
-
-        self.lat_grid_size = float(LAT_GRID_SIZE)
-        self.lon_grid_size = float(LON_GRID_SIZE)
-
-        self.downscaling_method = DOWNSCALING_METHOD
+        self.variable = variable
+        # Fallbacks for inputs without unit attributes, such as year cubes written before time had units.
+        self.units = 'mm/day' if variable == 'r1d' else 'mm/yr'
+        self.time_units = 'day of year' if variable == 'r1d' else 'years'
+
+        self.lat_grid_size = float(lat_grid_size)
+        self.lon_grid_size = float(lon_grid_size)
+
+        self.downscaling_method = downscaling_method
+        self.storage_profile = storage_profile
+        self.fingerprint = fingerprint
+        self.mapping_cache = MappingCache(regrid_cache_dir, regrid_cache_max_bytes) if regrid_cache_dir else None
+
+        self.tile_size = int(tile_size)
+        self.tile_steps = max(1, int(tile_steps))
+        self.workers = int(workers) if int(workers) > 0 else (os.cpu_count() or 1)
         
         os.makedirs(os.path.dirname(self.output_file), exist_ok=True)
-        
-        self._setup_logging()
 
     def downscale_data(self):
+        manifest = BuildManifest(self.output_file, self.fingerprint)
+
+        if manifest.is_up_to_date(*self._manifest_state()):
+            logging.info(f"Downscaling skipped, {self.output_file} is up to date.")
+            return
+
         try:
-            r1y, lat, lon, time = self._load_data()
-            new_lat, new_lon = self._define_new_grid(lat, lon)
-            downscaled_data = self._downscale_data_method(r1y, lat, lon, new_lat, new_lon)
-            self._save_data(downscaled_data, new_lat, new_lon, time)
+            if self.tile_size > 0:
+                self._downscale_tiled({self.downscaling_method: self.output_file})
+
+            else:
+                r1y, lat, lon, time = self._load_data()
+                new_lat, new_lon = self._define_new_grid(lat, lon)
+                downscaled_data = self._downscale_data_method(r1y, lat, lon, new_lat, new_lon)
+                self._save_data(downscaled_data, new_lat, new_lon, time)
+
+            manifest.record(*self._manifest_state())
 
             logging.info("Data downscaling completed successfully.")
             
         except Exception as e:
             logging.error(f"Error during data downscaling: {e}")
 
+    def downscale_batch(self, methods, grid_sizes):
+        output_files = []
+        lat_grid_size, lon_grid_size = self.lat_grid_size, self.lon_grid_size
+
+        try:
+            r1y = lat = lon = time = None
+            output_dir = os.path.dirname(self.output_file)
+
+            # Batch outputs keep the prefix of the single output, e.g. YYYY or YYYY_daily.
+
+            output_name = os.path.basename(self.output_file)
+            suffix = f"_{self.downscaling_method}.nc"
+            prefix = (output_name[:-len(suffix)] if output_name.endswith(suffix)
+                      else os.path.basename(self.input_file).split('_')[0].split('.')[0])
+
+            for grid_size in grid_sizes:
+                self.lat_grid_size = self.lon_grid_size = float(grid_size)
+                manifests = {}
+
+                for method in methods:
+                    output_file = os.path.join(output_dir, f"{prefix}_{method}_{float(grid_size):.2f}.nc")
+                    manifest = BuildManifest(output_file, self.fingerprint)
+
+                    if manifest.is_up_to_date(*self._manifest_state(method)):
+                        logging.info(f"Downscaling skipped, {output_file} is up to date.")
+
+                    else:
+                        manifests[method] = (output_file, manifest)
+
+                if not manifests:
+                    continue
+
+                if self.tile_size > 0:
+                    self._downscale_tiled({method: output_file for method, (output_file, _) in manifests.items()})
+
+                else:
+                    if r1y is None:
+                        r1y, lat, lon, time = self._load_data()
+
+                    new_lat, new_lon = self._define_new_grid(lat, lon)
+                    mapping = self._build_mapping(lat, lon, new_lat, new_lon)
+                    downscaled = downscale_methods(r1y, mapping, list(manifests))
+
+                    for method, (output_file, _) in manifests.items():
+                        self._save_data(downscaled[method], new_lat, new_lon, time, output_file)
+
+                for method, (output_file, manifest) in manifests.items():
+                    manifest.record(*self._manifest_state(method))
+                    output_files.append(output_file)
+
+            logging.info(f"Batch downscaling completed: {len(output_files)} files written.")
+
+        except Exception as e:
+            logging.error(f"Error during batch downscaling: {e}")
+
+        self.lat_grid_size, self.lon_grid_size = lat_grid_size, lon_grid_size
+
+        return output_files
+
+    def _manifest_state(self, method=None):
+        params = {
+            'method': method or self.downscaling_method,
+            'lat_grid_size': self.lat_grid_size,
+            'lon_grid_size': self.lon_grid_size,
+            'storage_profile': self.storage_profile,
+            'variable': self.variable,
+        }
+
+        return {'sum': self.input_file}, params
+
     def _load_data(self):
         if not os.path.exists(os.path.dirname(self.input_file)):
             os.makedirs(os.path.dirname(self.input_file))
 
-        with nc.Dataset(self.input_file) as dataset:
-            r1y = dataset.variables['r1y'][:]
-            lat = dataset.variables['lat'][:]
-            lon = dataset.variables['lon'][:]
-            time = dataset.variables['time'][:]
-            
+        store = default_store()
+
+        with metrics.file('downscale', self.input_file, bytes=os.path.getsize(self.input_file)):
+            r1y = store.array(self.input_file, self.variable)
+            lat, lon, time = self._load_coordinates(store)
+            store.release(self.input_file)
+
         logging.info("Dataset opened successfully.")
         
         return r1y, lat, lon, time
 
+    def _load_coordinates(self, store):
+        variables = store.dataset(self.input_file).variables
+        self.units = getattr(variables[self.variable], 'units', self.units)
+        self.time_units = getattr(variables['time'], 'units', self.time_units)
+
+        return store.coordinates(self.input_file)
+
+    def _downscale_tiled(self, outputs):
+        store = default_store()
+        methods = list(outputs)
+        datasets = {}
+
+        with metrics.file('downscale', self.input_file, bytes=os.path.getsize(self.input_file)) as record:
+            lat, lon, time = self._load_coordinates(store)
+
+            # The cube mirror is built here once, before any worker could race to build it.
+
+            store.mirror(self.input_file, self.variable)
+            store.release(self.input_file)
+
+            new_lat, new_lon = self._define_new_grid(lat, lon)
+            mapping = self._build_mapping(lat, lon, new_lat, new_lon)
+            max_values = dict.fromkeys(methods, np.nan)
+            record.update(tiles=0, read_seconds=0.0, reduce_seconds=0.0)
+
+            try:
+                for method, output_file in outputs.items():
+                    datasets[method] = nc.Dataset(output_file, 'w', format='NETCDF4')
+                    reserve_band_cache(self._create_variables(datasets[method], new_lat, new_lon, time),
+                                       self.tile_steps)
+
+                for (steps, rows, cols), (results, stats) in self._iter_tiles(mapping, methods, len(time)):
+                    for method, values in results.items():
+                        variable = datasets[method].variables[self.variable]
+                        variable[steps, rows, cols] = storage_values(variable, values)
+
+                        if np.isfinite(values).any():
+                            max_values[method] = np.fmax(max_values[method], np.nanmax(values))
+
+                    record['tiles'] += 1
+                    record['read_seconds'] += stats['read_seconds']
+                    record['reduce_seconds'] += stats['reduce_seconds']
+
+                for method, dataset in datasets.items():
+                    dataset.variables['max_value'][:] = max_values[method]
+
+            finally:
+                for dataset in datasets.values():
+                    dataset.close()
+
+        logging.info(f"Downscaled {record['tiles']} tiles of {self.tile_size} cells with {self.workers} workers "
+                     f"to {', '.join(outputs.values())}")
+
+    def _tile_tasks(self, mapping, methods, steps_total):
+        # Time bands run outermost so every output chunk of a band is finished before the next.
+
+        for start in range(0, steps_total, self.tile_steps):
+            steps = slice(start, min(start + self.tile_steps, steps_total))
+
+            for rows, cols in mapping.tiles(self.tile_size):
+                tile_mapping, lat_range, lon_range = mapping.window(rows, cols)
+
+                yield (steps, rows, cols), (self.input_file, self.variable, steps, lat_range, lon_range, tile_mapping, methods)
+
+    def _iter_tiles(self, mapping, methods, steps_total):
+        tasks = self._tile_tasks(mapping, methods, steps_total)
+
+        if self.workers <= 1:
+            for key, task in tasks:
+                yield key, _downscale_tile(*task)
+            return
+
+        pending = deque()
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_tile_worker) as executor:
+            for key, task in tasks:
+                pending.append((key, executor.submit(_downscale_tile, *task)))
+
+                if len(pending) >= self.workers * 2:
+                    key, future = pending.popleft()
+                    yield key, future.result()
+
+            while pending:
+                key, future = pending.popleft()
+                yield key, future.result()
+
     def _define_new_grid(self, lat, lon):
         new_lat = np.arange(np.min(lat), np.max(lat), self.lat_grid_size)
         new_lon = np.arange(np.min(lon), np.max(lon), self.lon_grid_size)
@@ -312,120 +1000,172 @@ class DataDownscaler:
         return new_lat, new_lon
 
     def _downscale_data_method(self, original_data, original_lat, original_lon, target_lat, target_lon):
-        target_data = np.zeros((len(target_lat), len(target_lon)))
-        
-        for i, new_lat_val in enumerate(target_lat):
-            for j, new_lon_val in enumerate(target_lon):
-                lat_lower_bound, lat_upper_bound = self._calculate_bounds(new_lat_val, self.lat_grid_size)
-                lon_lower_bound, lon_upper_bound = self._calculate_bounds(new_lon_val, self.lon_grid_size)
-
-                lat_in_cell = (original_lat >= lat_lower_bound) & (original_lat < lat_upper_bound)
-                lon_in_cell = (original_lon >= lon_lower_bound) & (original_lon < lon_upper_bound)
-
-                cell_data = original_data[:, lat_in_cell, :][:, :, lon_in_cell]
-                
-                if cell_data.size > 0:
-                    target_data[i, j] = self._aggregate_data(cell_data)
-                    
-                else:
-                    target_data[i, j] = np.nan
+        mapping = self._build_mapping(original_lat, original_lon, target_lat, target_lon)
 
-        return target_data
+        return downscale_methods(original_data, mapping, [self.downscaling_method])[self.downscaling_method]
 
-    def _calculate_bounds(self, center_val, grid_size):
-        half_grid = grid_size / 2.0
-        lower_bound = center_val - half_grid
-        upper_bound = center_val + half_grid
-        
-        return lower_bound, upper_bound
+    def _build_mapping(self, original_lat, original_lon, target_lat, target_lon):
+        if self.mapping_cache is not None:
+            return self.mapping_cache.get(original_lat, original_lon, target_lat, target_lon,
+                                          self.lat_grid_size, self.lon_grid_size)
 
-    def _aggregate_data(self, cell_data):
-        if self.downscaling_method == 'max':
-            return np.nanmax(cell_data)
+        return GridMapping.build(original_lat, original_lon, target_lat, target_lon,
+                                 self.lat_grid_size, self.lon_grid_size)
 
-        elif self.downscaling_method == 'median':
-            return np.nanmedian(cell_data)
+    def get_max_value(self, downscaled_data):
+        return np.nanmax(downscaled_data)
 
-        elif self.downscaling_method == 'center':
-            return self._calculate_center_value(cell_data)
+    def _save_data(self, data, lat, lon, time, output_file=None):
+        output_file = output_file or self.output_file
 
-        elif self.downscaling_method == 'mean':
-            return np.nanmean(cell_data)
+        with metrics.file('downscale_write', output_file), nc.Dataset(output_file, 'w', format='NETCDF4') as new_nc:
+            r1y = self._create_variables(new_nc, lat, lon, time)
 
-        else:
-            raise ValueError(f"Invalid downscaling method: {self.downscaling_method}")
+            new_nc.variables['max_value'][:] = self.get_max_value(data)
+            r1y[:, :, :] = storage_values(r1y, data)
 
-    def _calculate_center_value(self, cell_data):
-        _, rows, cols = cell_data.shape  
+            logging.info("Data saved successfully to %s", output_file)
 
-        center_row = rows // 2
-        center_col = cols // 2
+    def _create_variables(self, new_nc, lat, lon, time):
+        new_nc.createDimension('lat', len(lat))
+        new_nc.createDimension('lon', len(lon))
+        new_nc.createDimension('time', len(time))
 
-        if rows % 2 == 1 and cols % 2 == 1:
-            return cell_data[:, center_row, center_col]
+        latitudes = new_nc.createVariable('lat', 'f4', ('lat',))
+        longitudes = new_nc.createVariable('lon', 'f4', ('lon',))
+        times = new_nc.createVariable('time', 'i4', ('time',))
+        r1y = create_data_variable(new_nc, self.variable, 'f4', ('time', 'lat', 'lon',), self.storage_profile,
+                                   pack_scale=DOWNSCALED_PACK_SCALES.get(self.variable, ANNUAL_PACK_SCALE))
+        max_val_var = new_nc.createVariable('max_value', 'f4')
+
+        max_val_var.units = self.units
+
+        latitudes[:] = lat
+        longitudes[:] = lon
+        times[:] = time
+
+        latitudes.units = 'degree_north'
+        longitudes.units = 'degree_east'
+        times.units = self.time_units
         
-        else:
-            center_values = cell_data[:, center_row-1:center_row+1, center_col-1:center_col+1]
-            return np.nanmean(center_values, axis=(1, 2))
+        r1y.standard_name ='precipitation_flux' 
+        r1y.long_name = 'Precipitation'
+        r1y.units = self.units
+        
+        new_nc.description = DOWNSCALED_DESCRIPTIONS.get(self.variable, "Downscaled GPVMSM annual precipitation data")
 
-    def get_max_value(self, downscaled_data):
-        return np.nanmax(downscaled_data)
+        return r1y
 
-    def _save_data(self, data, lat, lon, time):
-        with nc.Dataset(self.output_file, 'w', format='NETCDF4') as new_nc:
-            new_nc.createDimension('lat', len(lat))
-            new_nc.createDimension('lon', len(lon))
-            new_nc.createDimension('time', len(time))
+def _year_paths(year, settings):
+    return get_year_paths(year, settings['DOWNSCALING_METHOD'], settings['DATA_DIR'])
 
-            latitudes = new_nc.createVariable('lat', 'f4', ('lat',))
-            longitudes = new_nc.createVariable('lon', 'f4', ('lon',))
-            times = new_nc.createVariable('time', 'i4', ('time',))
-            r1y = new_nc.createVariable('r1y', 'f4', ('time', 'lat', 'lon',))
-            max_val_var = new_nc.createVariable('max_value', 'f4')
+def _downscaler(input_file, output_file, settings, **kwargs):
+    return DataDownscaler(input_file, output_file, settings['DOWNSCALING_METHOD'],
+                          settings['LAT_GRID_SIZE'], settings['LON_GRID_SIZE'], settings['STORAGE_PROFILE'],
+                          tile_size=settings['DOWNSCALING_TILE_SIZE'], workers=settings['DOWNSCALING_WORKERS'],
+                          tile_steps=settings['DOWNSCALING_TILE_STEPS'], fingerprint=settings['BUILD_FINGERPRINT'],
+                          regrid_cache_dir=settings['REGRID_CACHE_DIR'],
+                          regrid_cache_max_bytes=settings['REGRID_CACHE_MAX_BYTES'], **kwargs)
 
-            max_val_var.units = 'mm/yr'
-            max_val_var[:] = self.get_max_value(data)
+def download_stage(year, settings=None):
+    settings = get_settings(settings)
+    paths = _year_paths(year, settings)
+    start_date = datetime.strptime(paths['START_DATE'], "%Y/%m/%d")
+    end_date = datetime.strptime(paths['END_DATE'], "%Y/%m/%d")
 
-            latitudes[:] = lat
-            longitudes[:] = lon
-            times[:] = time
-            r1y[:, :] = data
+    with metrics.stage('download', year):
+        downloader = GPvMSM_Downloder(start_date, end_date, paths['DOWNLOAD_FOLDER'], settings['BASE_URL'],
+                                      settings['DOWNLOAD_WORKERS'], settings['DOWNLOAD_PER_HOST_LIMIT'],
+                                      settings['DOWNLOAD_QUEUE_SIZE'], settings['DOWNLOAD_CHUNK_SIZE'],
+                                      settings['DOWNLOAD_BACKOFF'], settings['DOWNLOAD_CHECKSUM'],
+                                      settings['DOWNLOAD_RETRIES'])
+        downloader.download_files()
 
-            latitudes.units = 'degree_north'
-            longitudes.units = 'degree_east'
-            times.units = 'years'
-            
-            r1y.standard_name ='precipitation_flux' 
-            r1y.long_name = 'Precipitation'
-            r1y.units = 'mm/yr'
-            
-            new_nc.description = "Downscaled GPVMSM annual precipitation data"
-            logging.info("Data saved successfully to %s", self.output_file)
+def process_stage(year, workers=None, settings=None):
+    settings = get_settings(settings)
+    paths = _year_paths(year, settings)
+    workers = settings['PROCESS_WORKERS'] if workers is None else workers
+
+    with metrics.stage('process', year):
+        processor = DataProcessor(int(year), paths['DOWNLOAD_FOLDER'], paths['INPUT_FILE'], settings['PROCESS_STREAMING'],
+                                  workers, settings['STORAGE_PROFILE'], settings['WET_DAY_THRESHOLD'],
+                                  settings['BUILD_FINGERPRINT'])
+        return processor.process_year()
+
+def sum_stage(year, annual_sum=None, settings=None):
+    settings = get_settings(settings)
+
+    with metrics.stage('sum', year):
+        aggregator = getYearSum(_year_paths(year, settings)['INPUT_FILE'], settings['SUM_CHUNK_DAYS'],
+                                settings['WET_DAY_THRESHOLD'], year, settings['STORAGE_PROFILE'],
+                                settings['BUILD_FINGERPRINT'])
+
+        if annual_sum is None:
+            annual_sum = aggregator.aggregate_annual_data()
+
+        aggregator.save_to_new_file(annual_sum)
+        aggregator.close()
+
+def rollup_stage(year, settings=None):
+    settings = get_settings(settings)
+
+    if not settings['ROLLUP_WINDOWS']:
+        return
+
+    paths = _year_paths(year, settings)
+
+    with metrics.stage('rollup', year):
+        rollup_file = RollupBuilder(paths['INPUT_FILE'], paths['INPUT_FILE_ROLLUP'], settings['ROLLUP_WINDOWS'], year,
+                                    settings['SUM_CHUNK_DAYS'], settings['STORAGE_PROFILE'],
+                                    settings['BUILD_FINGERPRINT']).build()
+
+        _downscaler(rollup_file, paths['OUTPUT_FILE_ROLLUP'], settings, variable='r1w').downscale_data()
+
+def extremes_stage(year, settings=None):
+    settings = get_settings(settings)
+
+    if not settings['EXTREMES_ENABLED']:
+        return
+
+    paths = _year_paths(year, settings)
+
+    with metrics.stage('extremes', year):
+        ExtremesBuilder(year, paths['DOWNLOAD_FOLDER'], paths['OUTPUT_FILE_EXTREMES'], settings['EXTREME_THRESHOLDS'],
+                        settings['EXTREME_WINDOWS'], settings['EXTREME_PERCENTILES'], settings['EXTREME_HISTOGRAM_BINS'],
+                        settings['STORAGE_PROFILE'], settings['BUILD_FINGERPRINT']).build()
+
+def _run_downscaler(downscaler, settings):
+    if settings['DOWNSCALING_METHODS'] or settings['DOWNSCALING_GRID_SIZES']:
+        downscaler.downscale_batch(settings['DOWNSCALING_METHODS'] or [settings['DOWNSCALING_METHOD']],
+                                   settings['DOWNSCALING_GRID_SIZES'] or [settings['LAT_GRID_SIZE']])
+
+    else:
+        downscaler.downscale_data()
+
+def downscale_stage(year, settings=None):
+    settings = get_settings(settings)
+    paths = _year_paths(year, settings)
+
+    with metrics.stage('downscale', year):
+        _run_downscaler(_downscaler(paths['INPUT_FILE_SUM'], paths['OUTPUT_FILE'], settings), settings)
+
+def daily_stage(year, settings=None):
+    settings = get_settings(settings)
 
-    def _setup_logging(self):
-        logging.basicConfig(filename='downscaler.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not settings['DOWNSCALING_DAILY']:
+        return
 
-def main():
-    start_date = datetime.strptime(START_DATE, "%Y/%m/%d")
-    end_date = datetime.strptime(END_DATE, "%Y/%m/%d")
-    
-    downloader = GPvMSM_Downloder(start_date, end_date, DOWNLOAD_FOLDER) 
-    downloader.download_files()  
+    paths = _year_paths(year, settings)
 
-    processor = DataProcessor(int(PROCESS_YEAR), DOWNLOAD_FOLDER, INPUT_FILE)
-    processor.process_year()
+    with metrics.stage('daily', year):
+        _run_downscaler(_downscaler(paths['INPUT_FILE'], paths['OUTPUT_FILE_DAILY'], settings, variable='r1d'), settings)
 
-    aggregator = getYearSum(INPUT_FILE)
-    annual_sum = aggregator.aggregate_annual_data()
-    aggregator.save_to_new_file(annual_sum) 
+def main(argv=None):
+    # Kept so `python GPvMSM.py` still runs every stage, the entry point itself lives in pipeline.py.
 
-    downscaler = DataDownscaler(INPUT_FILE_SUM, OUTPUT_FILE)
-    downscaler.downscale_data()
+    from pipeline import main as pipeline_main
 
-    frequency = 2500  
-    duration = 500  
-    
-    ws.Beep(frequency, duration)
+    pipeline_main(argv)
 
 if __name__ == "__main__":
     main()
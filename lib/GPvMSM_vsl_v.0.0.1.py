@@ -1,15 +1,338 @@
 import os
-import netCDF4 as nc
-import matplotlib.pyplot as plt
-import geopandas as gpd
-import winsound as ws
+import shutil
+import hashlib
+import subprocess
+import matplotlib
 import numpy as np
 
-from PIL import Image, ImageDraw 
-from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from datetime import datetime, timedelta
+from PIL import Image, GifImagePlugin
+
+from access import default_store
+from notify import notify
+from rollup import parse_windows
+
+RENDER_DPI = 100
+BOUNDARY_CACHE_VERSION = 1
+FRAME_MODES = ('year', 'month', 'day')
+
+_boundary_layer = None
+_render_settings = None
+
+def _init_renderer(boundary_layer, render_settings):
+    global _boundary_layer, _render_settings
+
+    # The layer is (rgba, (xlabel, ylabel)), the labels geopandas derives from the shapefile CRS.
+
+    _boundary_layer = boundary_layer
+    _render_settings = render_settings
+
+def _new_canvas(width, height):
+    fig = Figure(figsize=(width / RENDER_DPI, height / RENDER_DPI), dpi=RENDER_DPI)
+
+    return fig, FigureCanvasAgg(fig)
+
+def _canvas_array(canvas):
+    canvas.draw()
+
+    return np.asarray(canvas.buffer_rgba())
+
+def rasterize_boundary(world, lon_range, lat_range, width, height):
+    fig, canvas = _new_canvas(width, height)
+    fig.patch.set_alpha(0)
+
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+    ax.patch.set_alpha(0)
+
+    world.boundary.plot(ax=ax, linewidth=1, color='k')
+
+    ax.set_xlim(*lon_range)
+    ax.set_ylim(*lat_range)
+
+    return _canvas_array(canvas).copy(), (ax.get_xlabel(), ax.get_ylabel())
+
+def _data_variable(dataset):
+    return list(dataset.variables.keys())[3]
+
+class FrameRenderer:
+    def __init__(self, settings, boundary_layer, sample, label, vmin=None, vmax=None):
+        extent = (settings['lon_range'][0], settings['lon_range'][1], settings['lat_range'][0], settings['lat_range'][1])
+
+        # The axes, ticks and colorbar are drawn once into a background that every frame
+        # restores, so a frame only redraws the data image and the title. The boundary is
+        # captured as canvas pixels on the first frame and blended on top afterwards.
+
+        self.fig, self.canvas = _new_canvas(*settings['resolution'][:2])
+        ax = self.fig.add_subplot()
+
+        self.image = ax.imshow(sample[::-1, :], extent=extent, cmap=settings['color_map'], alpha=settings['transparency'],
+                               vmin=vmin, vmax=vmax)
+        self.boundary = None
+
+        if boundary_layer is not None:
+            layer, (xlabel, ylabel) = boundary_layer
+            self.boundary = ax.imshow(layer, extent=extent, interpolation='antialiased', zorder=2)
+            ax.set_xlabel(xlabel, fontsize=8)
+            ax.set_ylabel(ylabel, fontsize=8)
+
+        ax.set_xlim(extent[:2])
+        ax.set_ylim(extent[2:])
+
+        self.fig.colorbar(self.image, ax=ax, label=label)
+        self.title = ax.set_title('')
+        self.background = None
+        self.overlay = None
+
+    def _capture(self):
+        self.fig.tight_layout()
+
+        for artist in (self.image, self.boundary, self.title):
+            if artist is not None:
+                artist.set_animated(True)
+
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+
+        if self.boundary is not None:
+            self.canvas.get_renderer().clear()
+            self.fig.draw_artist(self.boundary)
+
+            layer = np.asarray(self.canvas.buffer_rgba())
+            index = np.nonzero(layer[..., 3])
+            self.overlay = (index, layer[index][:, :3].astype(np.float32), layer[index][:, 3:] / 255.0)
+
+    def render(self, data, title):
+        self.image.set_data(data[::-1, :])
+        self.title.set_text(title)
+
+        if self.background is None:
+            self._capture()
+
+        self.canvas.restore_region(self.background)
+        self.fig.draw_artist(self.image)
+        self.fig.draw_artist(self.title)
+
+        frame = np.array(np.asarray(self.canvas.buffer_rgba())[..., :3])
+
+        if self.overlay is not None:
+            index, color, alpha = self.overlay
+            frame[index] = np.rint(frame[index] * (1 - alpha) + color * alpha).astype(np.uint8)
+
+        return frame
+
+def render_frame(nc_file, output_file):
+    settings = _render_settings
+    store = default_store()
+
+    dataset = store.dataset(nc_file)
+    variable_name = _data_variable(dataset)
+    variable_units = dataset.variables[variable_name].units
+    year = int(dataset.variables['time'][0])
+
+    max_value = None
+
+    if 'max_value' in dataset.variables:
+        max_value = dataset.variables['max_value'][:]
+
+    year_data = store.view(nc_file, variable_name)[0]
+
+    renderer = FrameRenderer(settings, _boundary_layer, year_data, f'{variable_name} ({variable_units})',
+                             vmax=settings['max_value'])
+    frame = Image.fromarray(renderer.render(year_data, f'Year: {year}, Max Value: {max_value}'))
+    frame.save(output_file, format='GIF')
+
+    store.release(nc_file)
+
+    return output_file
+
+def _file_year(nc_file):
+    prefix = os.path.basename(nc_file)[:4]
+
+    return int(prefix) if prefix.isdigit() else None
+
+def iter_frames(store, nc_files, frames='year'):
+    if frames not in FRAME_MODES:
+        raise ValueError(f"Invalid animation frames: {frames}")
+
+    for nc_file in nc_files:
+        dataset = store.dataset(nc_file)
+        view = store.view(nc_file, _data_variable(dataset))
+        times = dataset.variables['time'][:]
+        year = _file_year(nc_file)
+
+        if frames == 'year':
+            for index, value in enumerate(times):
+                yield f'Year: {int(value)}', view[index]
+
+        elif frames == 'day':
+            for index, value in enumerate(times):
+                if year is None:
+                    yield f'Day: {int(value)}', view[index]
+                else:
+                    yield f"Date: {(datetime(year, 1, 1) + timedelta(days=int(value) - 1)).strftime('%Y-%m-%d')}", view[index]
+
+        else:
+            if year is None:
+                raise ValueError(f"Monthly frames need a YYYY file name prefix: {nc_file}")
+
+            # Only one month of days is read at a time.
+
+            for name, start, stop in parse_windows(['monthly'], year):
+                if start >= len(view):
+                    break
+
+                days = view[start:min(stop, len(view))]
+                month_sum = np.nansum(days, axis=0)
+                month_sum[np.isnan(days).all(axis=0)] = np.nan
+
+                yield f'Month: {name.capitalize()} {year}', month_sum
+
+        store.release(nc_file)
+
+def frame_range(frames):
+    vmin, vmax = np.inf, -np.inf
+
+    for _, data in frames:
+        if np.isfinite(data).any():
+            vmin = min(vmin, float(np.nanmin(data)))
+            vmax = max(vmax, float(np.nanmax(data)))
+
+    return (vmin, vmax) if vmin <= vmax else (0.0, 1.0)
+
+class GifWriter:
+    def __init__(self, output_file, duration, loop=0):
+        self.output_file = output_file
+        self.temp_file = f"{output_file}.tmp"
+        self.duration = duration
+        self.loop = loop
+
+        self.file = open(self.temp_file, 'wb')
+        self.palette = None
+
+    def append(self, frame):
+        image = Image.fromarray(frame)
+
+        # Every frame carries the full colorbar, so the palette of the first frame already
+        # holds all colors the later frames can use and is shared by the whole animation.
+
+        if self.palette is None:
+            self.palette = indexed = image.quantize(256)
+            header, _ = GifImagePlugin.getheader(indexed, info={'loop': self.loop, 'duration': self.duration, 'optimize': False})
+            self.file.write(b''.join(header))
+
+        else:
+            indexed = image.quantize(palette=self.palette, dither=Image.Dither.NONE)
+
+        self.file.write(b''.join(GifImagePlugin.getdata(indexed, duration=self.duration)))
+
+    def close(self, discard=False):
+        if not discard:
+            self.file.write(b';')
+
+        self.file.close()
+
+        if discard:
+            os.remove(self.temp_file)
+        else:
+            os.replace(self.temp_file, self.output_file)
+
+class Mp4Writer:
+    def __init__(self, output_file, duration):
+        self.ffmpeg = shutil.which('ffmpeg')
+
+        if self.ffmpeg is None:
+            raise RuntimeError("ffmpeg is required for MP4 output")
+
+        self.output_file = output_file
+        self.duration = duration
+        self.process = None
+
+    def append(self, frame):
+        if self.process is None:
+            height, width = frame.shape[:2]
+            self.process = subprocess.Popen([
+                self.ffmpeg, '-loglevel', 'error', '-y',
+                '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-framerate', f'{1000 / self.duration:g}',
+                '-i', '-', '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-c:v', 'libx264', '-pix_fmt', 'yuv420p',
+                self.output_file,
+            ], stdin=subprocess.PIPE)
+
+        self.process.stdin.write(np.ascontiguousarray(frame).tobytes())
+
+    def close(self, discard=False):
+        if self.process is None:
+            return
+
+        self.process.stdin.close()
+
+        if self.process.wait() != 0 and not discard:
+            raise RuntimeError(f"ffmpeg failed to write {self.output_file}")
+
+        if discard and os.path.exists(self.output_file):
+            os.remove(self.output_file)
+
+def animation_writer(output_file, duration):
+    if output_file.lower().endswith('.mp4'):
+        return Mp4Writer(output_file, duration)
+
+    return GifWriter(output_file, duration)
+
+def render_animation(nc_files, output_file, frames='year'):
+    settings = _render_settings
+    store = default_store()
+
+    dataset = store.dataset(nc_files[0])
+    variable_name = _data_variable(dataset)
+    variable_units = dataset.variables[variable_name].units
+
+    if frames == 'month' and variable_units.endswith('/day'):
+        variable_units = variable_units[:-len('/day')]
+
+    # All frames share one color scale. Bounds that are not configured come from a
+    # streaming pass over the same frames before anything is encoded.
+
+    vmin, vmax = settings['min_value'], settings['max_value']
+
+    if vmin is None or vmax is None:
+        low, high = frame_range(iter_frames(store, nc_files, frames))
+        vmin = low if vmin is None else vmin
+        vmax = high if vmax is None else vmax
+
+    writer = animation_writer(output_file, settings['frame_duration'])
+    renderer = None
+
+    try:
+        for title, data in iter_frames(store, nc_files, frames):
+            if renderer is None:
+                renderer = FrameRenderer(settings, _boundary_layer, data, f'{variable_name} ({variable_units})', vmin, vmax)
+
+            writer.append(renderer.render(data, title))
+
+    except BaseException:
+        writer.close(discard=True)
+        raise
+
+    writer.close()
+
+    return output_file
+
+def _render_task(task):
+    print(f"Processing file: {os.path.basename(task[0])}")
+
+    return render_frame(*task)
+
+def _animation_task(task):
+    print(f"Rendering animation: {os.path.basename(task[1])}")
+
+    return render_animation(*task)
 
 class NCDataProcessor:
-    def __init__(self, DIRECTORY_PATH, SHAPEFILE_PATH, OUTPUT_PATH, LON_RANGE, LAT_RANGE, RESOLUTION, TRANSPARENCY, MAX_VALUE, color_map, FRAME_DURATION):
+    def __init__(self, DIRECTORY_PATH, SHAPEFILE_PATH, OUTPUT_PATH, LON_RANGE, LAT_RANGE, RESOLUTION, TRANSPARENCY, MAX_VALUE, color_map, FRAME_DURATION,
+                 WORKERS=None, CACHE_PATH=None, MIN_VALUE=None):
         self.DIRECTORY_PATH = DIRECTORY_PATH
         self.SHAPEFILE_PATH = SHAPEFILE_PATH
         self.OUTPUT_PATH = OUTPUT_PATH
@@ -18,126 +341,193 @@ class NCDataProcessor:
         self.RESOLUTION = RESOLUTION
         self.TRANSPARENCY = TRANSPARENCY
         self.MAX_VALUE = MAX_VALUE
+        self.MIN_VALUE = MIN_VALUE
         self.color_map = color_map
         self.FRAME_DURATION = FRAME_DURATION
+        self.WORKERS = WORKERS or os.cpu_count() or 1
+        self.CACHE_PATH = CACHE_PATH or os.path.join(self.OUTPUT_PATH, '.boundary_cache')
+        self.store = default_store()
 
         if not os.path.exists(self.OUTPUT_PATH):
             os.makedirs(self.OUTPUT_PATH)
 
-        try:
-            self.world = gpd.read_file(self.SHAPEFILE_PATH)
-            
-        except Exception as e:
-            print(f"Failed to load shapefile: {str(e)}")
-            self.world = None
+        self._boundary_layers = {}
+        self.world = None
+
+    def _load_world(self):
+        if self.world is None:
+            try:
+                # geopandas is slow to import and only needed when the boundary cache misses.
+
+                import geopandas as gpd
+
+                self.world = gpd.read_file(self.SHAPEFILE_PATH)
+
+            except Exception as e:
+                print(f"Failed to load shapefile: {str(e)}")
+
+        return self.world
+
+    def boundary_layer(self):
+        width, height = self.RESOLUTION[:2]
+        key = self._boundary_key(width, height)
+
+        if key in self._boundary_layers:
+            return self._boundary_layers[key]
+
+        # The boundary only depends on the shapefile, the extent and the frame size, so it
+        # is rasterized once and reused by every frame and every later run.
+
+        cache_file = os.path.join(self.CACHE_PATH, f"{key}.npz") if key is not None else None
+        layer = None
+
+        if cache_file is not None and os.path.isfile(cache_file):
+            with np.load(cache_file) as cached:
+                layer = (cached['layer'], tuple(str(label) for label in cached['labels']))
+
+        elif self._load_world() is not None:
+            layer = rasterize_boundary(self.world, self.LON_RANGE, self.LAT_RANGE, width, height)
+
+            if cache_file is not None:
+                os.makedirs(self.CACHE_PATH, exist_ok=True)
+                np.savez(cache_file, layer=layer[0], labels=np.array(layer[1]))
+
+        self._boundary_layers[key] = layer
+
+        return layer
+
+    def _boundary_key(self, width, height):
+        if not os.path.isfile(self.SHAPEFILE_PATH):
+            return None
+
+        stat = os.stat(self.SHAPEFILE_PATH)
+        state = (BOUNDARY_CACHE_VERSION, os.path.abspath(self.SHAPEFILE_PATH), stat.st_size, stat.st_mtime_ns,
+                 tuple(self.LON_RANGE), tuple(self.LAT_RANGE), width, height, RENDER_DPI, matplotlib.__version__)
+
+        return hashlib.sha256(repr(state).encode()).hexdigest()[:24]
+
+    def _render_settings(self):
+        return {
+            'lon_range': tuple(self.LON_RANGE),
+            'lat_range': tuple(self.LAT_RANGE),
+            'resolution': tuple(self.RESOLUTION),
+            'transparency': self.TRANSPARENCY,
+            'min_value': self.MIN_VALUE,
+            'max_value': self.MAX_VALUE,
+            'color_map': self.color_map,
+            'frame_duration': self.FRAME_DURATION,
+        }
 
     def process_files(self, start_year, end_year):
+        outputs = self.render_files(start_year, end_year)
+
+        notify(f"Rendered {len(outputs)} plots for {start_year}-{end_year}")
+
+    def render_files(self, start_year, end_year):
+        tasks = []
+
         for file_name in self.scan_directory():
+            if not self._in_year_range(file_name, start_year, end_year):
+                continue
+
             nc_file = os.path.join(self.DIRECTORY_PATH, file_name)
             gif_filename = self.generate_output_filename(file_name)
-            gif_file_path = os.path.join(self.OUTPUT_PATH, gif_filename)
+            tasks.append((nc_file, os.path.join(self.OUTPUT_PATH, gif_filename)))
+
+        return self._run_tasks(_render_task, tasks)
+
+    def process_animations(self, start_year, end_year, frames='year', output_format='gif'):
+        groups = {}
+
+        # Files that only differ in their year prefix (2015_max.nc, 2016_max.nc, ...) form one
+        # animation, with frames in year order.
+
+        for file_name in self.scan_directory():
+            if not self._in_year_range(file_name, start_year, end_year):
+                continue
+
+            base_name = file_name.rsplit('.', 1)[0]
+            key = base_name[4:] if base_name[:4].isdigit() else f"_{base_name}"
+            groups.setdefault(key, []).append(os.path.join(self.DIRECTORY_PATH, file_name))
+
+        tasks = [(nc_files, os.path.join(self.OUTPUT_PATH, f"{start_year}-{end_year}{key}_{frames}.{output_format}"), frames)
+                 for key, nc_files in sorted(groups.items())]
+
+        self._run_tasks(_animation_task, tasks)
+
+        notify(f"Rendered {len(tasks)} animations for {start_year}-{end_year}")
+
+    def _run_tasks(self, task_function, tasks):
+        init_args = (self.boundary_layer(), self._render_settings())
+
+        if self.WORKERS <= 1 or len(tasks) <= 1:
+            _init_renderer(*init_args)
+
+            return [task_function(task) for task in tasks]
+
+        with ProcessPoolExecutor(max_workers=self.WORKERS, initializer=_init_renderer, initargs=init_args) as executor:
+            return list(executor.map(task_function, tasks))
 
-            print(f"Processing file: {file_name}")  
-            
-            self.create_gif(nc_file, gif_file_path, start_year, end_year)
-            self.verify_coordinates(nc_file)
-        
-        ws.Beep(frequency, duration)
+    @staticmethod
+    def _in_year_range(file_name, start_year, end_year):
+        prefix = file_name[:4]
+
+        return not prefix.isdigit() or start_year <= int(prefix) <= end_year
 
     def scan_directory(self):
-        return [file for file in os.listdir(self.DIRECTORY_PATH) if file.endswith('.nc')]
+        return sorted(file for file in os.listdir(self.DIRECTORY_PATH) if file.endswith('.nc'))
 
     def generate_output_filename(self, input_filename):
         base_filename = input_filename.rsplit('.', 1)[0]
-        
+
         return f"{base_filename}.gif"
-    
+
     def create_gif(self, nc_file, gif_file_path, start_year, end_year):
-        with nc.Dataset(nc_file) as dataset:
-            variable_name = list(dataset.variables.keys())[3]
-            lon = dataset.variables['lon'][:]
-            lat = dataset.variables['lat'][:]
-            data = dataset.variables[variable_name][:]
-
-            max_value = None
-            
-            if 'max_value' in dataset.variables:
-                max_value = dataset.variables['max_value'][:]
-            
-            for year in range(start_year, end_year + 1):
-                self.process_year_data(nc_file, data, lon, lat, year, gif_file_path, max_value, self.DIRECTORY_PATH)
-
-    def process_year_data(self, nc_file, data, lon, lat, year, gif_file_path, max_value=None, directory_path=None):
-        year_data = data[0]
-
-        fig, ax = plt.subplots(figsize=(self.RESOLUTION[0] / 100, self.RESOLUTION[1] / 100))
-        
-        if self.world is not None:
-            self.world.boundary.plot(ax=ax, linewidth=1, color='k')
-
-        im = ax.imshow(year_data[::-1, :], extent=(self.LON_RANGE[0], self.LON_RANGE[1], self.LAT_RANGE[0], self.LAT_RANGE[1]), cmap=self.color_map, alpha=self.TRANSPARENCY, vmax=self.MAX_VALUE)
-
-        with nc.Dataset(nc_file) as dataset:
-            variable_name = list(dataset.variables.keys())[3]
-            variable_units = dataset.variables[variable_name].units
-
-            time_var = dataset.variables['time']
-            year = int(time_var[0])
-
-        colorbar = fig.colorbar(im, ax=ax, label=f'{variable_name} ({variable_units})')
-        
-        title_text = f'Year: {year}'
-        title_text += f', Max Value: {max_value}'
-
-        ax.set_title(title_text)
-
-        with BytesIO() as buf:
-            plt.savefig(buf, format='png', dpi=self.RESOLUTION[2], bbox_inches='tight')
-            buf.seek(0)
-            frame = Image.open(buf)
-            frame = frame.resize(self.RESOLUTION[:2])
-            frame.save(gif_file_path, format='GIF')
-
-        plt.close(fig)
-        
-    def verify_coordinates(self, nc_file):
-        with nc.Dataset(nc_file) as dataset:
-            lon = dataset.variables['lon'][:]
-            lat = dataset.variables['lat'][:]
+        _init_renderer(self.boundary_layer(), self._render_settings())
+
+        return render_frame(nc_file, gif_file_path)
 
+    def verify_coordinates(self, nc_file):
+        lat, lon, _ = self.store.coordinates(nc_file)
         lon_grid, lat_grid = np.meshgrid(lon, lat)
 
-        fig, ax = plt.subplots()
-        
-        self.world.plot(ax=ax, color='white', edgecolor='black')
-        
-        ax.scatter(lon_grid, lat_grid, s=10, c='red', marker='o') 
-        
+        fig = Figure()
+        ax = fig.add_subplot()
+
+        if self._load_world() is not None:
+            self.world.plot(ax=ax, color='white', edgecolor='black')
+
+        ax.scatter(lon_grid, lat_grid, s=10, c='red', marker='o')
+
+        return fig
+
 if __name__ == "__main__":
-    
+
     processor = NCDataProcessor(
         DIRECTORY_PATH='./nc/GPvMSM_DownScaled/',
         SHAPEFILE_PATH='./shp/World_Countries_Generalized.shp',
         OUTPUT_PATH='./plot',
-        
+
         LON_RANGE=(120, 150),
         LAT_RANGE=(22.40, 47.60),
-        
+
         RESOLUTION=(1190, 1000, 800),
         TRANSPARENCY=0.7,
-        
+
         MAX_VALUE=5000,
-        
+
         color_map='coolwarm',
         FRAME_DURATION=125
     )
-    
-    frequency = 2500  
-    duration = 500  
-
-    ws.Beep(frequency, duration)
 
     START_YEAR = 2015
     END_YEAR = 2015
-    
-    processor.process_files(START_YEAR, END_YEAR)
\ No newline at end of file
+
+    # None renders one still image per file, 'year', 'month' or 'day' renders one animation per file group
+    ANIMATION_FRAMES = None
+    ANIMATION_FORMAT = 'gif'
+
+    if ANIMATION_FRAMES is None:
+        processor.process_files(START_YEAR, END_YEAR)
+    else:
+        processor.process_animations(START_YEAR, END_YEAR, ANIMATION_FRAMES, ANIMATION_FORMAT)
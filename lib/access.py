@@ -0,0 +1,177 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+import netCDF4 as nc
+
+from config import CUBE_CACHE_DIR, SUM_CHUNK_DAYS
+from manifest import fingerprint
+
+CUBE_CACHE_VERSION = 1
+
+def as_float_array(values):
+    if np.ma.isMaskedArray(values):
+        return np.ma.filled(values.astype(np.float32, copy=False), np.nan)
+
+    return np.asarray(values, dtype=np.float32)
+
+class CubeView:
+    def __init__(self, store, path, variable):
+        self.store = store
+        self.path = path
+        self.variable = variable
+
+        source = store.dataset(path).variables[variable]
+        self.shape = source.shape
+        self.dimensions = source.dimensions
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        mirror = self.store.mirror(self.path, self.variable)
+
+        if mirror is not None:
+            return mirror[key]
+
+        return as_float_array(self.store.dataset(self.path).variables[self.variable][key])
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.store.array(self.path, self.variable)
+
+        return values if dtype is None else values.astype(dtype)
+
+class CubeStore:
+    def __init__(self, cache_dir=CUBE_CACHE_DIR, chunk_days=SUM_CHUNK_DAYS):
+        self.cache_dir = cache_dir or None
+        self.chunk_days = max(1, int(chunk_days))
+
+        self.datasets = {}
+        self.mirrors = {}
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def dataset(self, path):
+        key = os.path.abspath(path)
+        current = fingerprint(key)
+        entry = self.datasets.get(key)
+
+        if entry is not None and entry[1] == current:
+            return entry[0]
+
+        if entry is not None:
+            self.release(path)
+
+        dataset = nc.Dataset(key, mode='r')
+        self.datasets[key] = (dataset, current)
+
+        return dataset
+
+    def view(self, path, variable):
+        return CubeView(self, path, variable)
+
+    def array(self, path, variable):
+        mirror = self.mirror(path, variable)
+
+        if mirror is not None:
+            return mirror
+
+        return as_float_array(self.dataset(path).variables[variable][:])
+
+    def coordinates(self, path):
+        variables = self.dataset(path).variables
+
+        return tuple(as_float_array(variables[name][:]) for name in ('lat', 'lon', 'time'))
+
+    def mirror(self, path, variable):
+        if self.cache_dir is None:
+            return None
+
+        source = self.dataset(path)
+        key = (os.path.abspath(path), variable)
+        mirror = self.mirrors.get(key)
+
+        if mirror is not None:
+            return mirror
+
+        # The mirror is a plain float32 .npy beside a sidecar recording which version of
+        # the source it was built from, so it is rebuilt when the NetCDF file changes.
+
+        base = os.path.join(self.cache_dir, self._mirror_name(*key))
+        state = {'version': CUBE_CACHE_VERSION, 'source': fingerprint(key[0]),
+                 'shape': list(source.variables[variable].shape)}
+
+        if not self._mirror_matches(base, state):
+            self._write_mirror(source.variables[variable], base, state)
+
+        mirror = np.load(f"{base}.npy", mmap_mode='r')
+        self.mirrors[key] = mirror
+
+        return mirror
+
+    @staticmethod
+    def _mirror_name(path, variable):
+        digest = hashlib.sha256(path.encode()).hexdigest()[:16]
+
+        return f"{os.path.basename(path).split('.')[0]}_{variable}_{digest}"
+
+    @staticmethod
+    def _mirror_matches(base, state):
+        try:
+            with open(f"{base}.json", 'r') as file:
+                return json.load(file) == state and os.path.isfile(f"{base}.npy")
+
+        except (OSError, ValueError):
+            return False
+
+    def _write_mirror(self, source, base, state):
+        logging.info(f"Mirroring {source.name} of {state['shape']} to {base}.npy")
+
+        temp_path = f"{base}.tmp.npy"
+        target = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.float32, shape=source.shape)
+
+        if source.ndim == 0:
+            target[...] = as_float_array(source[...])
+
+        else:
+            for start in range(0, source.shape[0], self.chunk_days):
+                stop = min(start + self.chunk_days, source.shape[0])
+                target[start:stop] = as_float_array(source[start:stop])
+
+        target.flush()
+        del target
+
+        os.replace(temp_path, f"{base}.npy")
+
+        with open(f"{base}.json", 'w') as file:
+            json.dump(state, file)
+
+    def release(self, path):
+        key = os.path.abspath(path)
+        entry = self.datasets.pop(key, None)
+
+        for mirror_key in [mirror_key for mirror_key in self.mirrors if mirror_key[0] == key]:
+            del self.mirrors[mirror_key]
+
+        if entry is not None:
+            entry[0].close()
+
+    def close(self):
+        for path in list(self.datasets):
+            self.release(path)
+
+_default_store = None
+
+def default_store():
+    global _default_store
+
+    if _default_store is None:
+        _default_store = CubeStore()
+
+    return _default_store
@@ -6,16 +6,99 @@ load_dotenv(dotenv_path)
 
 PROCESS_YEAR = os.environ.get('PROCESS_YEAR', '2015')  
 DOWNSCALING_METHOD = os.environ.get('DOWNSCALING_METHOD', 'max')
+DATA_DIR = os.environ.get('DATA_DIR', './nc')
 
 BASE_URL = os.environ.get('BASE_URL', 'http://database.rish.kyoto-u.ac.jp/arch/jmadata/data/gpv/netcdf/MSM-S/r1h/')
 
-START_DATE = f"{PROCESS_YEAR}/01/01"
-END_DATE = f"{PROCESS_YEAR}/12/31"
-DOWNLOAD_FOLDER = f'./nc/GPvMSM/{PROCESS_YEAR}'
-INPUT_FILE = f'./nc/GPvMSM_year/{PROCESS_YEAR}.nc'
-INPUT_FILE_SUM = f'./nc/GPvMSM_year/{PROCESS_YEAR}_sum.nc'
-OUTPUT_FILE = f'./nc/GPvMSM_DownScaled/{PROCESS_YEAR}_{DOWNSCALING_METHOD}.nc'
+def get_year_paths(year, downscaling_method=DOWNSCALING_METHOD, data_dir=DATA_DIR):
+    return {
+        'START_DATE': f"{year}/01/01",
+        'END_DATE': f"{year}/12/31",
+        'DOWNLOAD_FOLDER': f'{data_dir}/GPvMSM/{year}',
+        'INPUT_FILE': f'{data_dir}/GPvMSM_year/{year}.nc',
+        'INPUT_FILE_SUM': f'{data_dir}/GPvMSM_year/{year}_sum.nc',
+        'OUTPUT_FILE': f'{data_dir}/GPvMSM_DownScaled/{year}_{downscaling_method}.nc',
+        'OUTPUT_FILE_DAILY': f'{data_dir}/GPvMSM_DownScaled/{year}_daily_{downscaling_method}.nc',
+        'INPUT_FILE_ROLLUP': f'{data_dir}/GPvMSM_year/{year}_rollup.nc',
+        'OUTPUT_FILE_ROLLUP': f'{data_dir}/GPvMSM_DownScaled/{year}_rollup_{downscaling_method}.nc',
+        'OUTPUT_FILE_EXTREMES': f'{data_dir}/GPvMSM_year/{year}_extremes.nc',
+    }
 
 LAT_GRID_SIZE = float(os.environ.get('LAT_GRID_SIZE', 0.50))
 LON_GRID_SIZE = float(os.environ.get('LON_GRID_SIZE', 0.50))
-COLLECTION_VALUE = float(os.environ.get('COLLECTION_VALUE', 1))
\ No newline at end of file
+COLLECTION_VALUE = float(os.environ.get('COLLECTION_VALUE', 1))
+
+DOWNLOAD_WORKERS = int(os.environ.get('DOWNLOAD_WORKERS', 8))
+DOWNLOAD_PER_HOST_LIMIT = int(os.environ.get('DOWNLOAD_PER_HOST_LIMIT', 4))
+DOWNLOAD_QUEUE_SIZE = int(os.environ.get('DOWNLOAD_QUEUE_SIZE', 32))
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get('DOWNLOAD_CHUNK_SIZE', 1024 * 1024))
+DOWNLOAD_RETRIES = int(os.environ.get('DOWNLOAD_RETRIES', 5))
+DOWNLOAD_BACKOFF = float(os.environ.get('DOWNLOAD_BACKOFF', 2.0))
+DOWNLOAD_CHECKSUM = os.environ.get('DOWNLOAD_CHECKSUM', 'sha256')
+
+PROCESS_STREAMING = os.environ.get('PROCESS_STREAMING', 'true').lower() in ('1', 'true', 'yes')
+PROCESS_WORKERS = int(os.environ.get('PROCESS_WORKERS', 0))
+
+SUM_CHUNK_DAYS = int(os.environ.get('SUM_CHUNK_DAYS', 31))
+WET_DAY_THRESHOLD = float(os.environ.get('WET_DAY_THRESHOLD', 1.0))
+
+REGRID_CACHE_DIR = os.environ.get('REGRID_CACHE_DIR', './nc/.regrid_cache')
+REGRID_CACHE_MAX_BYTES = int(os.environ.get('REGRID_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+DOWNSCALING_METHODS = [method.strip() for method in os.environ.get('DOWNSCALING_METHODS', '').split(',') if method.strip()]
+DOWNSCALING_GRID_SIZES = [float(size) for size in os.environ.get('DOWNSCALING_GRID_SIZES', '').split(',') if size.strip()]
+DOWNSCALING_TILE_SIZE = int(os.environ.get('DOWNSCALING_TILE_SIZE', 0))
+DOWNSCALING_TILE_STEPS = int(os.environ.get('DOWNSCALING_TILE_STEPS', 31))
+DOWNSCALING_WORKERS = int(os.environ.get('DOWNSCALING_WORKERS', 0))
+DOWNSCALING_DAILY = os.environ.get('DOWNSCALING_DAILY', 'false').lower() in ('1', 'true', 'yes')
+
+BUILD_FINGERPRINT = os.environ.get('BUILD_FINGERPRINT', 'stat')
+
+STORAGE_PROFILE = os.environ.get('STORAGE_PROFILE', 'map')
+
+ROLLUP_WINDOWS = [window.strip() for window in os.environ.get('ROLLUP_WINDOWS', '').split(',') if window.strip()]
+
+CUBE_CACHE_DIR = os.environ.get('CUBE_CACHE_DIR', '')
+
+EXTREMES_ENABLED = os.environ.get('EXTREMES_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+EXTREME_THRESHOLDS = [float(value) for value in os.environ.get('EXTREME_THRESHOLDS', '10,20,30,50').split(',') if value.strip()]
+EXTREME_WINDOWS = [int(value) for value in os.environ.get('EXTREME_WINDOWS', '3,24').split(',') if value.strip()]
+EXTREME_PERCENTILES = [float(value) for value in os.environ.get('EXTREME_PERCENTILES', '95,99').split(',') if value.strip()]
+EXTREME_HISTOGRAM_BINS = int(os.environ.get('EXTREME_HISTOGRAM_BINS', 64))
+
+METRICS_REPORT = os.environ.get('METRICS_REPORT', '')
+METRICS_PROMETHEUS = os.environ.get('METRICS_PROMETHEUS', '')
+METRICS_PROFILE = [name.strip().lower() for name in os.environ.get('METRICS_PROFILE', '').split(',') if name.strip()]
+
+NOTIFY = os.environ.get('NOTIFY', 'beep')
+
+SERVICE_HOST = os.environ.get('SERVICE_HOST', '127.0.0.1')
+SERVICE_PORT = int(os.environ.get('SERVICE_PORT', 8080))
+SERVICE_CACHE_BYTES = int(os.environ.get('SERVICE_CACHE_BYTES', 512 * 1024 * 1024))
+
+STAGE_SETTINGS = (
+    'DATA_DIR', 'BASE_URL',
+    'DOWNLOAD_WORKERS', 'DOWNLOAD_PER_HOST_LIMIT', 'DOWNLOAD_QUEUE_SIZE', 'DOWNLOAD_CHUNK_SIZE',
+    'DOWNLOAD_RETRIES', 'DOWNLOAD_BACKOFF', 'DOWNLOAD_CHECKSUM',
+    'PROCESS_STREAMING', 'PROCESS_WORKERS', 'SUM_CHUNK_DAYS', 'WET_DAY_THRESHOLD',
+    'STORAGE_PROFILE', 'BUILD_FINGERPRINT', 'REGRID_CACHE_DIR', 'REGRID_CACHE_MAX_BYTES',
+    'DOWNSCALING_METHOD', 'DOWNSCALING_METHODS', 'DOWNSCALING_GRID_SIZES', 'LAT_GRID_SIZE', 'LON_GRID_SIZE',
+    'DOWNSCALING_TILE_SIZE', 'DOWNSCALING_TILE_STEPS', 'DOWNSCALING_WORKERS', 'DOWNSCALING_DAILY',
+    'ROLLUP_WINDOWS', 'EXTREMES_ENABLED', 'EXTREME_THRESHOLDS', 'EXTREME_WINDOWS', 'EXTREME_PERCENTILES',
+    'EXTREME_HISTOGRAM_BINS',
+)
+
+def get_settings(overrides=None):
+    # The stage parameters as one dict keyed like the variables above, so a caller can run the
+    # pipeline with its own values without touching the environment or these globals.
+
+    overrides = dict(overrides or {})
+    unknown = [name for name in overrides if name not in STAGE_SETTINGS]
+
+    if unknown:
+        raise ValueError(f"Unknown settings: {', '.join(unknown)}")
+
+    settings = {name: globals()[name] for name in STAGE_SETTINGS}
+    settings.update(overrides)
+
+    return settings
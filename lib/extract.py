@@ -0,0 +1,307 @@
+import os
+import csv
+import json
+import time
+import logging
+import argparse
+import numpy as np
+import netCDF4 as nc
+
+from config import PROCESS_YEAR, SUM_CHUNK_DAYS, get_year_paths
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+EXTRACTION_METHODS = ('nearest', 'bilinear')
+REGULAR_AXIS_TOLERANCE = 1e-4
+
+class GridAxis:
+    def __init__(self, values):
+        self.values = np.ma.getdata(values).astype(np.float64)
+        self.size = len(self.values)
+        self.start = self.values[0]
+        self.step = (self.values[-1] - self.values[0]) / (self.size - 1) if self.size > 1 else 1.0
+
+        steps = np.diff(self.values)
+        self.regular = self.size > 1 and np.allclose(steps, self.step, rtol=0, atol=abs(self.step) * REGULAR_AXIS_TOLERANCE)
+
+    def fractional_index(self, coords):
+        coords = np.asarray(coords, dtype=np.float64)
+
+        if self.regular:
+            # float32 grid values sit slightly off the regular axis; points that close to a grid
+            # line are snapped onto it so they take their whole weight from it.
+
+            position = (coords - self.start) / self.step
+            snapped = np.rint(position)
+
+            return np.where(np.abs(position - snapped) <= REGULAR_AXIS_TOLERANCE, snapped, position)
+
+        # Monotonic but irregular axes (ascending or descending) fall back to a binary search.
+
+        order = np.argsort(self.values)
+
+        return np.interp(coords, self.values[order], order.astype(np.float64), left=np.nan, right=np.nan)
+
+    def nearest(self, coords):
+        position = self.fractional_index(coords)
+        valid = (position >= -0.5) & (position <= self.size - 0.5)
+        index = np.clip(np.rint(np.where(valid, position, 0)), 0, self.size - 1).astype(np.int64)
+
+        return index, valid
+
+    def bracket(self, coords):
+        position = self.fractional_index(coords)
+        valid = (position >= 0) & (position <= self.size - 1)
+        position = np.where(valid, position, 0)
+
+        lower = np.clip(np.floor(position), 0, max(self.size - 2, 0)).astype(np.int64)
+
+        return lower, position - lower, valid
+
+class GridIndex:
+    def __init__(self, lat, lon):
+        self.lat_axis = GridAxis(lat)
+        self.lon_axis = GridAxis(lon)
+
+    @property
+    def shape(self):
+        return self.lat_axis.size, self.lon_axis.size
+
+    def nearest(self, lats, lons):
+        rows, lat_valid = self.lat_axis.nearest(lats)
+        cols, lon_valid = self.lon_axis.nearest(lons)
+
+        return rows[:, None], cols[:, None], np.where(lat_valid & lon_valid, 1.0, 0.0)[:, None]
+
+    def bilinear(self, lats, lons):
+        row, lat_weight, lat_valid = self.lat_axis.bracket(lats)
+        col, lon_weight, lon_valid = self.lon_axis.bracket(lons)
+
+        rows = np.stack([row, row, row + 1, row + 1], axis=1)
+        cols = np.stack([col, col + 1, col, col + 1], axis=1)
+        weights = np.stack([(1 - lat_weight) * (1 - lon_weight), (1 - lat_weight) * lon_weight,
+                            lat_weight * (1 - lon_weight), lat_weight * lon_weight], axis=1)
+
+        weights[~(lat_valid & lon_valid)] = 0.0
+
+        return rows, cols, weights
+
+    def region_cells(self, region):
+        region = np.asarray(region, dtype=np.float64)
+        lats = self.lat_axis.values
+        lons = self.lon_axis.values
+
+        # A flat (lon_min, lat_min, lon_max, lat_max) box, or a polygon of (lon, lat) vertices.
+
+        if region.shape == (4,):
+            lon_min, lat_min, lon_max, lat_max = region
+
+        else:
+            lon_min, lat_min = region.min(axis=0)
+            lon_max, lat_max = region.max(axis=0)
+
+        rows = np.flatnonzero((lats >= lat_min) & (lats <= lat_max))
+        cols = np.flatnonzero((lons >= lon_min) & (lons <= lon_max))
+        rows, cols = [axis.ravel() for axis in np.meshgrid(rows, cols, indexing='ij')]
+
+        if region.shape != (4,):
+            inside = points_in_polygon(lons[cols], lats[rows], region)
+            rows, cols = rows[inside], cols[inside]
+
+        return rows, cols
+
+def points_in_polygon(x, y, vertices):
+    inside = np.zeros(x.shape, dtype=bool)
+    x0, y0 = vertices[-1]
+
+    for x1, y1 in vertices:
+        crosses = (y1 > y) != (y0 > y)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+
+        inside ^= crosses & (x < x_cross)
+        x0, y0 = x1, y1
+
+    return inside
+
+def read_cells(variable, rows, cols, chunk_days=SUM_CHUNK_DAYS):
+    times = variable.shape[0]
+    values = np.empty((times, len(rows)), dtype=np.float32)
+
+    if len(rows) == 0:
+        return values
+
+    # Cells closer together than one chunk are read as a single hyperslab, so compressed
+    # chunks are decompressed once per time window rather than once per point. Contiguous
+    # NetCDF4 variables report 'contiguous' and NetCDF3 variables None.
+
+    chunking = variable.chunking()
+    chunk_shape = chunking if isinstance(chunking, (list, tuple)) else (1, 1, 1)
+    window = -(-chunk_days // chunk_shape[0]) * chunk_shape[0]
+
+    for tile in _cell_tiles(rows, cols, chunk_shape[1], chunk_shape[2]):
+        row_start, col_start = rows[tile].min(), cols[tile].min()
+        row_stop, col_stop = rows[tile].max() + 1, cols[tile].max() + 1
+
+        local_rows = rows[tile] - row_start
+        local_cols = cols[tile] - col_start
+
+        for start in range(0, times, window):
+            stop = min(start + window, times)
+            block = variable[start:stop, row_start:row_stop, col_start:col_stop]
+            block = np.ma.filled(np.ma.asarray(block, dtype=np.float32), np.nan)
+
+            values[start:stop, tile] = block[:, local_rows, local_cols]
+
+    return values
+
+def _split_by_gap(positions, members, gap):
+    order = np.argsort(positions[members], kind='stable')
+    members = members[order]
+    breaks = np.flatnonzero(np.diff(positions[members]) > gap) + 1
+
+    return np.split(members, breaks)
+
+def _cell_tiles(rows, cols, row_gap, col_gap):
+    for band in _split_by_gap(rows, np.arange(len(rows)), row_gap):
+        yield from _split_by_gap(cols, band, col_gap)
+
+def weighted_series(cell_values, owners, weights, count):
+    valid = ~np.isnan(cell_values)
+    weighted = np.where(valid, cell_values * weights, 0.0)
+    norms = np.where(valid, weights, 0.0)
+
+    series = np.full((cell_values.shape[0], count), np.nan, dtype=np.float32)
+
+    if len(owners) == 0:
+        return series
+
+    present, starts = np.unique(owners, return_index=True)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        series[:, present] = np.add.reduceat(weighted, starts, axis=1) / np.add.reduceat(norms, starts, axis=1)
+
+    return series
+
+class SeriesExtractor:
+    def __init__(self, input_files, variable='r1d', chunk_days=SUM_CHUNK_DAYS):
+        self.input_files = list(input_files)
+        self.variable = variable
+        self.chunk_days = max(1, int(chunk_days))
+
+        self.cells_read = 0
+
+    @classmethod
+    def for_years(cls, years, **kwargs):
+        return cls([get_year_paths(year)['INPUT_FILE'] for year in years], **kwargs)
+
+    def points(self, lats, lons, method='nearest'):
+        if method not in EXTRACTION_METHODS:
+            raise ValueError(f"Invalid extraction method: {method}")
+
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+
+        def select(index):
+            rows, cols, weights = getattr(index, method)(lats, lons)
+            owners = np.repeat(np.arange(len(lats)), rows.shape[1])
+
+            return rows.ravel(), cols.ravel(), weights.ravel(), owners
+
+        return self._extract(select, len(lats))
+
+    def regions(self, regions):
+        regions = list(regions)
+
+        def select(index):
+            cells = [index.region_cells(region) for region in regions]
+            rows = np.concatenate([region_rows for region_rows, _ in cells]).astype(np.int64)
+            cols = np.concatenate([region_cols for _, region_cols in cells]).astype(np.int64)
+            owners = np.repeat(np.arange(len(regions)), [len(region_rows) for region_rows, _ in cells])
+
+            return rows, cols, np.ones(len(rows)), owners
+
+        return self._extract(select, len(regions))
+
+    def _extract(self, select, count):
+        dates = []
+        series = []
+
+        for input_file in self.input_files:
+            with nc.Dataset(input_file, mode='r') as ds:
+                index = GridIndex(ds.variables['lat'][:], ds.variables['lon'][:])
+                rows, cols, weights, owners = select(index)
+
+                # Neighbouring points share cells; each distinct cell is read once.
+
+                lon_len = index.shape[1]
+                cells, inverse = np.unique(rows * lon_len + cols, return_inverse=True)
+                cell_values = read_cells(ds.variables[self.variable], cells // lon_len, cells % lon_len, self.chunk_days)
+                self.cells_read += len(cells)
+
+                series.append(weighted_series(cell_values[:, inverse.ravel()], owners, weights, count))
+                dates.append(self._file_dates(input_file, ds.variables['time'][:]))
+
+        if not series:
+            return np.array([], dtype='datetime64[D]'), np.empty((0, count), dtype=np.float32)
+
+        return np.concatenate(dates), np.concatenate(series, axis=0)
+
+    @staticmethod
+    def _file_dates(input_file, days):
+        stem = os.path.basename(input_file).split('.')[0]
+        year = int(stem) if stem.isdigit() else int(PROCESS_YEAR)
+
+        return np.datetime64(f"{year:04d}-01-01") + (np.ma.getdata(days).astype(np.int64) - 1)
+
+def load_points(path):
+    with open(path, 'r', newline='') as file:
+        rows = list(csv.DictReader(file))
+
+    return [row['name'] for row in rows], [float(row['lat']) for row in rows], [float(row['lon']) for row in rows]
+
+def write_series(path, names, dates, values):
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['date'] + list(names))
+
+        for date, row in zip(dates, values):
+            writer.writerow([str(date)] + ['' if np.isnan(value) else f"{value:.2f}" for value in row])
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract daily rainfall series for points or regions from the yearly r1d files")
+    parser.add_argument('start_year', type=int)
+    parser.add_argument('end_year', type=int)
+    parser.add_argument('--points', default=None, help="CSV with name, lat and lon columns")
+    parser.add_argument('--regions', default=None,
+                        help="JSON object mapping names to [lon_min, lat_min, lon_max, lat_max] or [[lon, lat], ...] polygons")
+    parser.add_argument('--method', default='nearest', choices=EXTRACTION_METHODS, help="point interpolation")
+    parser.add_argument('--output', required=True, help="CSV written with one column per point or region")
+    args = parser.parse_args()
+
+    if (args.points is None) == (args.regions is None):
+        parser.error("exactly one of --points or --regions is required")
+
+    extractor = SeriesExtractor.for_years(range(args.start_year, args.end_year + 1))
+    start_time = time.perf_counter()
+
+    if args.points:
+        names, lats, lons = load_points(args.points)
+        dates, values = extractor.points(lats, lons, args.method)
+
+    else:
+        with open(args.regions, 'r') as file:
+            regions = json.load(file)
+
+        names = list(regions)
+        dates, values = extractor.regions(regions.values())
+
+    elapsed = time.perf_counter() - start_time
+    logging.info(f"EXTRACT : {len(names)} series x {len(dates)} days in {elapsed:.2f}s "
+                 f"({len(names) / max(elapsed, 1e-9):.0f} series/s, {extractor.cells_read} cells read)")
+
+    write_series(args.output, names, dates, values)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import os
+import logging
+import numpy as np
+import netCDF4 as nc
+
+from datetime import datetime, timedelta
+
+from config import (BUILD_FINGERPRINT, STORAGE_PROFILE, EXTREME_THRESHOLDS, EXTREME_WINDOWS,
+                    EXTREME_PERCENTILES, EXTREME_HISTOGRAM_BINS)
+from access import as_float_array
+from manifest import BuildManifest
+from storage import create_data_variable, storage_values
+
+WET_HOUR_THRESHOLD = 0.1
+HISTOGRAM_MAX = 200.0
+EXTREMES_PACK_SCALE = 0.1
+
+def histogram_edges(bins, lower=WET_HOUR_THRESHOLD, upper=HISTOGRAM_MAX):
+    return (lower * (upper / lower) ** (np.arange(bins) / (bins - 1))).astype(np.float32)
+
+class HourlyExtremes:
+    def __init__(self, shape, thresholds=EXTREME_THRESHOLDS, windows=EXTREME_WINDOWS, bins=EXTREME_HISTOGRAM_BINS):
+        self.shape = tuple(shape)
+        self.thresholds = [float(threshold) for threshold in thresholds]
+        self.windows = sorted(int(window) for window in windows)
+
+        self.max_hourly = np.full(self.shape, -np.inf, dtype=np.float32)
+        self.max_window = {window: np.full(self.shape, -np.inf) for window in self.windows}
+        self.exceedances = np.zeros((len(self.thresholds),) + self.shape, dtype=np.int32)
+        self.valid_hours = np.zeros(self.shape, dtype=np.int32)
+
+        # Wet hours go into a fixed geometric histogram per cell. A year has at most
+        # 8784 hours, so uint16 counts are enough and memory stays bounded by the bin count.
+
+        self.edges = histogram_edges(max(2, int(bins)))
+        self.histogram = np.zeros((len(self.edges), int(np.prod(self.shape))), dtype=np.uint16)
+        self.carry = None
+
+    def update_day(self, hourly_rain):
+        values = as_float_array(hourly_rain)
+        valid = ~np.isnan(values)
+        filled = np.where(valid, values, 0).astype(np.float32)
+
+        self.valid_hours += valid.sum(axis=0, dtype=np.int32)
+        np.maximum(self.max_hourly, np.where(valid, values, -np.inf).max(axis=0), out=self.max_hourly)
+
+        for index, threshold in enumerate(self.thresholds):
+            self.exceedances[index] += (filled >= threshold).sum(axis=0, dtype=np.int32)
+
+        self._update_windows(filled)
+        self._update_histogram(filled)
+
+    def skip_day(self):
+        self.carry = None
+
+    def _update_windows(self, filled):
+        if not self.windows:
+            return
+
+        # Rolling sums continue across midnight through the last hours of the previous day.
+
+        series = filled if self.carry is None else np.concatenate([self.carry, filled])
+        cumulative = np.empty((len(series) + 1,) + self.shape)
+        cumulative[0] = 0
+
+        # Row-by-row adds are several times faster than np.cumsum along the leading axis.
+
+        for hour, values in enumerate(series):
+            np.add(cumulative[hour], values, out=cumulative[hour + 1])
+
+        first_hour = len(series) - len(filled)
+        window_sum = np.empty(self.shape)
+
+        for window in self.windows:
+            for end in range(max(window, first_hour + 1), len(series) + 1):
+                np.subtract(cumulative[end], cumulative[end - window], out=window_sum)
+                np.maximum(self.max_window[window], window_sum, out=self.max_window[window])
+
+        self.carry = series[len(series) - (self.windows[-1] - 1):] if self.windows[-1] > 1 else None
+
+    def _update_histogram(self, filled):
+        for hour in filled.reshape(len(filled), -1):
+            wet = np.flatnonzero(hour >= WET_HOUR_THRESHOLD)
+            bins = np.searchsorted(self.edges, hour[wet], side='right') - 1
+
+            self.histogram[bins, wet] += 1
+
+    def percentile(self, q):
+        counts = self.histogram.astype(np.int32)
+        total = counts.sum(axis=0)
+        cumulative = np.cumsum(counts, axis=0)
+        target = q / 100.0 * total
+
+        bins = np.minimum((cumulative < target).sum(axis=0), len(self.edges) - 1)
+        below = np.where(bins > 0, np.take_along_axis(cumulative, np.maximum(bins - 1, 0)[None], axis=0)[0], 0)
+        in_bin = np.take_along_axis(counts, bins[None], axis=0)[0]
+
+        # The open top bin is closed by the cell's own hourly maximum.
+
+        max_hourly = self.max_hourly.ravel()
+        upper = np.where(bins + 1 < len(self.edges), self.edges[np.minimum(bins + 1, len(self.edges) - 1)], max_hourly)
+        upper = np.minimum(upper, max_hourly)
+        lower = np.minimum(self.edges[bins], upper)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            value = lower + (upper - lower) * (target - below) / in_bin
+
+        return np.where(total > 0, value, np.nan).reshape(self.shape).astype(np.float32)
+
+    def result(self, percentiles=EXTREME_PERCENTILES):
+        no_data = self.valid_hours == 0
+        results = {'max_hourly': np.where(no_data, np.nan, self.max_hourly)}
+
+        for window in self.windows:
+            results[f'max_{window}h'] = np.where(no_data | np.isinf(self.max_window[window]), np.nan,
+                                                 self.max_window[window]).astype(np.float32)
+
+        for index, threshold in enumerate(self.thresholds):
+            results[f'hours_over_{threshold:g}mm'] = self.exceedances[index].copy()
+
+        for q in percentiles:
+            results[f'p{float(q):g}_hourly'] = self.percentile(float(q))
+
+        results['wet_hours'] = self.histogram.sum(axis=0, dtype=np.int32).reshape(self.shape)
+        results['valid_hours'] = self.valid_hours.copy()
+
+        return results
+
+def variable_attributes(name):
+    if name == 'max_hourly':
+        return 'mm/h', 'Maximum hourly precipitation'
+
+    if name.startswith('max_'):
+        return 'mm', f"Maximum {name[4:-1]}-hour rolling precipitation"
+
+    if name.startswith('hours_over_'):
+        return 'hours', f"Hours at or above {name[11:-2]} mm/h"
+
+    if name.startswith('p') and name.endswith('_hourly'):
+        return 'mm/h', f"Approximate {name[1:-7]}th percentile of wet-hour precipitation"
+
+    return 'hours', {'wet_hours': f"Hours at or above {WET_HOUR_THRESHOLD} mm/h", 'valid_hours': "Hours with valid data"}[name]
+
+class ExtremesBuilder:
+    def __init__(self, year, download_folder, output_file, thresholds=EXTREME_THRESHOLDS, windows=EXTREME_WINDOWS,
+                 percentiles=EXTREME_PERCENTILES, bins=EXTREME_HISTOGRAM_BINS, storage_profile=STORAGE_PROFILE,
+                 fingerprint=BUILD_FINGERPRINT):
+        self.year = int(year)
+        self.base_dir = download_folder
+        self.output_file = output_file
+
+        self.thresholds = [float(threshold) for threshold in thresholds]
+        self.windows = [int(window) for window in windows]
+        self.percentiles = [float(q) for q in percentiles]
+        self.bins = int(bins)
+        self.storage_profile = storage_profile
+        self.fingerprint = fingerprint
+
+        os.makedirs(os.path.dirname(self.output_file), exist_ok=True)
+
+    def _daily_file_paths(self):
+        days = (datetime(self.year + 1, 1, 1) - datetime(self.year, 1, 1)).days
+
+        return [os.path.join(self.base_dir, f'{(datetime(self.year, 1, 1) + timedelta(days=day)).strftime("%Y%m%d")}.nc')
+                for day in range(days)]
+
+    def _manifest_state(self, file_paths):
+        params = {
+            'thresholds': self.thresholds,
+            'windows': self.windows,
+            'percentiles': self.percentiles,
+            'bins': self.bins,
+            'storage_profile': self.storage_profile,
+        }
+
+        return {os.path.basename(file_path): file_path for file_path in file_paths}, params
+
+    def build(self):
+        file_paths = self._daily_file_paths()
+        manifest = BuildManifest(self.output_file, self.fingerprint)
+
+        if manifest.is_up_to_date(*self._manifest_state(file_paths)):
+            logging.info(f"EXTREMES : {self.output_file} is up to date. Skipping processing.")
+            return self.output_file
+
+        accumulator = lat = lon = None
+        missing_files = []
+
+        for file_path in file_paths:
+            if not os.path.isfile(file_path):
+                missing_files.append(os.path.basename(file_path))
+
+                if accumulator is not None:
+                    accumulator.skip_day()
+
+                continue
+
+            with nc.Dataset(file_path, 'r') as data:
+                if accumulator is None:
+                    lat = data.variables['lat'][:]
+                    lon = data.variables['lon'][:]
+                    accumulator = HourlyExtremes((len(lat), len(lon)), self.thresholds, self.windows, self.bins)
+
+                accumulator.update_day(data.variables['r1h'][:])
+
+            logging.info(f"EXTREMES : Processed {file_path}")
+
+        if missing_files:
+            logging.warning(f"EXTREMES : {len(missing_files)} hourly files missing, rolling windows restart after each gap")
+
+        if accumulator is None:
+            logging.error(f"EXTREMES : No hourly files found in {self.base_dir}")
+            return None
+
+        self._save_data(accumulator.result(self.percentiles), lat, lon)
+        manifest.record(*self._manifest_state(file_paths))
+
+        logging.info(f"EXTREMES : Data saved successfully to {self.output_file}")
+        return self.output_file
+
+    def _save_data(self, results, lat, lon):
+        temp_file = f"{self.output_file}.tmp"
+
+        with nc.Dataset(temp_file, 'w', format='NETCDF4') as new_nc:
+            new_nc.createDimension('lat', len(lat))
+            new_nc.createDimension('lon', len(lon))
+            new_nc.createDimension('time', 1)
+
+            latitudes = new_nc.createVariable('lat', 'f4', ('lat',))
+            longitudes = new_nc.createVariable('lon', 'f4', ('lon',))
+            time = new_nc.createVariable('time', 'i4', ('time',))
+
+            latitudes[:] = lat
+            longitudes[:] = lon
+            time[:] = [self.year]
+
+            latitudes.units = 'degree_north'
+            longitudes.units = 'degree_east'
+            time.units = 'years'
+
+            for name, values in results.items():
+                dtype = 'f4' if values.dtype.kind == 'f' else 'i4'
+                variable = create_data_variable(new_nc, name, dtype, ('time', 'lat', 'lon',), self.storage_profile,
+                                                pack_scale=EXTREMES_PACK_SCALE)
+                variable[0, :, :] = storage_values(variable, values)
+                variable.units, variable.long_name = variable_attributes(name)
+
+            new_nc.description = "Annual hourly precipitation extremes"
+            new_nc.histogram_bins = self.bins
+
+        os.replace(temp_file, self.output_file)
@@ -0,0 +1,85 @@
+import os
+import json
+import hashlib
+import logging
+
+MANIFEST_VERSION = 1
+
+def fingerprint(path, mode='stat'):
+    if not os.path.isfile(path):
+        return None
+
+    stat = os.stat(path)
+    result = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    if mode == 'sha256':
+        hasher = hashlib.sha256()
+
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                hasher.update(block)
+
+        result = {'size': stat.st_size, 'sha256': hasher.hexdigest()}
+
+    return result
+
+class BuildManifest:
+    def __init__(self, product_path, mode='stat'):
+        self.product_path = product_path
+        self.mode = mode
+        self.path = os.path.join(os.path.dirname(product_path), f".{os.path.basename(product_path)}.manifest.json")
+        self.entry = self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return None
+
+        try:
+            with open(self.path, 'r') as file:
+                entry = json.load(file)
+
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable build manifest {self.path}: {e}")
+            return None
+
+        if entry.get('version') != MANIFEST_VERSION or entry.get('mode') != self.mode:
+            return None
+
+        return entry
+
+    def fingerprints(self, inputs):
+        return {name: fingerprint(path, self.mode) for name, path in inputs.items()}
+
+    def product_matches(self):
+        return self.entry is not None and self.entry.get('product') == fingerprint(self.product_path, 'stat')
+
+    def params_match(self, params):
+        return self.entry is not None and self.entry.get('params') == json.loads(json.dumps(params))
+
+    def changed_inputs(self, inputs):
+        recorded = self.entry.get('inputs', {}) if self.entry is not None else {}
+        current = self.fingerprints(inputs)
+
+        return [name for name in inputs if recorded.get(name) != current[name]]
+
+    def is_up_to_date(self, inputs, params):
+        if not self.product_matches() or not self.params_match(params):
+            return False
+
+        return not self.changed_inputs(inputs)
+
+    def record(self, inputs, params):
+        self.entry = {
+            'version': MANIFEST_VERSION,
+            'mode': self.mode,
+            'params': params,
+            'inputs': self.fingerprints(inputs),
+            'product': fingerprint(self.product_path, 'stat'),
+        }
+
+        temp_path = f"{self.path}.tmp"
+
+        with open(temp_path, 'w') as file:
+            json.dump(self.entry, file, indent=1, sort_keys=True)
+
+        os.replace(temp_path, self.path)
@@ -0,0 +1,269 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import logging
+import platform
+import threading
+import tracemalloc
+
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import METRICS_REPORT, METRICS_PROMETHEUS, METRICS_PROFILE
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+PROMETHEUS_PREFIX = 'gpvmsm'
+TRACEMALLOC_TOP = 10
+
+def cpu_seconds():
+    # Includes reaped child processes, so stages that use a process pool are counted in full.
+
+    times = os.times()
+
+    return times.user + times.system + times.children_user + times.children_system
+
+def peak_rss_bytes():
+    if resource is not None:
+        scale = 1 if sys.platform == 'darwin' else 1024
+
+        return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale
+
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+
+        return getattr(memory, 'peak_wset', memory.rss)
+
+    return None
+
+class RunMetrics:
+    def __init__(self, profile=METRICS_PROFILE, profile_dir=None):
+        self.profile = set(profile)
+        self.profile_dir = profile_dir or os.path.dirname(METRICS_REPORT) or '.'
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.stages = {}
+            self.files = []
+            self.counters = {}
+
+    @contextmanager
+    def stage(self, name, year=None):
+        profiler = cProfile.Profile() if 'cprofile' in self.profile else None
+        tracing = 'tracemalloc' in self.profile
+
+        if tracing:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+            tracemalloc.reset_peak()
+
+        start_wall, start_cpu = time.perf_counter(), cpu_seconds()
+
+        if profiler is not None:
+            profiler.enable()
+
+        try:
+            yield
+
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+            entry = {'wall_seconds': time.perf_counter() - start_wall, 'cpu_seconds': cpu_seconds() - start_cpu,
+                     'peak_rss_bytes': peak_rss_bytes()}
+            key = f"{name}:{year}" if year is not None else name
+
+            if tracing:
+                entry['tracemalloc_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                entry['tracemalloc_top'] = [str(stat) for stat in
+                                            tracemalloc.take_snapshot().statistics('lineno')[:TRACEMALLOC_TOP]]
+
+            if profiler is not None:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                entry['profile'] = os.path.join(self.profile_dir, f"{key.replace(':', '_')}.prof")
+                profiler.dump_stats(entry['profile'])
+
+            self._add_stage(key, name, year, entry)
+
+    def _add_stage(self, key, name, year, entry, calls=1):
+        with self.lock:
+            current = self.stages.setdefault(key, {'stage': name, 'year': year, 'calls': 0,
+                                                   'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'peak_rss_bytes': None})
+            current['calls'] += calls
+
+            for field, value in entry.items():
+                if field in ('wall_seconds', 'cpu_seconds'):
+                    current[field] += value
+
+                elif field.endswith('_bytes') and value is not None:
+                    current[field] = max(value, current.get(field) or 0)
+
+                else:
+                    current[field] = value
+
+    @contextmanager
+    def file(self, stage, path, **fields):
+        record = dict(fields)
+        start_wall, start_cpu = time.perf_counter(), time.thread_time()
+
+        yield record
+
+        record.setdefault('seconds', time.perf_counter() - start_wall)
+        record.setdefault('cpu_seconds', time.thread_time() - start_cpu)
+        self.record_file(stage, path, **record)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_file(self, stage, path, **fields):
+        record = {'stage': stage, 'file': os.path.basename(path)}
+        record.update(fields)
+
+        with self.lock:
+            self.files.append(record)
+
+    def snapshot(self):
+        with self.lock:
+            return {'stages': {key: dict(entry) for key, entry in self.stages.items()},
+                    'files': list(self.files), 'counters': dict(self.counters)}
+
+    def merge(self, snapshot):
+        # Snapshots come back from pool workers, e.g. one per year from the scheduler.
+
+        for key, entry in snapshot['stages'].items():
+            fields = {field: value for field, value in entry.items() if field not in ('stage', 'year', 'calls')}
+            self._add_stage(key, entry['stage'], entry['year'], fields, entry['calls'])
+
+        with self.lock:
+            self.files.extend(snapshot['files'])
+
+            for name, value in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def _file_totals(self):
+        totals = {}
+
+        for record in self.files:
+            stage = totals.setdefault(record['stage'], {'files': 0})
+            stage['files'] += 1
+
+            for field, value in record.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stage[field] = stage.get(field, 0) + value
+
+        return totals
+
+    def report(self):
+        snapshot = self.snapshot()
+        file_totals = self._file_totals()
+        stages = []
+
+        for entry in snapshot['stages'].values():
+            entry = dict(entry)
+            totals = file_totals.get(entry['stage'], {})
+
+            if totals.get('bytes') and entry['wall_seconds'] > 0:
+                entry['bytes_per_second'] = totals['bytes'] / entry['wall_seconds']
+
+            stages.append(entry)
+
+        return {
+            'started': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'wall_seconds': time.time() - self.started,
+            'cpu_seconds': cpu_seconds(),
+            'peak_rss_bytes': peak_rss_bytes(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'stages': stages,
+            'file_totals': file_totals,
+            'counters': snapshot['counters'],
+            'files': snapshot['files'],
+        }
+
+    def write_json(self, path, report=None):
+        _write_atomic(path, json.dumps(report or self.report(), indent=2))
+
+    def write_prometheus(self, path, report=None):
+        report = report or self.report()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}")
+
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{label}"' for key, label in labels.items() if label is not None)
+                lines.append(f"{PROMETHEUS_PREFIX}_{name}{{{label_text}}} {value}" if label_text
+                             else f"{PROMETHEUS_PREFIX}_{name} {value}")
+
+        stage_labels = [({'stage': entry['stage'], 'year': entry['year']}, entry) for entry in report['stages']]
+
+        metric('stage_wall_seconds', 'gauge', "Wall time spent in a pipeline stage",
+               [(labels, entry['wall_seconds']) for labels, entry in stage_labels])
+        metric('stage_cpu_seconds', 'gauge', "CPU time spent in a pipeline stage, including child processes",
+               [(labels, entry['cpu_seconds']) for labels, entry in stage_labels])
+        metric('stage_peak_rss_bytes', 'gauge', "Peak resident set size at the end of a pipeline stage",
+               [(labels, entry['peak_rss_bytes']) for labels, entry in stage_labels if entry['peak_rss_bytes'] is not None])
+
+        file_samples = [(stage, field, value) for stage, totals in report['file_totals'].items()
+                        for field, value in totals.items()]
+
+        metric('files_total', 'counter', "Files handled per stage",
+               [({'stage': stage}, value) for stage, field, value in file_samples if field == 'files'])
+        metric('file_bytes_total', 'counter', "Bytes downloaded or read per stage",
+               [({'stage': stage}, value) for stage, field, value in file_samples if field == 'bytes'])
+        metric('file_phase_seconds_total', 'counter', "Per-file wall time (phase wall), CPU time (phase cpu) and time per phase",
+               [({'stage': stage, 'phase': field[:-len('_seconds')] if field != 'seconds' else 'wall'}, value)
+                for stage, field, value in file_samples if field.endswith('seconds')])
+
+        for name, value in sorted(report['counters'].items()):
+            metric(f"{name}_total", 'counter', f"Counter {name}", [({}, value)])
+
+        metric('run_wall_seconds', 'gauge', "Wall time since the run started", [({}, report['wall_seconds'])])
+
+        if report['peak_rss_bytes'] is not None:
+            metric('peak_rss_bytes', 'gauge', "Peak resident set size of the run", [({}, report['peak_rss_bytes'])])
+
+        _write_atomic(path, '\n'.join(lines) + '\n')
+
+    def write_reports(self, json_path=METRICS_REPORT, prometheus_path=METRICS_PROMETHEUS):
+        if not json_path and not prometheus_path:
+            return
+
+        report = self.report()
+
+        if json_path:
+            self.write_json(json_path, report)
+            logging.info(f"METRICS : Run report written to {json_path}")
+
+        if prometheus_path:
+            self.write_prometheus(prometheus_path, report)
+            logging.info(f"METRICS : Prometheus metrics written to {prometheus_path}")
+
+def _write_atomic(path, text):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f"{path}.tmp"
+
+    with open(temp_path, 'w') as file:
+        file.write(text)
+
+    os.replace(temp_path, path)
+
+metrics = RunMetrics()
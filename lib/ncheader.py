@@ -0,0 +1,125 @@
+# Classic NetCDF (CDF-1, CDF-2 and CDF-5) headers describe where every variable starts and how
+# large it is, so the size a complete file must have can be computed without reading any data.
+
+NC_DIMENSION = 10
+NC_VARIABLE = 11
+NC_ATTRIBUTE = 12
+STREAMING_RECORDS = (0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF)
+
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 4, 6: 8, 7: 1, 8: 2, 9: 4, 10: 8, 11: 8}
+
+class HeaderError(ValueError):
+    pass
+
+class _Reader:
+    def __init__(self, file, version):
+        self.file = file
+        self.count_size = 8 if version == 5 else 4
+        self.offset_size = 4 if version == 1 else 8
+
+    def read(self, size):
+        data = self.file.read(size)
+
+        if len(data) != size:
+            raise HeaderError("header ends early")
+
+        return data
+
+    def unsigned(self, size):
+        return int.from_bytes(self.read(size), 'big')
+
+    def count(self):
+        return self.unsigned(self.count_size)
+
+    def name(self):
+        length = self.count()
+        self.read(length + (-length % 4))
+
+    def skip_attributes(self):
+        tag, count = self.unsigned(4), self.count()
+
+        if tag not in (0, NC_ATTRIBUTE):
+            raise HeaderError(f"unexpected attribute tag {tag}")
+
+        for _ in range(count):
+            self.name()
+            nc_type = self.unsigned(4)
+
+            if nc_type not in TYPE_SIZES:
+                raise HeaderError(f"unknown type {nc_type}")
+
+            size = self.count() * TYPE_SIZES[nc_type]
+            self.read(size + (-size % 4))
+
+def classic_data_size(path):
+    # Returns the byte size a complete file needs, or None when it is not a classic file or
+    # is written in streaming mode with an unknown record count.
+
+    with open(path, 'rb') as file:
+        magic = file.read(4)
+
+        if magic[:3] != b'CDF' or len(magic) != 4 or magic[3] not in (1, 2, 5):
+            return None
+
+        reader = _Reader(file, magic[3])
+        records = reader.count()
+
+        if records in STREAMING_RECORDS:
+            return None
+
+        tag, count = reader.unsigned(4), reader.count()
+
+        if tag not in (0, NC_DIMENSION):
+            raise HeaderError(f"unexpected dimension tag {tag}")
+
+        dimensions = []
+
+        for _ in range(count):
+            reader.name()
+            dimensions.append(reader.count())
+
+        reader.skip_attributes()
+
+        tag, count = reader.unsigned(4), reader.count()
+
+        if tag not in (0, NC_VARIABLE):
+            raise HeaderError(f"unexpected variable tag {tag}")
+
+        variables = []
+
+        for _ in range(count):
+            reader.name()
+            dimension_ids = [reader.count() for _ in range(reader.count())]
+            reader.skip_attributes()
+            nc_type = reader.unsigned(4)
+            reader.count()
+            begin = reader.unsigned(reader.offset_size)
+
+            if nc_type not in TYPE_SIZES or any(index >= len(dimensions) for index in dimension_ids):
+                raise HeaderError("variable refers to an unknown type or dimension")
+
+            is_record = bool(dimension_ids) and dimensions[dimension_ids[0]] == 0
+            size = TYPE_SIZES[nc_type]
+
+            for index in dimension_ids[1:] if is_record else dimension_ids:
+                size *= dimensions[index]
+
+            variables.append((begin, size, is_record))
+
+    record_variables = [size for _, size, is_record in variables if is_record]
+
+    # Record slabs are padded to 4 bytes, except when a single record variable fills the record.
+
+    record_size = (record_variables[0] if len(record_variables) == 1
+                   else sum(size + (-size % 4) for size in record_variables))
+
+    ends = []
+
+    for begin, size, is_record in variables:
+        if not is_record:
+            ends.append(begin + size)
+
+        elif records > 0:
+            ends.append(begin + (records - 1) * record_size + size)
+
+    return max(ends) if ends else None
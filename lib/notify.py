@@ -0,0 +1,69 @@
+import os
+import sys
+import logging
+import importlib
+import subprocess
+
+from config import NOTIFY
+
+BEEP_FREQUENCY = 2500
+BEEP_DURATION = 500
+
+def beep(message):
+    # winsound only exists on Windows, elsewhere the terminal bell stands in for the beep.
+
+    try:
+        import winsound
+
+    except ImportError:
+        return bell(message)
+
+    winsound.Beep(BEEP_FREQUENCY, BEEP_DURATION)
+
+def bell(message):
+    sys.stderr.write('\a')
+    sys.stderr.flush()
+
+def log(message):
+    logging.info(f"NOTIFY : {message}")
+
+def silent(message):
+    pass
+
+def command(command_line):
+    def run(message):
+        result = subprocess.run(command_line, shell=True, env=dict(os.environ, GPVMSM_MESSAGE=message))
+
+        if result.returncode != 0:
+            logging.warning(f"NOTIFY : '{command_line}' exited with {result.returncode}")
+
+    return run
+
+NOTIFIERS = {'beep': beep, 'bell': bell, 'log': log, 'none': silent}
+
+def get_notifier(spec=NOTIFY):
+    if callable(spec):
+        return spec
+
+    if not spec:
+        return silent
+
+    if spec.startswith('command:'):
+        return command(spec[len('command:'):])
+
+    if ':' in spec:
+        module_name, function_name = spec.split(':', 1)
+
+        return getattr(importlib.import_module(module_name), function_name)
+
+    if spec not in NOTIFIERS:
+        raise ValueError(f"Invalid notifier: {spec}")
+
+    return NOTIFIERS[spec]
+
+def notify(message, spec=NOTIFY):
+    try:
+        get_notifier(spec)(message)
+
+    except Exception as e:
+        logging.warning(f"NOTIFY : notification failed: {e}")
@@ -0,0 +1,78 @@
+import time
+import logging
+import argparse
+import importlib
+
+from config import PROCESS_YEAR, PROCESS_WORKERS, METRICS_REPORT, METRICS_PROMETHEUS, NOTIFY, get_settings
+
+STAGES = ('download', 'process', 'sum', 'extremes', 'downscale', 'daily', 'rollup')
+COMPUTE_STAGES = STAGES[1:]
+
+def run_stages(year, stages=STAGES, process_workers=None, settings=None):
+    # settings overrides any of config.STAGE_SETTINGS for this run only, so one process can run
+    # several configurations. GPvMSM pulls in numpy and netCDF4, so it is only imported once a
+    # stage actually runs.
+
+    settings = get_settings(settings)
+
+    if process_workers is not None:
+        settings['PROCESS_WORKERS'] = process_workers
+
+    stage_module = importlib.import_module('GPvMSM')
+    timings = {}
+    annual_sum = None
+
+    for stage in stages:
+        if stage not in STAGES:
+            raise ValueError(f"Invalid stage: {stage}")
+
+        start_time = time.perf_counter()
+
+        if stage == 'process':
+            annual_sum = stage_module.process_stage(year, settings=settings)
+
+        elif stage == 'sum':
+            stage_module.sum_stage(year, annual_sum, settings=settings)
+
+        else:
+            getattr(stage_module, f"{stage}_stage")(year, settings=settings)
+
+        timings[stage] = time.perf_counter() - start_time
+
+    return timings
+
+def run(year, stages=STAGES, process_workers=None, metrics_report=METRICS_REPORT,
+        metrics_prometheus=METRICS_PROMETHEUS, notifier=NOTIFY, settings=None):
+    from metrics import metrics
+    from notify import notify
+
+    start_time = time.perf_counter()
+    timings = run_stages(int(year), stages, process_workers, settings)
+
+    metrics.write_reports(metrics_report, metrics_prometheus)
+    notify(f"GPV-MSM {year} finished {', '.join(timings)} in {time.perf_counter() - start_time:.1f}s", notifier)
+
+    return timings
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the GPV-MSM pipeline stages for one year")
+    parser.add_argument('year', type=int, nargs='?', default=int(PROCESS_YEAR), help="default: PROCESS_YEAR")
+    parser.add_argument('--stages', default=','.join(STAGES), help=f"comma separated subset of {','.join(STAGES)}")
+    parser.add_argument('--process-workers', type=int, default=PROCESS_WORKERS, help="daily reduction processes (0: CPU count)")
+    parser.add_argument('--metrics-report', default=METRICS_REPORT, help="write the metrics run report as JSON to this path")
+    parser.add_argument('--prometheus', default=METRICS_PROMETHEUS, help="write the metrics in Prometheus text format to this path")
+    parser.add_argument('--notify', default=NOTIFY, help="beep, bell, log, none, command:<shell command> or module:function")
+    args = parser.parse_args(argv)
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    run(args.year, stages, args.process_workers, args.metrics_report, args.prometheus, args.notify)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import os
+import hashlib
+import logging
+import zipfile
+import tempfile
+import numpy as np
+
+DOWNSCALING_METHODS = ('max', 'median', 'center', 'mean')
+MAPPING_CACHE_VERSION = 1
+
+class AxisMapping:
+    def __init__(self, counts, source_index):
+        self.counts = counts
+        self.source_index = source_index
+        self.offsets = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+
+    @classmethod
+    def build(cls, source, centers, grid_size):
+        half_grid = grid_size / 2.0
+        lower_bounds = centers - half_grid
+        upper_bounds = centers + half_grid
+
+        dtype = np.result_type(source, lower_bounds)
+        source = np.ma.getdata(source).astype(dtype)
+
+        first = np.searchsorted(upper_bounds.astype(dtype), source, side='right')
+        last = np.searchsorted(lower_bounds.astype(dtype), source, side='right')
+        spans = np.maximum(last - first, 0)
+
+        source_index = np.repeat(np.arange(len(source)), spans)
+        span_offsets = np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+        target_index = np.repeat(first, spans) + span_offsets
+
+        order = np.argsort(target_index, kind='stable')
+        counts = np.bincount(target_index, minlength=len(centers))[:len(centers)]
+
+        return cls(counts.astype(np.int64), source_index[order].astype(np.int64))
+
+    def groups(self):
+        for count in np.unique(self.counts[self.counts > 0]):
+            targets = np.flatnonzero(self.counts == count)
+            members = self.source_index[self.offsets[targets][:, None] + np.arange(count)]
+
+            yield targets, members
+
+    def window(self, start, stop):
+        # Targets start:stop only read the source range spanned by their members, so the
+        # sub-mapping is re-indexed into that range.
+
+        members = self.source_index[self.offsets[start]:self.offsets[stop - 1] + self.counts[stop - 1]]
+
+        if len(members) == 0:
+            return AxisMapping(self.counts[start:stop], members), (0, 0)
+
+        first, last = int(members.min()), int(members.max()) + 1
+
+        return AxisMapping(self.counts[start:stop], members - first), (first, last)
+
+class GridMapping:
+    def __init__(self, lat_mapping, lon_mapping):
+        self.lat_mapping = lat_mapping
+        self.lon_mapping = lon_mapping
+
+    @classmethod
+    def build(cls, source_lat, source_lon, target_lat, target_lon, lat_grid_size, lon_grid_size):
+        return cls(AxisMapping.build(source_lat, target_lat, lat_grid_size),
+                   AxisMapping.build(source_lon, target_lon, lon_grid_size))
+
+    @property
+    def shape(self):
+        return len(self.lat_mapping.counts), len(self.lon_mapping.counts)
+
+    def tiles(self, size):
+        rows, cols = self.shape
+
+        for row in range(0, rows, size):
+            for col in range(0, cols, size):
+                yield slice(row, min(row + size, rows)), slice(col, min(col + size, cols))
+
+    def window(self, rows, cols):
+        lat_mapping, lat_range = self.lat_mapping.window(rows.start, rows.stop)
+        lon_mapping, lon_range = self.lon_mapping.window(cols.start, cols.stop)
+
+        return GridMapping(lat_mapping, lon_mapping), slice(*lat_range), slice(*lon_range)
+
+    def blocks(self, data):
+        flat = data.reshape(data.shape[0], -1)
+        width = data.shape[-1]
+
+        for rows, row_members in self.lat_mapping.groups():
+            for cols, col_members in self.lon_mapping.groups():
+                # Members are laid out (lon, lat) like the boolean-mask copies of the old per-cell
+                # loop, so mean and center sum in the same order. One gather over all time steps
+                # gives (time, rows, cols, lon, lat) without a second transposing copy.
+
+                index = row_members[:, None, None, :] * width + col_members[None, :, :, None]
+
+                yield rows, cols, np.take(flat, index, axis=1)
+
+class MappingCache:
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_bytes)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get(self, source_lat, source_lon, target_lat, target_lon, lat_grid_size, lon_grid_size):
+        key = self.key(source_lat, source_lon, target_lat, target_lon, lat_grid_size, lon_grid_size)
+        path = os.path.join(self.cache_dir, f"{key}.npz")
+
+        mapping = self._load(path)
+
+        if mapping is not None:
+            logging.info(f"Regrid mapping loaded from cache: {path}")
+            return mapping
+
+        mapping = GridMapping.build(source_lat, source_lon, target_lat, target_lon, lat_grid_size, lon_grid_size)
+        self._store(path, mapping)
+        self._evict()
+
+        return mapping
+
+    @staticmethod
+    def key(*inputs):
+        hasher = hashlib.sha256(f"regrid-v{MAPPING_CACHE_VERSION}".encode())
+
+        for value in inputs:
+            array = np.ascontiguousarray(np.ma.getdata(value))
+            hasher.update(f"{array.dtype.str}{array.shape}".encode())
+            hasher.update(array.tobytes())
+
+        return hasher.hexdigest()
+
+    def _load(self, path):
+        if not os.path.isfile(path):
+            return None
+
+        try:
+            with np.load(path) as cached:
+                mapping = GridMapping(AxisMapping(cached['lat_counts'], cached['lat_source_index']),
+                                      AxisMapping(cached['lon_counts'], cached['lon_source_index']))
+
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+            logging.warning(f"Discarding unreadable regrid cache entry {path}: {e}")
+
+            try:
+                os.remove(path)
+
+            except FileNotFoundError:
+                pass
+
+            return None
+
+        os.utime(path)
+
+        return mapping
+
+    def _store(self, path, mapping):
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+
+        with os.fdopen(file_descriptor, 'wb') as file:
+            np.savez(file,
+                     lat_counts=mapping.lat_mapping.counts, lat_source_index=mapping.lat_mapping.source_index,
+                     lon_counts=mapping.lon_mapping.counts, lon_source_index=mapping.lon_mapping.source_index)
+
+        os.replace(temp_path, path)
+
+    def _evict(self):
+        entries = []
+
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                path = os.path.join(self.cache_dir, name)
+
+                try:
+                    stat = os.stat(path)
+
+                except FileNotFoundError:
+                    continue
+
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+
+            except FileNotFoundError:
+                pass
+
+            total_bytes -= size
+            logging.info(f"Evicted regrid cache entry {path}")
+
+def reduce_block(block, methods):
+    cell_values = block.reshape(block.shape[:3] + (-1,))
+    sorted_values = np.sort(cell_values, axis=-1) if 'median' in methods else None
+    results = {}
+
+    for method in methods:
+        if method == 'max':
+            # Without a median to share the sort with, fmax skips NaN the same way sorted_max does.
+
+            results[method] = (sorted_max(sorted_values) if sorted_values is not None
+                               else np.fmax.reduce(cell_values, axis=-1))
+
+        elif method == 'median':
+            results[method] = sorted_median(sorted_values)
+
+        elif method == 'center':
+            results[method] = center_block(block)
+
+        elif method == 'mean':
+            results[method] = np.nanmean(cell_values, axis=-1)
+
+        else:
+            raise ValueError(f"Invalid downscaling method: {method}")
+
+    return results
+
+def _valid_counts(sorted_values):
+    return np.count_nonzero(~np.isnan(sorted_values), axis=-1)
+
+def sorted_max(sorted_values):
+    counts = _valid_counts(sorted_values)
+    last = np.take_along_axis(sorted_values, np.maximum(counts - 1, 0)[..., None], axis=-1)[..., 0]
+
+    return np.where(counts > 0, last, np.nan)
+
+def sorted_median(sorted_values):
+    counts = _valid_counts(sorted_values)
+    lower = np.take_along_axis(sorted_values, np.maximum(counts - 1, 0)[..., None] // 2, axis=-1)[..., 0]
+    upper = np.take_along_axis(sorted_values, (counts // 2)[..., None], axis=-1)[..., 0]
+
+    median = np.where(counts % 2 == 1, lower, (lower + upper) / 2)
+
+    return np.where(counts > 0, median, np.nan)
+
+def center_block(block):
+    cols, rows = block.shape[3:]
+
+    center_row = rows // 2
+    center_col = cols // 2
+
+    if rows % 2 == 1 and cols % 2 == 1:
+        return block[..., center_col, center_row]
+
+    center_values = block[..., center_col-1:center_col+1, center_row-1:center_row+1]
+    return np.nanmean(center_values, axis=(3, 4))
+
+def downscale_methods(data, mapping, methods):
+    for method in methods:
+        if method not in DOWNSCALING_METHODS:
+            raise ValueError(f"Invalid downscaling method: {method}")
+
+    values = np.ma.filled(data, np.nan) if np.ma.isMaskedArray(data) else np.asarray(data)
+    target_data = {method: np.full((values.shape[0],) + mapping.shape, np.nan) for method in methods}
+
+    # Every time step is reduced in the same pass, the results come back as (time, lat, lon).
+
+    for rows, cols, block in mapping.blocks(values):
+        for method, result in reduce_block(block, methods).items():
+            target_data[method][(slice(None),) + np.ix_(rows, cols)] = result
+
+    return target_data
@@ -0,0 +1,198 @@
+import os
+import logging
+import numpy as np
+import netCDF4 as nc
+
+from datetime import date
+
+from config import BUILD_FINGERPRINT, STORAGE_PROFILE, SUM_CHUNK_DAYS
+from access import default_store
+from manifest import BuildManifest
+from storage import create_data_variable, storage_values
+
+ROLLUP_PACK_SCALE = 1.0
+
+MONTH_NAMES = ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec')
+SEASONS = {'MAM': (3, 5), 'JJA': (6, 8), 'SON': (9, 11)}
+
+def _day_index(year, month, day):
+    return date(year, month, day).timetuple().tm_yday - 1
+
+def _month_end(year, month):
+    return _day_index(year, month + 1, 1) if month < 12 else _day_index(year, 12, 31) + 1
+
+def _bound(year, token, is_end):
+    token = token.strip().lower()
+
+    if token in MONTH_NAMES:
+        month = MONTH_NAMES.index(token) + 1
+        return _month_end(year, month) if is_end else _day_index(year, month, 1)
+
+    if len(token) == 4 and token.isdigit():
+        day = _day_index(year, int(token[:2]), int(token[2:]))
+        return day + 1 if is_end else day
+
+    raise ValueError(f"Invalid rollup window bound: {token}")
+
+def parse_windows(specs, year):
+    # Windows lie inside one calendar year because a rollup reads a single year cube. DJF would
+    # need December of the previous year, so 'seasonal' covers MAM, JJA and SON only.
+
+    windows = []
+
+    for spec in specs:
+        key = spec.strip()
+
+        if key.upper() == 'DJF':
+            raise ValueError("Rollup window DJF spans two year files and is not supported, use dec and jan-feb instead")
+
+        if key.lower() == 'monthly':
+            windows += [(name, _day_index(year, month, 1), _month_end(year, month))
+                        for month, name in enumerate(MONTH_NAMES, start=1)]
+
+        elif key.lower() == 'seasonal':
+            windows += [(name, _day_index(year, first, 1), _month_end(year, last)) for name, (first, last) in SEASONS.items()]
+
+        elif key.upper() in SEASONS:
+            first, last = SEASONS[key.upper()]
+            windows.append((key.upper(), _day_index(year, first, 1), _month_end(year, last)))
+
+        elif key.lower() in MONTH_NAMES:
+            windows.append((key.lower(), _bound(year, key, False), _bound(year, key, True)))
+
+        elif '-' in key:
+            start, end = key.split('-', 1)
+            windows.append((key.lower(), _bound(year, start, False), _bound(year, end, True)))
+
+        else:
+            raise ValueError(f"Invalid rollup window: {spec}")
+
+    for name, start, stop in windows:
+        if start >= stop:
+            raise ValueError(f"Rollup window {name} must not wrap around the end of the year")
+
+    return windows
+
+def rollup_sums(view, windows, chunk_days=SUM_CHUNK_DAYS):
+    days = len(view)
+    boundaries = sorted({min(bound, days) for _, start, stop in windows for bound in (start, stop)})
+
+    running_sum = np.zeros(view.shape[1:])
+    running_count = np.zeros(view.shape[1:], dtype=np.int32)
+    prefix_sums = {}
+    prefix_counts = {}
+    next_boundary = 0
+
+    # One pass keeps running totals and snapshots them at window boundaries only, so
+    # every window is a difference of two prefixes however many windows overlap.
+
+    def snapshot(day):
+        nonlocal next_boundary
+
+        while next_boundary < len(boundaries) and boundaries[next_boundary] == day:
+            prefix_sums[day] = running_sum.copy()
+            prefix_counts[day] = running_count.copy()
+            next_boundary += 1
+
+    for start in range(0, days, chunk_days):
+        chunk = view[start:min(start + chunk_days, days)]
+
+        for offset, daily_rain in enumerate(chunk):
+            snapshot(start + offset)
+
+            valid = ~np.isnan(daily_rain)
+            np.add(running_sum, np.where(valid, daily_rain, 0), out=running_sum)
+            running_count += valid
+
+    snapshot(days)
+
+    sums = np.empty((len(windows),) + view.shape[1:], dtype=np.float32)
+    counts = np.empty((len(windows),) + view.shape[1:], dtype=np.int32)
+
+    for index, (_, start, stop) in enumerate(windows):
+        start, stop = min(start, days), min(stop, days)
+        counts[index] = prefix_counts[stop] - prefix_counts[start]
+        sums[index] = np.where(counts[index] > 0, prefix_sums[stop] - prefix_sums[start], np.nan)
+
+    return sums, counts
+
+class RollupBuilder:
+    def __init__(self, input_file, output_file, windows, year, chunk_days=SUM_CHUNK_DAYS, storage_profile=STORAGE_PROFILE,
+                 fingerprint=BUILD_FINGERPRINT):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.year = int(year)
+        self.windows = parse_windows(windows, self.year)
+        self.chunk_days = max(1, int(chunk_days))
+        self.storage_profile = storage_profile
+        self.fingerprint = fingerprint
+
+        self.store = default_store()
+
+    def _manifest_state(self):
+        params = {'windows': [list(window) for window in self.windows], 'storage_profile': self.storage_profile}
+
+        return {'r1d': self.input_file}, params
+
+    def build(self):
+        manifest = BuildManifest(self.output_file, self.fingerprint)
+
+        if manifest.is_up_to_date(*self._manifest_state()):
+            logging.info(f"ROLLUP : {self.output_file} is up to date. Skipping processing.")
+            return self.output_file
+
+        logging.info(f"ROLLUP : Computing {len(self.windows)} windows from {self.input_file}")
+
+        lat, lon, _ = self.store.coordinates(self.input_file)
+        sums, counts = rollup_sums(self.store.view(self.input_file, 'r1d'), self.windows, self.chunk_days)
+        self.store.release(self.input_file)
+
+        self._save_data(sums, counts, lat, lon)
+        manifest.record(*self._manifest_state())
+
+        logging.info(f"ROLLUP : Data saved successfully to {self.output_file}")
+        return self.output_file
+
+    def _save_data(self, sums, counts, lat, lon):
+        temp_file = f"{self.output_file}.tmp"
+
+        with nc.Dataset(temp_file, 'w', format='NETCDF4') as new_nc:
+            new_nc.createDimension('time', len(self.windows))
+            new_nc.createDimension('lat', len(lat))
+            new_nc.createDimension('lon', len(lon))
+
+            times = new_nc.createVariable('time', 'i4', ('time',))
+            latitudes = new_nc.createVariable('lat', 'f4', ('lat',))
+            longitudes = new_nc.createVariable('lon', 'f4', ('lon',))
+            r1w = create_data_variable(new_nc, 'r1w', 'f4', ('time', 'lat', 'lon',), self.storage_profile,
+                                       pack_scale=ROLLUP_PACK_SCALE)
+            valid_days = create_data_variable(new_nc, 'valid_days', 'i4', ('time', 'lat', 'lon',), self.storage_profile)
+            window_start = new_nc.createVariable('window_start', 'i4', ('time',))
+            window_end = new_nc.createVariable('window_end', 'i4', ('time',))
+            window_name = new_nc.createVariable('window', str, ('time',))
+
+            times[:] = [start + 1 for _, start, _ in self.windows]
+            latitudes[:] = lat
+            longitudes[:] = lon
+            r1w[:, :, :] = storage_values(r1w, sums)
+            valid_days[:, :, :] = counts
+            window_start[:] = [start + 1 for _, start, _ in self.windows]
+            window_end[:] = [stop for _, _, stop in self.windows]
+
+            for index, (name, _, _) in enumerate(self.windows):
+                window_name[index] = name
+
+            times.units = 'day of year'
+            latitudes.units = 'degree_north'
+            longitudes.units = 'degree_east'
+
+            r1w.units = 'mm'
+            r1w.long_name = 'Precipitation total over the window'
+            valid_days.units = 'days'
+            window_start.long_name = 'First day of year in the window'
+            window_end.long_name = 'Last day of year in the window'
+
+            new_nc.description = "Sub-annual precipitation totals"
+            new_nc.year = self.year
+
+        os.replace(temp_file, self.output_file)
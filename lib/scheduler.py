@@ -0,0 +1,126 @@
+import os
+import time
+import json
+import logging
+import argparse
+import multiprocessing
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from config import METRICS_REPORT, METRICS_PROMETHEUS
+from metrics import metrics
+from pipeline import STAGES, COMPUTE_STAGES, run_stages
+
+def compute_year(year, process_workers=1, settings=None):
+    # Runs in a pool worker, which may have inherited or collected metrics for other years.
+
+    metrics.reset()
+    timings = run_stages(year, COMPUTE_STAGES, process_workers, settings)
+
+    return timings, metrics.snapshot()
+
+def timed_download(year, settings=None):
+    return run_stages(year, ('download',), settings=settings)['download']
+
+class YearScheduler:
+    def __init__(self, years, workers=None, download_workers=1, process_workers=1, settings=None):
+        self.years = list(years)
+        self.workers = workers or min(len(self.years), os.cpu_count() or 1)
+        self.download_workers = max(1, int(download_workers))
+        self.process_workers = max(1, int(process_workers))
+        self.settings = settings
+
+        self.timings = {year: {} for year in self.years}
+        self.failures = {}
+
+    def run(self):
+        start_time = time.perf_counter()
+
+        # Compute workers are started while download threads hold logging, urllib3 and ssl locks,
+        # a forked child could inherit one of them locked for good. Spawned workers start clean.
+
+        with ThreadPoolExecutor(max_workers=self.download_workers) as downloads, \
+             ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')) as computes:
+            pending = {downloads.submit(timed_download, year, self.settings): ('download', year) for year in self.years}
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    stage, year = pending.pop(future)
+
+                    try:
+                        result = future.result()
+
+                    except Exception as e:
+                        logging.error(f"SCHEDULER : {stage} failed for {year}: {e}")
+                        self.failures[year] = f"{stage}: {e}"
+                        continue
+
+                    if stage == 'download':
+                        self.timings[year]['download'] = result
+                        logging.info(f"SCHEDULER : {year} downloaded, queueing compute stages")
+                        pending[computes.submit(compute_year, year, self.process_workers, self.settings)] = ('compute', year)
+
+                    else:
+                        timings, snapshot = result
+                        self.timings[year].update(timings)
+                        metrics.merge(snapshot)
+                        logging.info(f"SCHEDULER : {year} completed")
+
+        self.wall_time = time.perf_counter() - start_time
+        self.report()
+
+        return self.timings
+
+    def report(self):
+        logging.info("SCHEDULER : per-stage timings (seconds)")
+        logging.info("SCHEDULER : " + "year".ljust(6) + "".join(stage.rjust(11) for stage in STAGES))
+
+        for year in self.years:
+            row = "".join((f"{self.timings[year][stage]:.1f}" if stage in self.timings[year] else "-").rjust(11)
+                          for stage in STAGES)
+            logging.info(f"SCHEDULER : {str(year).ljust(6)}{row}")
+
+        for stage in STAGES:
+            total = sum(timings.get(stage, 0.0) for timings in self.timings.values())
+            logging.info(f"SCHEDULER : total {stage} time {total:.1f}s")
+
+        logging.info(f"SCHEDULER : wall time {self.wall_time:.1f}s for {len(self.years)} years with {self.workers} workers")
+
+    def write_report(self, path):
+        report = {
+            'wall_time': self.wall_time,
+            'workers': self.workers,
+            'years': {str(year): self.timings[year] for year in self.years},
+            'failures': {str(year): message for year, message in self.failures.items()},
+        }
+
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the GPV-MSM pipeline for a range of years")
+    parser.add_argument('start_year', type=int)
+    parser.add_argument('end_year', type=int)
+    parser.add_argument('--workers', type=int, default=None, help="years computed in parallel (default: CPU count)")
+    parser.add_argument('--download-workers', type=int, default=1, help="years downloaded in parallel")
+    parser.add_argument('--process-workers', type=int, default=1, help="daily reduction processes per year")
+    parser.add_argument('--report', default=None, help="write the timing report as JSON to this path")
+    parser.add_argument('--metrics-report', default=METRICS_REPORT, help="write the metrics run report as JSON to this path")
+    parser.add_argument('--prometheus', default=METRICS_PROMETHEUS, help="write the metrics in Prometheus text format to this path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    scheduler = YearScheduler(range(args.start_year, args.end_year + 1), args.workers,
+                              args.download_workers, args.process_workers)
+    scheduler.run()
+
+    if args.report:
+        scheduler.write_report(args.report)
+
+    metrics.write_reports(args.metrics_report, args.prometheus)
+
+if __name__ == "__main__":
+    main()
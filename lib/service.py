@@ -0,0 +1,502 @@
+import os
+import json
+import math
+import time
+import logging
+import argparse
+import threading
+import numpy as np
+
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from config import SERVICE_HOST, SERVICE_PORT, SERVICE_CACHE_BYTES, DOWNSCALING_METHOD, get_year_paths
+from access import CubeStore, as_float_array
+from extract import EXTRACTION_METHODS, GridIndex, read_cells, weighted_series
+from manifest import fingerprint
+from metrics import PROMETHEUS_PREFIX
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Product name -> (get_year_paths key, variable). The hourly-derived daily cube is read cell by
+# cell, the other products are small enough to keep decoded in the cache.
+
+PRODUCTS = {
+    'sum': ('INPUT_FILE_SUM', 'r1y'),
+    'daily': ('INPUT_FILE', 'r1d'),
+    'downscaled': ('OUTPUT_FILE', 'r1y'),
+    'downscaled_daily': ('OUTPUT_FILE_DAILY', 'r1d'),
+}
+DAILY_PRODUCTS = ('daily', 'downscaled_daily')
+DEFAULT_PRODUCTS = {'point': 'sum', 'region': 'sum', 'grid': 'downscaled'}
+LATENCY_WINDOW = 1024
+LATENCY_QUANTILES = (0.5, 0.95, 0.99)
+
+def value_size(value):
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+
+    if isinstance(value, (tuple, list)):
+        return sum(value_size(item) for item in value)
+
+    return 64
+
+class LRUCache:
+    def __init__(self, max_bytes=SERVICE_CACHE_BYTES):
+        self.max_bytes = int(max_bytes)
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+        self.hits = {}
+        self.misses = {}
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, version, record=True):
+        # Entries remember the fingerprints of their source files, so a rewritten file
+        # invalidates everything decoded or computed from it on the next lookup.
+
+        kind = key[0]
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None and entry[0] != version:
+                self._remove(key)
+                self.invalidations += 1
+                entry = None
+
+            if entry is None:
+                if record:
+                    self.misses[kind] = self.misses.get(kind, 0) + 1
+
+                return None
+
+            self.entries.move_to_end(key)
+
+            if record:
+                self.hits[kind] = self.hits.get(kind, 0) + 1
+
+            return entry[1]
+
+    def put(self, key, version, value):
+        size = value_size(value)
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+            if size > self.max_bytes:
+                return value
+
+            self.entries[key] = (version, value, size)
+            self.bytes += size
+
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+        return value
+
+    def _remove(self, key):
+        self.bytes -= self.entries.pop(key)[2]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            kinds = sorted(set(self.hits) | set(self.misses))
+
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'kinds': {kind: {'hits': self.hits.get(kind, 0), 'misses': self.misses.get(kind, 0),
+                                 'hit_rate': self.hits.get(kind, 0) / max(1, self.hits.get(kind, 0) + self.misses.get(kind, 0))}
+                          for kind in kinds},
+            }
+
+class LatencyStats:
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def observe(self, endpoint, seconds, status, cached):
+        with self.lock:
+            entry = self.endpoints.setdefault(endpoint, {'requests': 0, 'errors': 0, 'cached': 0, 'seconds': 0.0,
+                                                         'recent': deque(maxlen=self.window)})
+            entry['requests'] += 1
+            entry['errors'] += status >= 400
+            entry['cached'] += bool(cached)
+            entry['seconds'] += seconds
+            entry['recent'].append(seconds)
+
+    def report(self):
+        with self.lock:
+            report = {}
+
+            for endpoint, entry in self.endpoints.items():
+                recent = np.sort(np.fromiter(entry['recent'], dtype=np.float64))
+                report[endpoint] = {field: entry[field] for field in ('requests', 'errors', 'cached', 'seconds')}
+                report[endpoint]['quantiles'] = {f"{q:g}": float(np.quantile(recent, q)) if len(recent) else None
+                                                 for q in LATENCY_QUANTILES}
+
+            return report
+
+def json_values(values):
+    values = np.asarray(values, dtype=np.float64)
+    result = values.astype(object)
+    result[~np.isfinite(values)] = None
+
+    return result.tolist()
+
+def finite_json(value):
+    # NaN and inf are not valid JSON and strict clients reject them, they go out as null.
+
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+
+    if isinstance(value, dict):
+        return {key: finite_json(item) for key, item in value.items()}
+
+    if isinstance(value, (list, tuple)):
+        return [finite_json(item) for item in value]
+
+    return value
+
+def json_body(value, **kwargs):
+    return json.dumps(finite_json(value), allow_nan=False, **kwargs).encode()
+
+def parse_floats(text, count=None):
+    values = [float(value) for value in text.split(',')]
+
+    if count is not None and len(values) != count:
+        raise ValueError(f"expected {count} comma separated numbers, got '{text}'")
+
+    if not all(math.isfinite(value) for value in values):
+        raise ValueError(f"expected finite numbers, got '{text}'")
+
+    return values
+
+class ArchiveQueries:
+    def __init__(self, cache, store=None):
+        self.cache = cache
+        self.store = store or CubeStore(cache_dir=None)
+
+        # netCDF4 handles are not thread safe, every file access goes through this lock.
+
+        self.read_lock = threading.Lock()
+
+    def resolve(self, params, endpoint='point'):
+        year = int(params['year'])
+        product = params.get('product', DEFAULT_PRODUCTS[endpoint])
+
+        if product not in PRODUCTS:
+            raise ValueError(f"Invalid product: {product}")
+
+        path_key, variable = PRODUCTS[product]
+        path = get_year_paths(year, params.get('method', DOWNSCALING_METHOD))[path_key]
+
+        if 'grid_size' in params:
+            if not product.startswith('downscaled'):
+                raise ValueError("grid_size only applies to downscaled products")
+
+            path = f"{path[:-len('.nc')]}_{parse_floats(params['grid_size'], 1)[0]:.2f}.nc"
+
+        return year, product, path, variable
+
+    def version(self, path):
+        current = fingerprint(path)
+
+        if current is None:
+            raise FileNotFoundError(f"{path} does not exist")
+
+        return current
+
+    def _cached(self, key, path, compute):
+        version = self.version(path)
+        value = self.cache.get(key, version)
+
+        if value is not None:
+            return value
+
+        # Another thread may have decoded the same entry while this one waited for the lock.
+
+        with self.read_lock:
+            value = self.cache.get(key, version, record=False)
+
+            if value is None:
+                value = self.cache.put(key, version, compute())
+
+        return value
+
+    def coordinates(self, path):
+        def decode():
+            return self.store.coordinates(path)
+
+        return self._cached(('coordinates', path), path, decode)
+
+    def array(self, path, variable):
+        def decode():
+            return as_float_array(self.store.dataset(path).variables[variable][:])
+
+        return self._cached(('array', path, variable), path, decode)
+
+    def dates(self, year, product, times):
+        if product in DAILY_PRODUCTS:
+            return [str(date) for date in np.datetime64(f"{year:04d}-01-01") + (np.ma.getdata(times).astype(np.int64) - 1)]
+
+        return [int(value) for value in np.ma.getdata(times)]
+
+    def cell_values(self, path, variable, product, rows, cols):
+        if product in DAILY_PRODUCTS:
+            with self.read_lock:
+                return read_cells(self.store.dataset(path).variables[variable], rows, cols)
+
+        return self.array(path, variable)[:, rows, cols]
+
+    def point(self, params):
+        year, product, path, variable = self.resolve(params)
+        interpolation = params.get('interpolation', 'nearest')
+
+        if interpolation not in EXTRACTION_METHODS:
+            raise ValueError(f"Invalid interpolation: {interpolation}")
+
+        lat_value, lon_value = parse_floats(params['lat'], 1)[0], parse_floats(params['lon'], 1)[0]
+        lat, lon, times = self.coordinates(path)
+        rows, cols, weights = getattr(GridIndex(lat, lon), interpolation)(np.array([lat_value]), np.array([lon_value]))
+
+        values = self.cell_values(path, variable, product, rows.ravel(), cols.ravel())
+        series = weighted_series(values, np.zeros(rows.size, dtype=np.int64), weights.ravel(), 1)[:, 0]
+
+        result = {'year': year, 'product': product, 'file': os.path.basename(path), 'lat': lat_value, 'lon': lon_value}
+
+        if len(series) == 1:
+            result['value'] = json_values(series)[0]
+
+        else:
+            result.update(time=self.dates(year, product, times), values=json_values(series))
+
+        return result
+
+    def region(self, params):
+        year, product, path, variable = self.resolve(params, 'region')
+
+        if 'bbox' in params:
+            region = parse_floats(params['bbox'], 4)
+
+        elif 'polygon' in params:
+            region = [parse_floats(vertex, 2) for vertex in params['polygon'].split(';')]
+
+        else:
+            raise ValueError("region queries need bbox=lon_min,lat_min,lon_max,lat_max or polygon=lon,lat;lon,lat;...")
+
+        lat, lon, times = self.coordinates(path)
+        rows, cols = GridIndex(lat, lon).region_cells(region)
+        values = self.cell_values(path, variable, product, rows, cols)
+        valid = ~np.isnan(values)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            summary = {
+                'mean': np.nansum(values, axis=1) / valid.sum(axis=1),
+                'max': np.fmax.reduce(values, axis=1, initial=np.nan),
+                'min': np.fmin.reduce(values, axis=1, initial=np.nan),
+            }
+
+        result = {'year': year, 'product': product, 'file': os.path.basename(path), 'cells': int(len(rows)),
+                  'valid_cells': valid.sum(axis=1).tolist() if len(times) > 1 else int(valid.sum())}
+
+        if len(times) == 1:
+            result.update({name: json_values(value)[0] for name, value in summary.items()})
+
+        else:
+            result['time'] = self.dates(year, product, times)
+            result.update({name: json_values(value) for name, value in summary.items()})
+
+        return result
+
+    def grid(self, params):
+        year, product, path, variable = self.resolve(params, 'grid')
+
+        if product == 'daily':
+            raise ValueError("grid queries are served from the sum and downscaled products")
+
+        lat, lon, times = self.coordinates(path)
+        step = int(params.get('step', 0))
+
+        if not -len(times) <= step < len(times):
+            raise ValueError(f"step {step} is outside the {len(times)} time steps of {os.path.basename(path)}")
+
+        rows, cols = np.arange(len(lat)), np.arange(len(lon))
+
+        if 'bbox' in params:
+            lon_min, lat_min, lon_max, lat_max = parse_floats(params['bbox'], 4)
+            rows = np.flatnonzero((lat >= lat_min) & (lat <= lat_max))
+            cols = np.flatnonzero((lon >= lon_min) & (lon <= lon_max))
+
+        values = self.array(path, variable)[step][np.ix_(rows, cols)]
+
+        return {'year': year, 'product': product, 'file': os.path.basename(path), 'step': step,
+                'time': self.dates(year, product, times[step:step + 1 or None])[0],
+                'lat': json_values(lat[rows]), 'lon': json_values(lon[cols]), 'values': json_values(values),
+                'max_value': json_values([np.nanmax(values)])[0] if np.isfinite(values).any() else None}
+
+class QueryService:
+    ENDPOINTS = ('point', 'region', 'grid')
+
+    def __init__(self, cache_bytes=SERVICE_CACHE_BYTES):
+        self.cache = LRUCache(cache_bytes)
+        self.queries = ArchiveQueries(self.cache)
+        self.latency = LatencyStats()
+        self.started = time.time()
+
+    def handle(self, endpoint, params):
+        if endpoint == 'stats':
+            return 200, json_body(self.stats(), indent=1), 'application/json', False
+
+        if endpoint == 'metrics':
+            return 200, self.prometheus().encode(), 'text/plain; version=0.0.4', False
+
+        if endpoint not in self.ENDPOINTS:
+            return 404, self._error(f"unknown endpoint '{endpoint}', use {', '.join(self.ENDPOINTS)}, stats or metrics"), 'application/json', False
+
+        try:
+            path = self.queries.resolve(params, endpoint)[2]
+            key = ('response', endpoint) + tuple(sorted(params.items()))
+            version = self.queries.version(path)
+            body = self.cache.get(key, version)
+
+            if body is not None:
+                return 200, body, 'application/json', True
+
+            body = json_body(getattr(self.queries, endpoint)(params))
+            self.cache.put(key, version, body)
+
+            return 200, body, 'application/json', False
+
+        except FileNotFoundError as e:
+            return 404, self._error(str(e)), 'application/json', False
+
+        except KeyError as e:
+            return 400, self._error(f"missing parameter {e}"), 'application/json', False
+
+        except ValueError as e:
+            return 400, self._error(str(e)), 'application/json', False
+
+        except Exception as e:
+            logging.exception(f"SERVICE : {endpoint} failed for {params}")
+            return 500, self._error(str(e)), 'application/json', False
+
+    @staticmethod
+    def _error(message):
+        return json_body({'error': message})
+
+    def stats(self):
+        return {'uptime_seconds': time.time() - self.started, 'cache': self.cache.stats(), 'endpoints': self.latency.report()}
+
+    def prometheus(self):
+        stats = self.stats()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_service_{name} {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_service_{name} {kind}")
+
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f"{PROMETHEUS_PREFIX}_service_{name}{{{label_text}}} {value}" if label_text
+                             else f"{PROMETHEUS_PREFIX}_service_{name} {value}")
+
+        endpoints = stats['endpoints'].items()
+
+        metric('requests_total', 'counter', "Requests per endpoint",
+               [({'endpoint': endpoint}, entry['requests']) for endpoint, entry in endpoints])
+        metric('errors_total', 'counter', "Requests answered with a 4xx or 5xx status",
+               [({'endpoint': endpoint}, entry['errors']) for endpoint, entry in endpoints])
+        metric('cached_responses_total', 'counter', "Requests answered from the response cache",
+               [({'endpoint': endpoint}, entry['cached']) for endpoint, entry in endpoints])
+        metric('request_seconds', 'summary', f"Request latency, quantiles over the last {LATENCY_WINDOW} requests",
+               [({'endpoint': endpoint, 'quantile': q}, value) for endpoint, entry in endpoints
+                for q, value in entry['quantiles'].items() if value is not None])
+
+        for endpoint, entry in endpoints:
+            lines.append(f'{PROMETHEUS_PREFIX}_service_request_seconds_sum{{endpoint="{endpoint}"}} {entry["seconds"]}')
+            lines.append(f'{PROMETHEUS_PREFIX}_service_request_seconds_count{{endpoint="{endpoint}"}} {entry["requests"]}')
+
+        cache = stats['cache']
+
+        metric('cache_hits_total', 'counter', "Cache hits per entry kind",
+               [({'kind': kind}, entry['hits']) for kind, entry in cache['kinds'].items()])
+        metric('cache_misses_total', 'counter', "Cache misses per entry kind",
+               [({'kind': kind}, entry['misses']) for kind, entry in cache['kinds'].items()])
+        metric('cache_bytes', 'gauge', "Bytes held by the cache", [({}, cache['bytes'])])
+        metric('cache_entries', 'gauge', "Entries held by the cache", [({}, cache['entries'])])
+        metric('cache_evictions_total', 'counter', "Entries evicted to stay under the byte limit", [({}, cache['evictions'])])
+        metric('cache_invalidations_total', 'counter', "Entries dropped because their source file changed",
+               [({}, cache['invalidations'])])
+
+        return '\n'.join(lines) + '\n'
+
+class QueryHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def do_GET(self):
+        start_time = time.perf_counter()
+        url = urlparse(self.path)
+        endpoint = url.path.strip('/')
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        status, body, content_type, cached = self.service.handle(endpoint, params)
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+        if endpoint not in ('stats', 'metrics'):
+            self.service.latency.observe(endpoint, time.perf_counter() - start_time, status, cached)
+
+    def log_message(self, format, *args):
+        logging.debug(f"SERVICE : {self.address_string()} {format % args}")
+
+def serve(host=SERVICE_HOST, port=SERVICE_PORT, cache_bytes=SERVICE_CACHE_BYTES):
+    service = QueryService(cache_bytes)
+    handler = type('Handler', (QueryHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+
+    logging.info(f"SERVICE : Serving {', '.join(QueryService.ENDPOINTS)} on http://{host}:{server.server_port}/ "
+                 f"with a {cache_bytes / 2 ** 20:.0f} MiB cache")
+
+    try:
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        server.server_close()
+        service.queries.store.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve point, region and grid queries over the processed GPV-MSM archive")
+    parser.add_argument('--host', default=SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=SERVICE_PORT)
+    parser.add_argument('--cache-bytes', type=int, default=SERVICE_CACHE_BYTES, help="upper bound of decoded arrays and results kept in memory")
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.cache_bytes)
+
+if __name__ == "__main__":
+    main()
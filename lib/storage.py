@@ -0,0 +1,109 @@
+import logging
+import numpy as np
+
+STORAGE_PROFILES = {
+    'legacy': {'compression': None, 'complevel': 0, 'shuffle': False, 'chunking': None, 'packing': False},
+    'map': {'compression': 'zlib', 'complevel': 4, 'shuffle': True, 'chunking': 'map', 'packing': False},
+    'series': {'compression': 'zlib', 'complevel': 4, 'shuffle': True, 'chunking': 'series', 'packing': False},
+    'packed': {'compression': 'zlib', 'complevel': 4, 'shuffle': True, 'chunking': 'map', 'packing': True},
+}
+
+SERIES_CHUNK = (32, 32, 32)
+PACKED_FILL_VALUE = np.int16(-32768)
+
+def get_profile(profile):
+    if isinstance(profile, dict):
+        return profile
+
+    if profile not in STORAGE_PROFILES:
+        raise ValueError(f"Invalid storage profile: {profile}")
+
+    return STORAGE_PROFILES[profile]
+
+def time_dimension_size(profile, length):
+    return None if get_profile(profile)['chunking'] is None else length
+
+def _chunk_shape(settings, shape):
+    if settings['chunking'] is None or len(shape) == 0:
+        return None
+
+    if settings['chunking'] == 'map':
+        return [1] * (len(shape) - 2) + [max(1, size) for size in shape[-2:]]
+
+    series_chunk = SERIES_CHUNK[-len(shape):]
+
+    return [max(1, min(size, chunk)) for size, chunk in zip(shape, series_chunk)]
+
+def create_data_variable(dataset, name, dtype, dimensions, profile, pack_scale=None):
+    settings = get_profile(profile)
+    shape = [len(dataset.dimensions[dimension]) for dimension in dimensions]
+    is_float = np.dtype(dtype).kind == 'f'
+    packed = settings['packing'] and is_float and pack_scale is not None
+
+    kwargs = {}
+
+    if settings['compression'] is not None:
+        kwargs.update(compression=settings['compression'], complevel=settings['complevel'], shuffle=settings['shuffle'])
+
+    chunk_shape = _chunk_shape(settings, shape)
+
+    if chunk_shape is not None:
+        kwargs['chunksizes'] = chunk_shape
+
+    if packed:
+        kwargs['fill_value'] = PACKED_FILL_VALUE
+
+    elif is_float and settings['chunking'] is not None:
+        kwargs['fill_value'] = np.nan
+
+    variable = dataset.createVariable(name, 'i2' if packed else dtype, dimensions, **kwargs)
+
+    if packed:
+        variable.scale_factor = np.float32(pack_scale)
+        variable.add_offset = np.float32(0.0)
+
+    if settings['chunking'] == 'series' and chunk_shape is not None and len(shape) == 3:
+        band_bytes = chunk_shape[0] * shape[1] * shape[2] * variable.dtype.itemsize
+        variable.set_var_chunk_cache(size=int(band_bytes * 1.25))
+
+    return variable
+
+def reserve_band_cache(variable, steps):
+    # Tiled writes fill a band of time steps piece by piece, so the cache has to hold every
+    # chunk the band touches or each hyperslab write recompresses a whole chunk.
+
+    chunking = variable.chunking()
+
+    if chunking == 'contiguous' or variable.ndim != 3:
+        return
+
+    band = (-(-steps // chunking[0]) + 1) * chunking[0]
+    band_bytes = min(band, variable.shape[0]) * variable.shape[1] * variable.shape[2] * variable.dtype.itemsize
+    variable.set_var_chunk_cache(size=max(variable.get_var_chunk_cache()[0], int(band_bytes * 1.25)))
+
+def storage_values(variable, data):
+    # Packed values come back quantized exactly as a later read of the variable returns them, so
+    # statistics accumulated while writing agree with ones re-aggregated from the file.
+
+    if getattr(variable, 'scale_factor', None) is not None:
+        invalid = ~np.isfinite(data)
+        scale_factor = variable.scale_factor
+        add_offset = getattr(variable, 'add_offset', np.float32(0.0))
+
+        packed = np.around((np.where(invalid, 0, data) - add_offset) / scale_factor)
+
+        # Values past the packed range saturate instead of wrapping around; the lowest integer
+        # stays reserved for the fill value.
+
+        limits = np.iinfo(variable.dtype)
+        overflow = np.count_nonzero((packed <= limits.min) | (packed > limits.max))
+
+        if overflow:
+            logging.warning(f"STORAGE : {overflow} values of {variable.name} clipped to the packed range "
+                            f"{(limits.min + 1) * scale_factor + add_offset:g} to {limits.max * scale_factor + add_offset:g}")
+
+        packed = np.clip(packed, limits.min + 1, limits.max).astype(variable.dtype)
+
+        return np.ma.masked_array(packed * scale_factor + add_offset, mask=invalid)
+
+    return data
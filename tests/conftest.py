@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+for path in (os.path.join(ROOT_DIR, 'lib'), os.path.join(ROOT_DIR, 'bench')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
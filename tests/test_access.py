@@ -0,0 +1,76 @@
+import os
+import shutil
+
+import numpy as np
+import netCDF4 as nc
+import pytest
+
+from access import CubeStore
+from synthetic import write_year_cube
+
+@pytest.fixture
+def cube_file(tmp_path):
+    path = write_year_cube(str(tmp_path / 'GPvMSM_year' / '2015.nc'), days=30, scale=0.05, profile='map')
+
+    with nc.Dataset(path, 'a') as dataset:
+        dataset.variables['r1d'][2, 1, 1] = np.ma.masked
+
+    return path
+
+def read_r1d(path):
+    with nc.Dataset(path) as dataset:
+        return np.ma.filled(dataset.variables['r1d'][:].astype(np.float32), np.nan)
+
+@pytest.mark.parametrize('mirrored', [False, True])
+def test_views_match_netcdf_reads(tmp_path, cube_file, mirrored):
+    store = CubeStore(cache_dir=str(tmp_path / 'cube_cache') if mirrored else None)
+    expected = read_r1d(cube_file)
+
+    try:
+        view = store.view(cube_file, 'r1d')
+
+        assert len(view) == 30 and view.shape == expected.shape
+        assert np.isnan(view[2, 1, 1])
+
+        np.testing.assert_array_equal(view[5:17], expected[5:17])
+        np.testing.assert_array_equal(view[:, 3, 4], expected[:, 3, 4])
+        np.testing.assert_array_equal(np.asarray(view), expected)
+
+    finally:
+        store.close()
+
+def test_mirror_is_rebuilt_when_the_source_changes(tmp_path, cube_file):
+    cache_dir = str(tmp_path / 'cube_cache')
+    store = CubeStore(cache_dir=cache_dir)
+
+    try:
+        np.testing.assert_array_equal(store.view(cube_file, 'r1d')[0], read_r1d(cube_file)[0])
+
+        temp_file = f"{cube_file}.tmp"
+        shutil.copyfile(cube_file, temp_file)
+
+        with nc.Dataset(temp_file, 'a') as dataset:
+            dataset.variables['r1d'][0] = dataset.variables['r1d'][0] + 1
+
+        stat = os.stat(cube_file)
+        os.utime(temp_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        os.replace(temp_file, cube_file)
+
+        np.testing.assert_array_equal(store.view(cube_file, 'r1d')[0], read_r1d(cube_file)[0])
+
+    finally:
+        store.close()
+
+    # A fresh store reuses the mirror on disk instead of writing it again.
+
+    mirror_files = [name for name in os.listdir(cache_dir) if name.endswith('.npy')]
+    mtimes = {name: os.stat(os.path.join(cache_dir, name)).st_mtime_ns for name in mirror_files}
+    store = CubeStore(cache_dir=cache_dir)
+
+    try:
+        np.testing.assert_array_equal(np.asarray(store.view(cube_file, 'r1d')), read_r1d(cube_file))
+
+    finally:
+        store.close()
+
+    assert {name: os.stat(os.path.join(cache_dir, name)).st_mtime_ns for name in mirror_files} == mtimes
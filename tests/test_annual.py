@@ -0,0 +1,136 @@
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import netCDF4 as nc
+import pytest
+
+from GPvMSM import DataDownscaler, DataProcessor, getYearSum
+from synthetic import write_daily_r1h
+
+YEAR = 2015
+DAYS = 6
+
+def write_days(folder, days, seed=0):
+    for day in days:
+        date = datetime(YEAR, 1, 1) + timedelta(days=day)
+        path = write_daily_r1h(os.path.join(folder, f"{date.strftime('%Y%m%d')}.nc"), date, scale=0.05, seed=seed)
+
+        # A rewrite within the same clock tick must still look changed to the stat fingerprint.
+
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + day + 1))
+
+def process(folder, output_file, profile, streaming, workers=1):
+    return DataProcessor(YEAR, folder, output_file, streaming=streaming, workers=workers,
+                         storage_profile=profile).process_year()
+
+def aggregate(input_file, profile):
+    aggregator = getYearSum(input_file, year=YEAR, storage_profile=profile)
+
+    try:
+        return aggregator.aggregate_annual_data()
+
+    finally:
+        aggregator.close()
+
+def read_r1d(path):
+    with nc.Dataset(path) as dataset:
+        return np.ma.filled(dataset.variables['r1d'][:].astype(np.float64), np.nan)
+
+def assert_same_statistics(actual, expected):
+    assert actual.keys() == expected.keys()
+
+    for name in expected:
+        np.testing.assert_array_equal(actual[name], expected[name], err_msg=name)
+
+@pytest.mark.parametrize('profile', ['legacy', 'map', 'packed'])
+def test_streaming_batch_and_patch_agree(tmp_path, profile):
+    folder = str(tmp_path / 'daily')
+    write_days(folder, range(DAYS))
+
+    streaming_file = str(tmp_path / 'streaming' / f'{YEAR}.nc')
+    streamed = process(folder, streaming_file, profile, streaming=True)
+
+    batch_file = str(tmp_path / 'batch' / f'{YEAR}.nc')
+    assert process(folder, batch_file, profile, streaming=False) is None
+
+    # The patched cube starts from a different day 2 and without the last day, then picks both up.
+
+    patch_folder = str(tmp_path / 'patch_daily')
+    write_days(patch_folder, range(DAYS - 1))
+    write_days(patch_folder, [2], seed=1)
+
+    patch_file = str(tmp_path / 'patch' / f'{YEAR}.nc')
+    process(patch_folder, patch_file, profile, streaming=True)
+
+    write_days(patch_folder, [2, DAYS - 1])
+    assert process(patch_folder, patch_file, profile, streaming=True) is None
+
+    np.testing.assert_array_equal(read_r1d(batch_file), read_r1d(streaming_file))
+    np.testing.assert_array_equal(read_r1d(patch_file), read_r1d(streaming_file))
+
+    assert_same_statistics(aggregate(streaming_file, profile), streamed)
+    assert_same_statistics(aggregate(batch_file, profile), streamed)
+    assert_same_statistics(aggregate(patch_file, profile), streamed)
+
+@pytest.mark.parametrize('streaming', [True, False])
+def test_worker_pool_matches_a_single_worker(tmp_path, streaming):
+    folder = str(tmp_path / 'daily')
+    write_days(folder, range(DAYS))
+
+    serial_file = str(tmp_path / 'serial' / f'{YEAR}.nc')
+    pooled_file = str(tmp_path / 'pooled' / f'{YEAR}.nc')
+    serial = process(folder, serial_file, 'map', streaming, workers=1)
+    pooled = process(folder, pooled_file, 'map', streaming, workers=2)
+
+    np.testing.assert_array_equal(read_r1d(pooled_file), read_r1d(serial_file))
+
+    if streaming:
+        assert_same_statistics(pooled, serial)
+
+    else:
+        assert serial is None and pooled is None
+        assert_same_statistics(aggregate(pooled_file, 'map'), aggregate(serial_file, 'map'))
+
+def test_unchanged_inputs_are_skipped(tmp_path):
+    folder = str(tmp_path / 'daily')
+    write_days(folder, range(2))
+
+    output_file = str(tmp_path / 'year' / f'{YEAR}.nc')
+    assert process(folder, output_file, 'map', streaming=True) is not None
+
+    mtime_ns = os.stat(output_file).st_mtime_ns
+    assert process(folder, output_file, 'map', streaming=True) is None
+    assert os.stat(output_file).st_mtime_ns == mtime_ns
+
+def test_daily_products_count_time_in_days(tmp_path):
+    folder = str(tmp_path / 'daily')
+    write_days(folder, range(2))
+
+    year_file = str(tmp_path / 'year' / f'{YEAR}.nc')
+    process(folder, year_file, 'map', streaming=True)
+
+    with nc.Dataset(year_file) as dataset:
+        assert dataset.variables['time'].units == 'day of year'
+
+    # A cube written before time carried units still downscales to a daily product.
+
+    old_file = str(tmp_path / 'year' / f'{YEAR}_old.nc')
+
+    with nc.Dataset(year_file) as source, nc.Dataset(old_file, 'w') as target:
+        for name, dimension in source.dimensions.items():
+            target.createDimension(name, len(dimension))
+
+        for name, variable in source.variables.items():
+            target.createVariable(name, variable.dtype, variable.dimensions)[:] = variable[:]
+
+    for input_file in (year_file, old_file):
+        output_file = str(tmp_path / 'downscaled' / f'{os.path.basename(input_file)[:-3]}_daily_max.nc')
+        DataDownscaler(input_file, output_file, 'max', variable='r1d', storage_profile='map',
+                       regrid_cache_dir='').downscale_data()
+
+        with nc.Dataset(input_file) as source, nc.Dataset(output_file) as dataset:
+            assert dataset.variables['time'].units == 'day of year'
+            assert dataset.variables['r1d'].units == 'mm/day'
+            np.testing.assert_array_equal(dataset.variables['time'][:], source.variables['time'][:])
@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from GPvMSM import MANIFEST_FILENAME, GPvMSM_Downloder
+from synthetic import write_daily_r1h
+
+DAY = datetime(2015, 1, 1)
+URL_PATH = '/2015/0101.nc'
+LOCAL_NAME = '20150101.nc'
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    # files: URL path -> body. script: URL path -> list of responses served before the file,
+    # either an HTTP status or 'cut' for a body that stops halfway.
+
+    files = {}
+    script = {}
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get('Range')))
+        script = self.script.get(self.path)
+        action = script.pop(0) if script else None
+
+        if isinstance(action, int):
+            self.send_error(action)
+            return
+
+        if self.path not in self.files:
+            self.send_error(404)
+            return
+
+        body = self.files[self.path]
+        start = 0
+        range_header = self.headers.get('Range')
+
+        if range_header and range_header.startswith('bytes=') and range_header.endswith('-'):
+            start = int(range_header[len('bytes='):-1])
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{len(body) - 1}/{len(body)}")
+
+        else:
+            self.send_response(200)
+
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+
+        if action == 'cut':
+            self.wfile.write(body[start:start + (len(body) - start) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+
+        self.wfile.write(body[start:])
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def archive():
+    handler = type('Handler', (ArchiveHandler,), {'files': {}, 'script': {}, 'requests': []})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    handler.base_url = f"http://127.0.0.1:{server.server_port}/"
+
+    yield handler
+
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def day_file(tmp_path):
+    path = write_daily_r1h(str(tmp_path / 'source' / LOCAL_NAME), DAY, scale=0.05)
+
+    with open(path, 'rb') as file:
+        return file.read()
+
+def downloader(archive, folder, **kwargs):
+    kwargs = dict({'workers': 2, 'backoff': 0.01, 'retries': 2, 'chunk_size': 1024}, **kwargs)
+
+    return GPvMSM_Downloder(DAY, DAY, str(folder), archive.base_url, **kwargs)
+
+def read_manifest(folder):
+    with open(os.path.join(folder, MANIFEST_FILENAME)) as file:
+        return json.load(file)
+
+def read_local(folder):
+    with open(os.path.join(folder, LOCAL_NAME), 'rb') as file:
+        return file.read()
+
+def test_download_records_the_file_and_reruns_skip_it(archive, day_file, tmp_path):
+    folder = tmp_path / 'daily'
+    archive.files[URL_PATH] = day_file
+
+    downloader(archive, folder).download_files()
+
+    assert read_local(folder) == day_file
+    assert read_manifest(folder)[LOCAL_NAME] == {'size': len(day_file), 'sha256': hashlib.sha256(day_file).hexdigest()}
+    assert len(archive.requests) == 1
+
+    rerun = downloader(archive, folder)
+    rerun.download_files()
+
+    assert len(archive.requests) == 1
+    assert rerun.files_downloaded == 0
+
+@pytest.mark.parametrize('cut_at', [2000, 0.5, -10])
+def test_truncated_leftover_is_fetched_again(archive, day_file, tmp_path, cut_at):
+    folder = tmp_path / 'daily'
+    folder.mkdir()
+    size = int(len(day_file) * cut_at) if isinstance(cut_at, float) else cut_at % len(day_file)
+
+    (folder / LOCAL_NAME).write_bytes(day_file[:size])
+    archive.files[URL_PATH] = day_file
+
+    assert not GPvMSM_Downloder._is_valid_netcdf(str(folder / LOCAL_NAME))
+
+    downloader(archive, folder).download_files()
+
+    assert read_local(folder) == day_file
+    assert read_manifest(folder)[LOCAL_NAME]['size'] == len(day_file)
+    assert len(archive.requests) == 1
+
+def test_interrupted_transfer_resumes_with_range(archive, day_file, tmp_path):
+    folder = tmp_path / 'daily'
+    archive.files[URL_PATH] = day_file
+    archive.script[URL_PATH] = ['cut']
+
+    downloader(archive, folder).download_files()
+
+    assert read_local(folder) == day_file
+    assert read_manifest(folder)[LOCAL_NAME]['sha256'] == hashlib.sha256(day_file).hexdigest()
+    assert not os.path.exists(folder / f"{LOCAL_NAME}.part")
+
+    (_, first_range), (_, second_range) = archive.requests
+    assert first_range is None
+    assert second_range is not None and int(second_range[len('bytes='):-1]) > 0
+
+def test_server_errors_are_retried_with_backoff(archive, day_file, tmp_path):
+    folder = tmp_path / 'daily'
+    archive.files[URL_PATH] = day_file
+    archive.script[URL_PATH] = [503, 500]
+
+    start_time = time.perf_counter()
+    downloader(archive, folder, backoff=0.05).download_files()
+
+    assert time.perf_counter() - start_time >= 0.05 + 0.1
+    assert len(archive.requests) == 3
+    assert read_local(folder) == day_file
+
+def test_retries_give_up_after_the_limit(archive, day_file, tmp_path):
+    folder = tmp_path / 'daily'
+    archive.files[URL_PATH] = day_file
+    archive.script[URL_PATH] = [503, 503, 503, 503]
+
+    assert downloader(archive, folder, retries=2)._download_file_with_retry(DAY) is False
+    assert len(archive.requests) == 3
+    assert not os.path.exists(folder / LOCAL_NAME)
+
+def test_missing_file_fails_without_retrying(archive, tmp_path):
+    folder = tmp_path / 'daily'
+    download = downloader(archive, folder)
+
+    assert download._download_file_with_retry(DAY) is False
+    assert len(archive.requests) == 1
+    assert not os.path.exists(folder / LOCAL_NAME)
+
+def test_non_netcdf_body_is_rejected(archive, tmp_path):
+    folder = tmp_path / 'daily'
+    archive.files[URL_PATH] = b'<html><body>maintenance</body></html>'
+
+    assert downloader(archive, folder, retries=1)._download_file_with_retry(DAY) is False
+
+    assert len(archive.requests) == 2
+    assert not os.path.exists(folder / LOCAL_NAME)
+    assert not os.path.exists(folder / f"{LOCAL_NAME}.part")
+    assert not os.path.exists(folder / MANIFEST_FILENAME)
@@ -0,0 +1,163 @@
+import numpy as np
+import netCDF4 as nc
+import pytest
+
+from extract import GridIndex, SeriesExtractor, points_in_polygon, read_cells
+from synthetic import msm_grid, write_year_cube
+
+DAYS = 20
+
+@pytest.fixture
+def grid():
+    lat, lon = msm_grid(0.05)
+
+    return GridIndex(lat, lon), lat.astype(np.float64), lon.astype(np.float64)
+
+def weight_map(index, rows, cols, weights):
+    dense = np.zeros((len(rows),) + index.shape)
+
+    for point in range(len(rows)):
+        np.add.at(dense[point], (rows[point], cols[point]), weights[point])
+
+    return dense
+
+def test_bilinear_weights_at_grid_points_and_midpoints(grid):
+    index, lat, lon = grid
+
+    # Every grid point, including the last row and column, takes its whole weight from itself.
+
+    corners = [(0, 0), (3, 5), (len(lat) - 1, len(lon) - 1), (0, len(lon) - 1)]
+    rows, cols, weights = index.bilinear(lat[[r for r, _ in corners]], lon[[c for _, c in corners]])
+
+    for dense, (row, col) in zip(weight_map(index, rows, cols, weights), corners):
+        expected = np.zeros(index.shape)
+        expected[row, col] = 1.0
+
+        np.testing.assert_allclose(dense, expected, atol=1e-9)
+
+    # Cell midpoints split the weight evenly over the four surrounding points.
+
+    rows, cols, weights = index.bilinear((lat[[2, 7]] + lat[[3, 8]]) / 2, (lon[[4, 0]] + lon[[5, 1]]) / 2)
+
+    for dense, (row, col) in zip(weight_map(index, rows, cols, weights), [(2, 4), (7, 0)]):
+        expected = np.zeros(index.shape)
+        expected[row:row + 2, col:col + 2] = 0.25
+
+        # The float32 grid puts midpoints within about 1e-4 of a cell of the regular axis midpoint.
+
+        np.testing.assert_allclose(dense, expected, atol=1e-4)
+
+def test_points_outside_the_grid_get_no_weight(grid):
+    index, lat, lon = grid
+    lats = [lat[0] + 0.01, lat[-1] - 0.01, lat[1], lat[1]]
+    lons = [lon[1], lon[1], lon[0] - 0.01, lon[-1] + 0.01]
+
+    _, _, weights = index.bilinear(lats, lons)
+    assert not weights.any()
+
+    # Nearest keeps half a cell of slack past the edges.
+
+    _, _, weights = index.nearest([lat[0] + 0.02, lat[0] + 0.03], [lon[1], lon[1]])
+    np.testing.assert_array_equal(weights.ravel(), [1.0, 0.0])
+
+def test_box_regions_include_their_edges(grid):
+    index, lat, lon = grid
+    rows, cols = index.region_cells((lon[1], lat[3], lon[4], lat[1]))
+
+    expected_rows, expected_cols = np.meshgrid(np.arange(1, 4), np.arange(1, 5), indexing='ij')
+
+    np.testing.assert_array_equal(rows, expected_rows.ravel())
+    np.testing.assert_array_equal(cols, expected_cols.ravel())
+
+def test_polygon_membership(grid):
+    index, lat, lon = grid
+
+    # A triangle against a point-by-point check of the cells well away from its edges.
+
+    triangle = np.array([(lon[1], lat[1]), (lon[12], lat[2]), (lon[4], lat[10])])
+    rows, cols = index.region_cells(triangle)
+    selected = set(zip(rows.tolist(), cols.tolist()))
+
+    grid_rows, grid_cols = np.meshgrid(np.arange(len(lat)), np.arange(len(lon)), indexing='ij')
+    inside = points_in_polygon(lon[grid_cols.ravel()], lat[grid_rows.ravel()], triangle)
+
+    assert selected == set(zip(grid_rows.ravel()[inside].tolist(), grid_cols.ravel()[inside].tolist()))
+    assert (5, 5) in selected and (1, 11) not in selected and (9, 1) not in selected
+
+    # Two polygons sharing an edge split the points on it, so none is counted twice or lost.
+
+    west = np.array([(lon[1], lat[6]), (lon[4], lat[6]), (lon[4], lat[1]), (lon[1], lat[1])])
+    east = np.array([(lon[4], lat[6]), (lon[8], lat[6]), (lon[8], lat[1]), (lon[4], lat[1])])
+    both = np.array([(lon[1], lat[6]), (lon[8], lat[6]), (lon[8], lat[1]), (lon[1], lat[1])])
+
+    west_cells = set(zip(*[axis.tolist() for axis in index.region_cells(west)]))
+    east_cells = set(zip(*[axis.tolist() for axis in index.region_cells(east)]))
+    both_cells = set(zip(*[axis.tolist() for axis in index.region_cells(both)]))
+
+    assert not west_cells & east_cells
+    assert west_cells | east_cells == both_cells
+    assert any(col == 4 for _, col in both_cells)
+
+def write_contiguous_cube(path, source, format):
+    with nc.Dataset(source) as source_ds, nc.Dataset(path, 'w', format=format) as ds:
+        for name, dimension in source_ds.dimensions.items():
+            ds.createDimension(name, len(dimension))
+
+        for name, variable in source_ds.variables.items():
+            kwargs = {'contiguous': True} if format == 'NETCDF4' else {}
+            ds.createVariable(name, variable.dtype, variable.dimensions, **kwargs)[:] = variable[:]
+
+    return path
+
+@pytest.fixture(params=['netcdf3', 'contiguous', 'legacy', 'map', 'series', 'packed'])
+def cube_file(request, tmp_path):
+    profile = request.param if request.param in ('legacy', 'map', 'series', 'packed') else 'legacy'
+    path = write_year_cube(str(tmp_path / 'source.nc'), days=DAYS, scale=0.1, profile=profile)
+
+    with nc.Dataset(path, 'a') as dataset:
+        dataset.variables['r1d'][3, 10, 12] = np.ma.masked
+
+    if request.param == 'netcdf3':
+        return write_contiguous_cube(str(tmp_path / '2015.nc'), path, 'NETCDF3_CLASSIC')
+
+    if request.param == 'contiguous':
+        return write_contiguous_cube(str(tmp_path / '2015.nc'), path, 'NETCDF4')
+
+    return path
+
+def test_read_cells_matches_direct_reads(cube_file):
+    rng = np.random.default_rng(3)
+
+    with nc.Dataset(cube_file) as dataset:
+        variable = dataset.variables['r1d']
+        _, lat_len, lon_len = variable.shape
+
+        # Scattered cells across the grid, a tight cluster, and the masked cell.
+
+        cells = rng.choice(lat_len * lon_len, 25, replace=False)
+        cells = np.unique(np.concatenate([cells, [10 * lon_len + 12, 10 * lon_len + 13, 11 * lon_len + 12]]))
+        rows, cols = cells // lon_len, cells % lon_len
+
+        for chunk_days in (1, 7, DAYS):
+            values = read_cells(variable, rows, cols, chunk_days)
+
+            for cell, (row, col) in enumerate(zip(rows, cols)):
+                expected = np.ma.filled(np.ma.asarray(variable[:, row, col], dtype=np.float32), np.nan)
+
+                np.testing.assert_array_equal(values[:, cell], expected)
+
+        assert read_cells(variable, np.array([], dtype=np.int64), np.array([], dtype=np.int64)).shape == (DAYS, 0)
+
+def test_point_series_follow_the_cube(tmp_path):
+    path = write_year_cube(str(tmp_path / '2015.nc'), days=DAYS, scale=0.1, profile='map')
+
+    with nc.Dataset(path) as dataset:
+        lat, lon = dataset.variables['lat'][:].astype(np.float64), dataset.variables['lon'][:].astype(np.float64)
+        r1d = dataset.variables['r1d'][:].astype(np.float64)
+
+    extractor = SeriesExtractor([path])
+    dates, values = extractor.points([lat[4], (lat[6] + lat[7]) / 2], [lon[9], (lon[2] + lon[3]) / 2], 'bilinear')
+
+    assert dates[0] == np.datetime64('2015-01-01') and len(dates) == DAYS
+    np.testing.assert_array_equal(values[:, 0], r1d[:, 4, 9].astype(np.float32))
+    np.testing.assert_allclose(values[:, 1], r1d[:, 6:8, 2:4].mean(axis=(1, 2)), rtol=1e-4)
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from extremes import WET_HOUR_THRESHOLD, HourlyExtremes, histogram_edges
+
+SHAPE = (4, 5)
+THRESHOLDS = (1.0, 5.0)
+WINDOWS = (3, 24)
+BINS = 64
+
+@pytest.fixture
+def hours():
+    rng = np.random.default_rng(5)
+    wet = rng.random((5 * 24,) + SHAPE) < 0.3
+    values = np.where(wet, rng.gamma(0.8, 4.0, wet.shape), 0.0).astype(np.float32)
+    values[30, 0, 0] = np.nan
+    values[:, 3, 4] = np.nan
+
+    return values
+
+def accumulate(hours, skip_after=None):
+    accumulator = HourlyExtremes(SHAPE, THRESHOLDS, WINDOWS, BINS)
+
+    for day in range(len(hours) // 24):
+        accumulator.update_day(hours[day * 24:(day + 1) * 24])
+
+        if day == skip_after:
+            accumulator.skip_day()
+
+    return accumulator.result([50, 95])
+
+def rolling_max(series, window):
+    filled = np.nan_to_num(series)
+    cumulative = np.concatenate([np.zeros((1,) + SHAPE), np.cumsum(filled, axis=0, dtype=np.float64)])
+
+    return (cumulative[window:] - cumulative[:-window]).max(axis=0)
+
+def test_streamed_extremes_match_the_whole_series(hours):
+    results = accumulate(hours)
+    filled = np.nan_to_num(hours)
+    valid = ~np.isnan(hours)
+
+    np.testing.assert_array_equal(results['valid_hours'], valid.sum(axis=0))
+    np.testing.assert_array_equal(results['wet_hours'], (filled >= WET_HOUR_THRESHOLD).sum(axis=0))
+    np.testing.assert_array_equal(results['max_hourly'][:3], np.nanmax(hours[:, :3], axis=0))
+
+    for threshold in THRESHOLDS:
+        np.testing.assert_array_equal(results[f'hours_over_{threshold:g}mm'], (filled >= threshold).sum(axis=0))
+
+    # Rolling windows run across midnight as if the days were one series.
+
+    for window in WINDOWS:
+        np.testing.assert_allclose(results[f'max_{window}h'][:3], rolling_max(hours, window)[:3], rtol=1e-6)
+
+    assert np.isnan(results['max_hourly'][3, 4]) and np.isnan(results['max_24h'][3, 4])
+    assert np.isnan(results['p95_hourly'][3, 4])
+
+def test_skipped_day_restarts_rolling_windows(hours):
+    results = accumulate(hours, skip_after=1)
+
+    expected = np.maximum(rolling_max(hours[:48], 24), rolling_max(hours[48:], 24))
+    np.testing.assert_allclose(results['max_24h'][:3], expected[:3], rtol=1e-6)
+
+def test_percentiles_stay_next_to_the_target_rank(hours):
+    results = accumulate(hours)
+    edges = histogram_edges(BINS)
+    ratio = edges[1] / edges[0]
+
+    for row in range(3):
+        for col in range(5):
+            wet = np.sort(hours[:, row, col][hours[:, row, col] >= WET_HOUR_THRESHOLD])
+
+            for q in (50, 95):
+                # The wet hours on either side of the target rank, widened by one geometric bin.
+
+                rank = int(np.ceil(q / 100.0 * len(wet)))
+                lower, upper = wet[max(rank - 2, 0)], wet[min(rank, len(wet) - 1)]
+                approximate = results[f'p{q}_hourly'][row, col]
+
+                assert lower / ratio <= approximate <= upper * ratio
+                assert approximate <= results['max_hourly'][row, col]
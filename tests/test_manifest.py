@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from manifest import BuildManifest, fingerprint
+
+def touch(path, content=None):
+    if content is not None:
+        with open(path, 'w') as file:
+            file.write(content)
+
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+@pytest.fixture
+def build(tmp_path):
+    inputs = {name: str(tmp_path / name) for name in ('a.nc', 'b.nc')}
+
+    for name, path in inputs.items():
+        touch(path, name)
+
+    product = str(tmp_path / 'product.nc')
+    touch(product, 'product')
+
+    return inputs, product
+
+@pytest.mark.parametrize('mode', ['stat', 'sha256'])
+def test_recorded_build_is_up_to_date(build, mode):
+    inputs, product = build
+    BuildManifest(product, mode).record(inputs, {'days': 365})
+
+    manifest = BuildManifest(product, mode)
+
+    assert manifest.is_up_to_date(inputs, {'days': 365})
+    assert not manifest.is_up_to_date(inputs, {'days': 366})
+    assert not BuildManifest(product, 'sha256' if mode == 'stat' else 'stat').is_up_to_date(inputs, {'days': 365})
+
+def test_changed_inputs_are_listed(build):
+    inputs, product = build
+    BuildManifest(product).record(inputs, {})
+
+    touch(inputs['b.nc'])
+    os.remove(inputs['a.nc'])
+
+    assert BuildManifest(product).changed_inputs(inputs) == ['a.nc', 'b.nc']
+
+def test_sha256_ignores_touched_but_unchanged_inputs(build):
+    inputs, product = build
+    BuildManifest(product, 'sha256').record(inputs, {})
+
+    touch(inputs['a.nc'])
+
+    assert BuildManifest(product, 'sha256').is_up_to_date(inputs, {})
+    assert not BuildManifest(product, 'sha256').is_up_to_date(dict(inputs, **{'a.nc': inputs['b.nc']}), {})
+
+def test_modified_product_is_rebuilt(build):
+    inputs, product = build
+    BuildManifest(product).record(inputs, {})
+
+    touch(product, 'edited by hand')
+
+    assert not BuildManifest(product).is_up_to_date(inputs, {})
+
+def test_missing_file_has_no_fingerprint(tmp_path):
+    assert fingerprint(str(tmp_path / 'missing.nc')) is None
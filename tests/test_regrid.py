@@ -0,0 +1,117 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from regrid import DOWNSCALING_METHODS, GridMapping, downscale_methods
+from synthetic import msm_grid
+
+GRID_SIZE = 0.5
+
+# 0.5° cells hold an even number of source points on both axes, 0.15° cells a mix of odd and even.
+GRID_SIZES = (0.5, 0.15)
+
+def baseline_downscale(data, lat, lon, target_lat, target_lon, grid_size, method):
+    # The per-cell boolean-mask loop the bin index replaced.
+
+    target_data = np.zeros((len(target_lat), len(target_lon)))
+
+    for i, lat_value in enumerate(target_lat):
+        for j, lon_value in enumerate(target_lon):
+            lat_in_cell = (lat >= lat_value - grid_size / 2.0) & (lat < lat_value + grid_size / 2.0)
+            lon_in_cell = (lon >= lon_value - grid_size / 2.0) & (lon < lon_value + grid_size / 2.0)
+            cell_data = data[:, lat_in_cell, :][:, :, lon_in_cell]
+
+            if cell_data.size == 0:
+                target_data[i, j] = np.nan
+
+            elif method == 'max':
+                target_data[i, j] = np.nanmax(cell_data)
+
+            elif method == 'median':
+                target_data[i, j] = np.nanmedian(cell_data)
+
+            elif method == 'mean':
+                target_data[i, j] = np.nanmean(cell_data)
+
+            else:
+                _, rows, cols = cell_data.shape
+
+                if rows % 2 == 1 and cols % 2 == 1:
+                    target_data[i, j] = cell_data[0, rows // 2, cols // 2]
+
+                else:
+                    center_values = cell_data[:, rows // 2 - 1:rows // 2 + 1, cols // 2 - 1:cols // 2 + 1]
+                    target_data[i, j] = np.nanmean(center_values)
+
+    return target_data
+
+def source_field():
+    lat, lon = msm_grid(0.2)
+    rng = np.random.default_rng(7)
+    data = rng.gamma(2.0, 500.0, (1, len(lat), len(lon)))
+    data[rng.random(data.shape) < 0.05] = np.nan
+    data[:, :4, :6] = np.nan
+
+    return data, lat, lon
+
+def target_grid(lat, lon, grid_size):
+    return np.arange(np.min(lat), np.max(lat), grid_size), np.arange(np.min(lon), np.max(lon), grid_size)
+
+@pytest.fixture(scope='module')
+def annual_field():
+    data, lat, lon = source_field()
+
+    return (data, lat, lon) + target_grid(lat, lon, GRID_SIZE)
+
+@pytest.mark.parametrize('grid_size', GRID_SIZES)
+@pytest.mark.parametrize('method', DOWNSCALING_METHODS)
+def test_downscale_matches_baseline_loop(method, grid_size):
+    data, lat, lon = source_field()
+    target_lat, target_lon = target_grid(lat, lon, grid_size)
+    mapping = GridMapping.build(lat, lon, target_lat, target_lon, grid_size, grid_size)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+
+        expected = baseline_downscale(data, lat, lon, target_lat, target_lon, grid_size, method)
+        result = downscale_methods(data, mapping, [method])[method]
+
+    assert result.shape == (1,) + expected.shape
+    np.testing.assert_array_equal(result[0], expected)
+
+def test_all_time_steps_match_single_steps(annual_field):
+    data, lat, lon, target_lat, target_lon = annual_field
+    cube = np.concatenate([data, data * 0.5, np.flip(data, axis=2)])
+    mapping = GridMapping.build(lat, lon, target_lat, target_lon, GRID_SIZE, GRID_SIZE)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+
+        batched = downscale_methods(cube, mapping, DOWNSCALING_METHODS)
+
+        for step in range(len(cube)):
+            single = downscale_methods(cube[step:step + 1], mapping, DOWNSCALING_METHODS)
+
+            for method in DOWNSCALING_METHODS:
+                np.testing.assert_array_equal(batched[method][step], single[method][0])
+
+def test_tile_windows_cover_the_full_mapping(annual_field):
+    data, lat, lon, target_lat, target_lon = annual_field
+    mapping = GridMapping.build(lat, lon, target_lat, target_lon, GRID_SIZE, GRID_SIZE)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+
+        expected = downscale_methods(data, mapping, ['max', 'mean'])
+        tiled = {method: np.full_like(values, np.nan) for method, values in expected.items()}
+
+        for rows, cols in mapping.tiles(2):
+            window, lat_slice, lon_slice = mapping.window(rows, cols)
+            results = downscale_methods(data[:, lat_slice, lon_slice], window, ['max', 'mean'])
+
+            for method, values in results.items():
+                tiled[method][:, rows, cols] = values
+
+    for method in expected:
+        np.testing.assert_array_equal(tiled[method], expected[method])
@@ -0,0 +1,61 @@
+import numpy as np
+import netCDF4 as nc
+import pytest
+
+from GPvMSM import getYearSum
+from rollup import RollupBuilder, parse_windows, rollup_sums
+from synthetic import write_year_cube
+
+YEAR = 2015
+
+def test_window_specs():
+    monthly = parse_windows(['monthly'], YEAR)
+
+    assert [name for name, _, _ in monthly][:2] == ['jan', 'feb']
+    assert monthly[0][1] == 0 and monthly[-1][2] == 365
+    assert all(previous[2] == current[1] for previous, current in zip(monthly, monthly[1:]))
+
+    assert parse_windows(['jun-jul'], YEAR)[0][1:] == parse_windows(['0601-0731'], YEAR)[0][1:] == (151, 212)
+    assert parse_windows(['JJA'], YEAR) == [('JJA', 151, 243)]
+    assert [name for name, _, _ in parse_windows(['seasonal'], YEAR)] == ['MAM', 'JJA', 'SON']
+    assert parse_windows(['feb'], 2016)[0][1:] == (31, 60)
+
+@pytest.mark.parametrize('spec', ['dec-jan', 'winter', '1301-1302', 'DJF', 'djf'])
+def test_invalid_windows(spec):
+    with pytest.raises(ValueError):
+        parse_windows([spec], YEAR)
+
+def test_window_sums_match_direct_sums():
+    rng = np.random.default_rng(3)
+    cube = rng.gamma(0.8, 4.0, (365, 6, 7)).astype(np.float32)
+    cube[rng.random(cube.shape) < 0.1] = np.nan
+    cube[:, 0, 0] = np.nan
+
+    windows = parse_windows(['monthly', 'seasonal', 'jun-jul', '0110-0320', '0101-1231'], YEAR)
+    sums, counts = rollup_sums(cube, windows, chunk_days=17)
+
+    for index, (name, start, stop) in enumerate(windows):
+        window = cube[start:stop]
+        valid = ~np.isnan(window)
+
+        np.testing.assert_array_equal(counts[index], valid.sum(axis=0), err_msg=name)
+        np.testing.assert_allclose(sums[index], np.where(valid.any(axis=0), np.nansum(window, axis=0, dtype=np.float64), np.nan),
+                                   rtol=1e-6, err_msg=name)
+
+    assert np.isnan(sums[:, 0, 0]).all()
+
+def test_whole_year_window_reproduces_r1y(tmp_path):
+    input_file = write_year_cube(str(tmp_path / 'GPvMSM_year' / f'{YEAR}.nc'), scale=0.05, profile='map')
+    output_file = str(tmp_path / 'GPvMSM_year' / f'{YEAR}_rollup.nc')
+
+    RollupBuilder(input_file, output_file, ['seasonal', '0101-1231'], YEAR, storage_profile='map').build()
+
+    aggregator = getYearSum(input_file, year=YEAR, storage_profile='map')
+    annual_data = aggregator.aggregate_annual_data()
+    aggregator.close()
+
+    with nc.Dataset(output_file) as dataset:
+        assert list(dataset.variables['window'][:]) == ['MAM', 'JJA', 'SON', '0101-1231']
+
+        np.testing.assert_array_equal(dataset.variables['r1w'][3], annual_data['yearly_sum'].astype(np.float32))
+        np.testing.assert_array_equal(dataset.variables['valid_days'][3], annual_data['valid_days'])
@@ -0,0 +1,168 @@
+import os
+import json
+import shutil
+
+import numpy as np
+import netCDF4 as nc
+import pytest
+
+from GPvMSM import DataDownscaler, getYearSum
+from service import LRUCache, QueryService
+from synthetic import write_year_cube
+
+YEAR = 2015
+
+@pytest.fixture(scope='module')
+def archive(tmp_path_factory):
+    root = tmp_path_factory.mktemp('archive')
+    input_file = write_year_cube(str(root / 'nc' / 'GPvMSM_year' / f'{YEAR}.nc'), days=40, scale=0.05, profile='map')
+
+    aggregator = getYearSum(input_file, year=YEAR, storage_profile='map')
+    aggregator.save_to_new_file(aggregator.aggregate_annual_data())
+    aggregator.close()
+
+    DataDownscaler(aggregator.output_file, str(root / 'nc' / 'GPvMSM_DownScaled' / f'{YEAR}_max.nc'), 'max',
+                   storage_profile='map', regrid_cache_dir='').downscale_data()
+
+    return root
+
+@pytest.fixture
+def service(archive, monkeypatch):
+    monkeypatch.chdir(archive)
+    service = QueryService(cache_bytes=64 * 1024 * 1024)
+
+    yield service
+
+    service.queries.store.close()
+
+def query(service, endpoint, **params):
+    status, body, _, cached = service.handle(endpoint, {key: str(value) for key, value in params.items()})
+
+    # Strict parsing: NaN or Infinity tokens would make the body invalid JSON.
+
+    def reject(constant):
+        raise ValueError(f"non-standard JSON constant {constant}")
+
+    return status, json.loads(body, parse_constant=reject), cached
+
+def test_point_matches_the_sum_file(archive, service):
+    with nc.Dataset(archive / 'nc' / 'GPvMSM_year' / f'{YEAR}_sum.nc') as dataset:
+        lat, lon = dataset.variables['lat'][:], dataset.variables['lon'][:]
+        expected = float(dataset.variables['r1y'][0, 3, 4])
+
+    status, result, _ = query(service, 'point', year=YEAR, lat=float(lat[3]), lon=float(lon[4]))
+
+    assert status == 200
+    assert result['value'] == pytest.approx(expected)
+
+def test_region_and_grid(service):
+    status, region, _ = query(service, 'region', year=YEAR, bbox='120,46.5,121,47.5')
+
+    assert status == 200
+    assert region['valid_cells'] == region['cells'] > 0
+    assert region['min'] <= region['mean'] <= region['max']
+
+    status, grid, _ = query(service, 'grid', year=YEAR)
+
+    assert status == 200
+    assert np.array(grid['values'], dtype=float).shape == (len(grid['lat']), len(grid['lon']))
+
+    status, daily, _ = query(service, 'point', year=YEAR, product='daily', lat=47.0, lon=121.0)
+
+    assert status == 200
+    assert len(daily['values']) == len(daily['time']) == 40
+
+@pytest.mark.parametrize('endpoint, params', [
+    ('point', {'year': YEAR, 'lat': 'nan', 'lon': 121.0}),
+    ('point', {'year': YEAR, 'lat': 47.0, 'lon': 'inf'}),
+    ('point', {'year': YEAR, 'lat': 47.0}),
+    ('point', {'year': YEAR, 'lat': 47.0, 'lon': 121.0, 'product': 'hourly'}),
+    ('point', {'year': YEAR, 'lat': 47.0, 'lon': 121.0, 'interpolation': 'cubic'}),
+    ('region', {'year': YEAR}),
+    ('region', {'year': YEAR, 'bbox': '120,46'}),
+    ('grid', {'year': YEAR, 'step': 5}),
+    ('grid', {'year': YEAR, 'product': 'daily'}),
+])
+def test_bad_requests(service, endpoint, params):
+    status, result, _ = query(service, endpoint, **params)
+
+    assert status == 400
+    assert 'error' in result
+
+@pytest.mark.parametrize('endpoint, params', [
+    ('point', {'year': 1999, 'lat': 47.0, 'lon': 121.0}),
+    ('grid', {'year': YEAR, 'method': 'median'}),
+    ('grid', {'year': YEAR, 'grid_size': 0.25}),
+    ('unknown', {}),
+])
+def test_missing_products_and_endpoints(service, endpoint, params):
+    status, result, _ = query(service, endpoint, **params)
+
+    assert status == 404
+    assert 'error' in result
+
+def test_out_of_domain_values_are_null(service):
+    status, point, _ = query(service, 'point', year=YEAR, lat=10.0, lon=150.0)
+
+    assert status == 200 and point['value'] is None
+
+    status, region, _ = query(service, 'region', year=YEAR, bbox='150,10,151,11')
+
+    assert status == 200
+    assert region['cells'] == 0 and region['mean'] is None and region['max'] is None
+
+def rewrite(path, variable, factor):
+    # Products are replaced atomically by the pipeline, the rewrite here does the same.
+
+    temp_file = f"{path}.tmp"
+    shutil.copyfile(path, temp_file)
+
+    with nc.Dataset(temp_file, 'a') as dataset:
+        dataset.variables[variable][:] = dataset.variables[variable][:] * factor
+
+    stat = os.stat(path)
+    os.utime(temp_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    os.replace(temp_file, path)
+
+def test_rewritten_product_invalidates_cached_results(archive, service):
+    params = {'year': YEAR, 'lat': 47.0, 'lon': 121.0}
+
+    _, first, cached = query(service, 'point', **params)
+    assert not cached
+
+    _, again, cached = query(service, 'point', **params)
+    assert cached and again == first
+
+    rewrite(archive / 'nc' / 'GPvMSM_year' / f'{YEAR}_sum.nc', 'r1y', 2)
+
+    _, updated, cached = query(service, 'point', **params)
+
+    assert not cached
+    assert updated['value'] == pytest.approx(first['value'] * 2)
+    assert service.cache.stats()['invalidations'] > 0
+
+def test_grid_responses_follow_the_downscaled_file(archive, service):
+    _, first, _ = query(service, 'grid', year=YEAR)
+    _, _, cached = query(service, 'grid', year=YEAR)
+    assert cached
+
+    rewrite(archive / 'nc' / 'GPvMSM_DownScaled' / f'{YEAR}_max.nc', 'r1y', 3)
+
+    _, updated, cached = query(service, 'grid', year=YEAR)
+
+    assert not cached
+    assert updated['max_value'] == pytest.approx(first['max_value'] * 3)
+
+def test_lru_cache_stays_within_its_budget():
+    cache = LRUCache(max_bytes=3000)
+
+    for index in range(5):
+        cache.put(('array', index), 'v1', np.zeros(100))
+
+    stats = cache.stats()
+
+    assert stats['bytes'] <= 3000
+    assert stats['evictions'] > 0
+    assert cache.get(('array', 4), 'v1') is not None
+    assert cache.get(('array', 0), 'v1') is None
+    assert cache.get(('array', 4), 'v2') is None
@@ -0,0 +1,65 @@
+import numpy as np
+import netCDF4 as nc
+import pytest
+
+from storage import STORAGE_PROFILES, create_data_variable, storage_values, time_dimension_size
+
+def write_cube(path, profile, data, pack_scale=0.1):
+    with nc.Dataset(path, 'w', format='NETCDF4') as dataset:
+        dataset.createDimension('time', time_dimension_size(profile, len(data)))
+        dataset.createDimension('lat', data.shape[1])
+        dataset.createDimension('lon', data.shape[2])
+
+        variable = create_data_variable(dataset, 'r1d', 'f4', ('time', 'lat', 'lon',), profile, pack_scale=pack_scale)
+        stored = storage_values(variable, data)
+        variable[:, :, :] = stored
+
+        return stored, variable.chunking()
+
+def read_cube(path):
+    with nc.Dataset(path) as dataset:
+        return np.ma.filled(dataset.variables['r1d'][:].astype(np.float32), np.nan)
+
+@pytest.fixture
+def cube():
+    rng = np.random.default_rng(11)
+    data = rng.gamma(0.8, 40.0, (40, 9, 11)).astype(np.float32)
+    data[3, 2, 4] = np.nan
+
+    return data
+
+@pytest.mark.parametrize('profile', sorted(STORAGE_PROFILES))
+def test_profiles_read_back_what_storage_values_returns(tmp_path, cube, profile):
+    path = str(tmp_path / f'{profile}.nc')
+    stored, chunking = write_cube(path, profile, cube)
+    values = read_cube(path)
+
+    np.testing.assert_array_equal(values, np.ma.filled(np.ma.asarray(stored, dtype=np.float32), np.nan))
+
+    if STORAGE_PROFILES[profile]['packing']:
+        np.testing.assert_allclose(values, cube, atol=0.05 + 1e-4)
+
+    else:
+        np.testing.assert_array_equal(values, cube)
+
+    # legacy keeps an unlimited time dimension and whatever chunks netCDF picks for it.
+
+    expected_chunking = {'map': [1, 9, 11], 'series': [32, 9, 11], 'packed': [1, 9, 11]}
+    assert profile == 'legacy' or chunking == expected_chunking[profile]
+
+def test_invalid_profile():
+    with pytest.raises(ValueError):
+        time_dimension_size('zip', 10)
+
+def test_packed_values_saturate_instead_of_wrapping(tmp_path, caplog):
+    data = np.array([[[5000.0, -5000.0, 3276.7], [-3276.7, np.nan, 12.3]]], dtype=np.float32)
+
+    with caplog.at_level('WARNING'):
+        stored, _ = write_cube(str(tmp_path / 'packed.nc'), 'packed', data)
+
+    values = read_cube(str(tmp_path / 'packed.nc'))
+    expected = np.array([[[3276.7, -3276.7, 3276.7], [-3276.7, np.nan, 12.3]]], dtype=np.float32)
+
+    np.testing.assert_allclose(values, expected, rtol=1e-6)
+    np.testing.assert_array_equal(values, np.ma.filled(np.ma.asarray(stored, dtype=np.float32), np.nan))
+    assert '2 values of r1d clipped' in caplog.text